@@ -0,0 +1,193 @@
+from __future__ import annotations
+from typing import FrozenSet, Optional, Sequence, Tuple
+import asyncio
+import hashlib
+import json
+import math
+import time
+import structlog
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+from .config import settings
+from .metrics import counter, gauge
+from .services.cache import TTLCache
+
+log = structlog.get_logger(__name__)
+
+# Admission control for chat endpoints:
+# 1. per-client token bucket (RATE_LIMIT_PER_5MIN sustained, RATE_LIMIT_BURST at once) -> 429
+# 2. at most CHAT_MAX_CONCURRENT pipelines running per worker; up to CHAT_QUEUE_SIZE more wait
+#    up to CHAT_QUEUE_TIMEOUT_S for a slot -> 503 when the queue is full or the wait times out
+# Both answer immediately with Retry-After, before any DB connection or LLM call is taken.
+# A batch request (/api/chat/batch) runs CHAT_BATCH_CONCURRENCY pipelines at once, so it costs that many
+# tokens and holds that many slots.
+
+ADMISSION_RUNNING = gauge("chat_admission_running", "Chat pipelines currently running.")
+ADMISSION_QUEUED = gauge("chat_admission_queued", "Chat requests waiting for a pipeline slot.")
+ADMISSION_REJECTED = counter(
+    "chat_admission_rejected_total", "Chat requests turned away (rate_limited, queue_full, queue_timeout).", ["reason"],
+)
+
+
+class TokenBucket:
+    """Per-key token buckets; idle keys expire (a fresh bucket is full anyway)."""
+
+    def __init__(self, rate_per_s: float, burst: int, maxsize: int = 100_000) -> None:
+        self.rate = rate_per_s
+        self.burst = max(1, burst)
+        idle_s = self.burst / rate_per_s if rate_per_s > 0 else 3600.0
+        self._buckets: TTLCache[Tuple[float, float]] = TTLCache(idle_s, maxsize)
+
+    def take(self, key: str, cost: int = 1) -> float:
+        """Consume `cost` tokens; returns 0 when allowed, else seconds until enough tokens are available."""
+        need = float(min(max(1, cost), self.burst))
+        now = time.monotonic()
+        tokens, last = self._buckets.get(key) or (float(self.burst), now)
+        tokens = min(float(self.burst), tokens + (now - last) * self.rate)
+        if tokens >= need:
+            self._buckets.set(key, (tokens - need, now))
+            return 0.0
+        self._buckets.set(key, (tokens, now))
+        return (need - tokens) / self.rate if self.rate > 0 else 60.0
+
+
+def _digest(credential: str) -> str:
+    # Never keep raw credentials in memory longer than needed
+    return hashlib.sha256(credential.encode()).hexdigest()
+
+
+def known_keys(raw: Optional[str] = None) -> FrozenSet[str]:
+    raw = settings.rate_limit_api_keys if raw is None else raw
+    return frozenset(_digest(k.strip()) for k in raw.split(",") if k.strip())
+
+
+def client_key(scope: Scope, keys: FrozenSet[str] = frozenset()) -> str:
+    """Bucket key: a configured API key when the request carries one, else the client IP.
+
+    Unknown credentials are ignored: a client could otherwise mint a fresh bucket per request.
+    """
+    headers = Headers(scope=scope)
+    api_key = headers.get("x-api-key") or ""
+    auth = headers.get("authorization") or ""
+    credential = api_key or (auth[7:] if auth.lower().startswith("bearer ") else "")
+    if credential and keys:
+        digest = _digest(credential)
+        if digest in keys:
+            return "key:" + digest[:16]
+    if settings.trust_forwarded_for and headers.get("x-forwarded-for"):
+        return "ip:" + headers["x-forwarded-for"].split(",")[0].strip()
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+
+class AdmissionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        paths: Sequence[str] = ("/api/chat",),
+        batch_paths: Sequence[str] = ("/api/chat/batch",),
+        batch_cost: Optional[int] = None,
+        api_keys: Optional[str] = None,
+        rate_per_5min: Optional[int] = None,
+        burst: Optional[int] = None,
+        max_concurrent: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        queue_timeout_s: Optional[float] = None,
+    ) -> None:
+        self.app = app
+        self.paths = tuple(paths)
+        self.batch_paths = tuple(batch_paths)
+        self.batch_cost = max(1, settings.chat_batch_concurrency if batch_cost is None else batch_cost)
+        self.keys = known_keys(api_keys)
+        rate = settings.rate_limit_per_5min if rate_per_5min is None else rate_per_5min
+        self.bucket = TokenBucket(rate / 300.0, settings.rate_limit_burst if burst is None else burst) if rate > 0 else None
+        self.max_concurrent = settings.chat_max_concurrent if max_concurrent is None else max_concurrent
+        self.queue_size = settings.chat_queue_size if queue_size is None else queue_size
+        self.queue_timeout_s = settings.chat_queue_timeout_s if queue_timeout_s is None else queue_timeout_s
+        # Weighted slots: a batch holds several at once, so a plain Semaphore won't do
+        self._slots = asyncio.Condition() if self.max_concurrent > 0 else None
+        self.in_use = 0
+        self.running = 0
+        self.queued = 0
+
+    async def _reject(self, send: Send, status: int, reason: str, retry_after: float, detail: str) -> None:
+        ADMISSION_REJECTED.inc(reason=reason)
+        log.info("chat_admission_rejected", reason=reason, retry_after=retry_after, running=self.running, queued=self.queued)
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    def _publish(self) -> None:
+        ADMISSION_RUNNING.set(self.running)
+        ADMISSION_QUEUED.set(self.queued)
+
+    def _cost(self, scope: Scope) -> int:
+        return self.batch_cost if scope["path"].startswith(self.batch_paths) else 1
+
+    def _free(self, weight: int) -> bool:
+        return self.in_use + weight <= self.max_concurrent
+
+    async def _acquire(self, weight: int) -> None:
+        assert self._slots is not None
+        async with self._slots:
+            await self._slots.wait_for(lambda: self._free(weight))
+            self.in_use += weight
+
+    async def _wake(self) -> None:
+        assert self._slots is not None
+        async with self._slots:
+            self._slots.notify_all()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        cost = self._cost(scope)
+        if self.bucket is not None:
+            wait_s = self.bucket.take(client_key(scope, self.keys), cost)
+            if wait_s > 0:
+                await self._reject(send, 429, "rate_limited", wait_s, "Too many requests")
+                return
+
+        if self._slots is None:
+            await self.app(scope, receive, send)
+            return
+
+        weight = min(cost, self.max_concurrent)
+        if not self._free(weight):
+            if self.queued >= self.queue_size:
+                await self._reject(send, 503, "queue_full", self.queue_timeout_s, "Server busy, try again shortly")
+                return
+            self.queued += 1
+            self._publish()
+            try:
+                await asyncio.wait_for(self._acquire(weight), timeout=self.queue_timeout_s)
+            except asyncio.TimeoutError:
+                await self._reject(send, 503, "queue_timeout", self.queue_timeout_s, "Server busy, try again shortly")
+                return
+            finally:
+                self.queued -= 1
+                self._publish()
+        else:
+            await self._acquire(weight)
+
+        self.running += 1
+        self._publish()
+        try:
+            # The slots are held until the streamed response is complete
+            await self.app(scope, receive, send)
+        finally:
+            self.running -= 1
+            self.in_use -= weight
+            self._publish()
+            # Shielded: waiters must be woken even when this request was cancelled
+            await asyncio.shield(self._wake())
@@ -4,14 +4,105 @@ from pydantic import Field
 class Settings(BaseSettings):
     openai_api_key: str | None = Field(default=None, alias="OPENAI_API_KEY")
     database_url: str = Field(default="postgresql+asyncpg://postgres:postgres@db:5432/app", alias="DATABASE_URL")
+    db_pool_size: int = Field(default=5, alias="DB_POOL_SIZE")
+    db_max_overflow: int = Field(default=10, alias="DB_MAX_OVERFLOW")
+    db_pool_timeout_s: float = Field(default=10.0, alias="DB_POOL_TIMEOUT_S")
+    db_pool_recycle_s: int = Field(default=1800, alias="DB_POOL_RECYCLE_S")
+    db_statement_cache_size: int = Field(default=100, alias="DB_STATEMENT_CACHE_SIZE")  # 0 behind pgbouncer
+    db_command_timeout_s: float = Field(default=30.0, alias="DB_COMMAND_TIMEOUT_S")
     web_search_provider: str = Field(default="dummy", alias="WEB_SEARCH_PROVIDER")
     web_search_api_key: str | None = Field(default=None, alias="WEB_SEARCH_API_KEY")
     embed_batch_size: int = Field(default=32, alias="EMBED_BATCH_SIZE")
+    # Ingestion pipeline: pages per embed call + commit (checkpoint), and when an unfinished upload may be resumed
+    ingest_chunk_pages: int = Field(default=32, alias="INGEST_CHUNK_PAGES")
+    ingest_stale_s: float = Field(default=600.0, alias="INGEST_STALE_S")
+    # Near-duplicate pages (MinHash/LSH, services/near_dup.py): at or above this estimated Jaccard similarity a
+    # page reuses an already-embedded page's vector at ingest, and only the best-ranked copy stays in a chat pool
+    near_dup_enabled: bool = Field(default=True, alias="NEAR_DUP_ENABLED")
+    near_dup_threshold: float = Field(default=0.9, alias="NEAR_DUP_THRESHOLD")
+    near_dup_max_candidates: int = Field(default=200, alias="NEAR_DUP_MAX_CANDIDATES")
+    # Recorded per page; pages with another model/version are re-embedded by services/reembed.py
+    embedding_model: str = Field(default="text-embedding-3-large", alias="EMBEDDING_MODEL")
+    embedding_version: int = Field(default=1, alias="EMBEDDING_VERSION")
+    # "openai" (API, or stub vectors without a key) or "local" (offline TF-IDF/SVD, services/local_embeddings.py)
+    embedding_backend: str = Field(default="openai", alias="EMBEDDING_BACKEND")
+    local_embedding_path: str = Field(default="/app/models/local_embedder.joblib", alias="LOCAL_EMBEDDING_PATH")
+    local_embedding_dim: int = Field(default=384, alias="LOCAL_EMBEDDING_DIM")
+    reembed_throttle_s: float = Field(default=0.5, alias="REEMBED_THROTTLE_S")
+    reembed_max_retries: int = Field(default=3, alias="REEMBED_MAX_RETRIES")
+    # Structured replies: "schema" (json_schema response_format), "object" (json_object) or "off"
+    llm_json_mode: str = Field(default="schema", alias="LLM_JSON_MODE")
+    llm_json_repair: bool = Field(default=True, alias="LLM_JSON_REPAIR")  # one small repair call before giving up
+    llm_max_connections: int = Field(default=20, alias="LLM_MAX_CONNECTIONS")  # pooled keep-alive connections to the LLM API
+    # Startup warm-up (app/lifecycle.py): /api/readyz fails until it is done; each attempt is bounded
+    warmup_timeout_s: float = Field(default=30.0, alias="WARMUP_TIMEOUT_S")
     log_level: str = Field(default="INFO", alias="LOG_LEVEL")
-    rate_limit_per_5min: int = Field(default=100, alias="RATE_LIMIT_PER_5MIN")
+    # Large log fields (prompts, raw LLM output, page text): off | truncated | sampled | full
+    log_payloads: str = Field(default="truncated", alias="LOG_PAYLOADS")
+    log_payload_max_chars: int = Field(default=500, alias="LOG_PAYLOAD_MAX_CHARS")
+    log_payload_sample_pct: float = Field(default=5.0, alias="LOG_PAYLOAD_SAMPLE_PCT")
+    log_async: bool = Field(default=True, alias="LOG_ASYNC")  # render + write logs on a background thread
+    # Chat admission control (app/admission.py): per-client token bucket + bounded pipeline concurrency
+    rate_limit_per_5min: int = Field(default=100, alias="RATE_LIMIT_PER_5MIN")  # 0 disables
+    rate_limit_burst: int = Field(default=20, alias="RATE_LIMIT_BURST")
+    trust_forwarded_for: bool = Field(default=False, alias="TRUST_FORWARDED_FOR")  # behind a trusted proxy only
+    # Comma-separated; a request carrying one of these keys is limited per key instead of per IP
+    rate_limit_api_keys: str = Field(default="", alias="RATE_LIMIT_API_KEYS")
+    chat_max_concurrent: int = Field(default=16, alias="CHAT_MAX_CONCURRENT")  # 0 = unlimited
+    chat_queue_size: int = Field(default=32, alias="CHAT_QUEUE_SIZE")
+    chat_queue_timeout_s: float = Field(default=5.0, alias="CHAT_QUEUE_TIMEOUT_S")
+    # POST /api/chat/batch: questions per request, and pipelines run at once within one request
+    chat_batch_max_questions: int = Field(default=200, alias="CHAT_BATCH_MAX_QUESTIONS")
+    chat_batch_concurrency: int = Field(default=4, alias="CHAT_BATCH_CONCURRENCY")
     max_upload_mb: int = Field(default=25, alias="MAX_UPLOAD_MB")
     media_root: str = Field(default="/app/media", alias="MEDIA_ROOT")
+    media_thumb_max_px: int = Field(default=256, alias="MEDIA_THUMB_MAX_PX")
+    media_thumb_quality: int = Field(default=70, alias="MEDIA_THUMB_QUALITY")
     web_search_enabled: bool = Field(default=True, alias="WEB_SEARCH_ENABLED")
+    web_search_url: str = Field(default="http://searxng:8080", alias="WEB_SEARCH_URL")
+    web_search_max_results: int = Field(default=5, alias="WEB_SEARCH_MAX_RESULTS")
+    web_search_cache_ttl_s: float = Field(default=900.0, alias="WEB_SEARCH_CACHE_TTL_S")
+    web_search_cache_size: int = Field(default=512, alias="WEB_SEARCH_CACHE_SIZE")
+    web_search_fetch_top_n: int = Field(default=3, alias="WEB_SEARCH_FETCH_TOP_N")
+    web_search_fetch_timeout_s: float = Field(default=5.0, alias="WEB_SEARCH_FETCH_TIMEOUT_S")
+    web_search_page_chars: int = Field(default=4000, alias="WEB_SEARCH_PAGE_CHARS")
+    web_search_max_page_bytes: int = Field(default=1_000_000, alias="WEB_SEARCH_MAX_PAGE_BYTES")  # rest of the body is not read
+    # Start web search in parallel with the doc loop when the first batch looks weak
+    web_search_speculative: bool = Field(default=True, alias="WEB_SEARCH_SPECULATIVE")
+    web_search_speculative_similarity: float = Field(default=0.35, alias="WEB_SEARCH_SPECULATIVE_SIMILARITY")
+    # Chats without document_ids: pick the top documents by summary vector, then search pages only in them.
+    # Docs are used when the best document is at least this similar to the query, else the web path runs.
+    corpus_search_enabled: bool = Field(default=True, alias="CORPUS_SEARCH_ENABLED")
+    corpus_route_top_docs: int = Field(default=5, alias="CORPUS_ROUTE_TOP_DOCS")
+    corpus_route_min_similarity: float = Field(default=0.25, alias="CORPUS_ROUTE_MIN_SIMILARITY")
+    # How the candidate pool is narrowed before synthesis:
+    #   "batches": up to 5 sequential "does this batch of 3 answer it?" calls (answer comes from the accepting call)
+    #   "select":  one call over short excerpts of the whole pool picks the answering pages (or web), then one synthesis call
+    rag_selection_strategy: str = Field(default="batches", alias="RAG_SELECTION_STRATEGY")
+    rag_select_excerpt_chars: int = Field(default=500, alias="RAG_SELECT_EXCERPT_CHARS")
+    rag_select_max_pages: int = Field(default=4, alias="RAG_SELECT_MAX_PAGES")
+    # Latency budgets (seconds). Each endpoint reads `<endpoint>_budget_s`; 0 disables the deadline.
+    chat_budget_s: float = Field(default=45.0, alias="CHAT_BUDGET_S")
+    chat_synthesis_reserve_s: float = Field(default=8.0, alias="CHAT_SYNTHESIS_RESERVE_S")
+    chat_batch_min_s: float = Field(default=4.0, alias="CHAT_BATCH_MIN_S")
+    llm_min_timeout_s: float = Field(default=1.0, alias="LLM_MIN_TIMEOUT_S")
+    # Server-side chat sessions (history in chat_entries, retrieval state cached per process)
+    chat_session_history_messages: int = Field(default=10, alias="CHAT_SESSION_HISTORY_MESSAGES")
+    chat_session_ttl_s: float = Field(default=1800.0, alias="CHAT_SESSION_TTL_S")
+    chat_session_cache_size: int = Field(default=1000, alias="CHAT_SESSION_CACHE_SIZE")
+    # Admin endpoints (/api/admin/*) are disabled unless a token is set
+    admin_token: str | None = Field(default=None, alias="ADMIN_TOKEN")
+    # Request profiling: sampled when enabled, or on demand with a signed X-Profile header
+    profiling_enabled: bool = Field(default=False, alias="PROFILING_ENABLED")
+    profiling_sample_pct: float = Field(default=1.0, alias="PROFILING_SAMPLE_PCT")
+    profiling_secret: str | None = Field(default=None, alias="PROFILING_SECRET")
+    profiling_dir: str = Field(default="/app/profiles", alias="PROFILING_DIR")
+    profiling_max_files: int = Field(default=50, alias="PROFILING_MAX_FILES")
+    loop_block_threshold_ms: float = Field(default=100.0, alias="LOOP_BLOCK_THRESHOLD_MS")  # 0 disables the monitor
+    # Corpus snapshots (app/services/snapshot.py, /api/admin/snapshots)
+    snapshot_dir: str = Field(default="/app/snapshots", alias="SNAPSHOT_DIR")
+    snapshot_chunk_rows: int = Field(default=10000, alias="SNAPSHOT_CHUNK_ROWS")
+    snapshot_maintenance_work_mem: str = Field(default="1GB", alias="SNAPSHOT_MAINTENANCE_WORK_MEM")
 
     class Config:
         env_file = ".env"
@@ -1,12 +1,38 @@
 from __future__ import annotations
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from .config import settings
 
-engine = create_async_engine(settings.database_url, echo=False, pool_pre_ping=True)
+def _connect_args() -> Dict[str, Any]:
+    if "+asyncpg" not in settings.database_url:
+        return {}
+    return {
+        "prepared_statement_cache_size": settings.db_statement_cache_size,
+        "command_timeout": settings.db_command_timeout_s,
+    }
+
+engine = create_async_engine(
+    settings.database_url,
+    echo=False,
+    pool_pre_ping=True,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout_s,
+    pool_recycle=settings.db_pool_recycle_s,
+    connect_args=_connect_args(),
+)
 
 AsyncSessionLocal = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
 async def get_db() -> AsyncSession:
     async with AsyncSessionLocal() as session:
         yield session
+
+@asynccontextmanager
+async def session_scope() -> AsyncIterator[AsyncSession]:
+    # Short-lived session for a block of SQL. Long pipelines (chat) open one per query burst so the
+    # pooled connection goes back to the pool before any LLM call instead of being pinned for the request.
+    async with AsyncSessionLocal() as session:
+        yield session
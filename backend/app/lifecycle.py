@@ -0,0 +1,137 @@
+from __future__ import annotations
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+import asyncio
+import importlib
+import os
+import time
+import structlog
+from .config import settings
+from .metrics import gauge
+
+log = structlog.get_logger(__name__)
+
+# Startup warm-up, run by the lifespan in the background so /api/healthz answers at once:
+#   modules   heavy imports kept out of app startup (PyMuPDF), loaded off the event loop
+#   embedder  the local embedding model, when EMBEDDING_BACKEND=local
+#   db        DB_POOL_SIZE connections opened and pinged, left in the pool
+#   llm       one pooled keep-alive connection to the LLM API (DNS + TLS)
+# /api/readyz answers 503 until every required step has succeeded; required steps are retried
+# until they do. Optional steps (llm) only report: an unreachable provider must not keep the
+# process out of rotation, the chat pipeline degrades on its own.
+
+APP_READY = gauge("app_ready", "1 once startup warm-up is complete.")
+WARMUP_SECONDS = gauge("app_warmup_seconds", "Seconds from lifespan start until the process was ready.")
+
+_RETRY_S = 2.0
+
+
+class Readiness:
+    def __init__(self) -> None:
+        self.ready = False
+        self.steps: Dict[str, Dict[str, Any]] = {}
+
+    def reset(self) -> None:
+        self.ready = False
+        self.steps = {}
+        APP_READY.set(0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"ready": self.ready, "steps": {k: dict(v) for k, v in self.steps.items()}}
+
+
+readiness = Readiness()
+
+
+def prepare_dirs() -> None:
+    # StaticFiles is mounted without check_dir; the directory only has to exist before the first request
+    os.makedirs(settings.media_root, exist_ok=True)
+
+
+async def _warm_modules() -> None:
+    for name in ("fitz",):
+        await asyncio.to_thread(importlib.import_module, name)
+
+
+async def _warm_embedder() -> None:
+    if settings.embedding_backend.lower() != "local":
+        return
+    from .services.local_embeddings import get_local_embedder
+
+    # Loads the joblib model and runs one transform so the first upload/query doesn't
+    await asyncio.to_thread(lambda: get_local_embedder().embed(["warm-up"]))
+
+
+async def _warm_db() -> None:
+    from sqlalchemy import text
+    from .db import engine
+
+    async def ping() -> None:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    # Held concurrently, so each ping opens its own connection; all of them go back to the pool
+    await asyncio.gather(*(ping() for _ in range(max(1, settings.db_pool_size))))
+
+
+async def _warm_llm() -> None:
+    from .services.llm import llm_client
+
+    await llm_client.warm()
+
+
+def _steps() -> List[Tuple[str, Callable[[], Awaitable[None]], bool]]:
+    # (name, step, required)
+    return [
+        ("modules", _warm_modules, True),
+        ("embedder", _warm_embedder, True),
+        ("db", _warm_db, True),
+        ("llm", _warm_llm, False),
+    ]
+
+
+async def _run_step(name: str, step: Callable[[], Awaitable[None]], required: bool) -> None:
+    attempts = 0
+    while True:
+        attempts += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(step(), timeout=settings.warmup_timeout_s)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            readiness.steps[name] = {"ok": False, "required": required, "attempts": attempts, "error": error}
+            log.warning("warmup_step_failed", step=name, attempt=attempts, required=required, error=error)
+            if not required:
+                return
+            await asyncio.sleep(_RETRY_S)
+            continue
+        ms = round((time.perf_counter() - started) * 1000, 1)
+        readiness.steps[name] = {"ok": True, "required": required, "attempts": attempts, "ms": ms}
+        log.info("warmup_step_done", step=name, ms=ms, attempts=attempts)
+        return
+
+
+async def warm_up() -> None:
+    started = time.perf_counter()
+    readiness.reset()
+    steps = _steps()
+    for name, _, required in steps:
+        readiness.steps[name] = {"ok": False, "required": required, "attempts": 0}
+    await asyncio.gather(*(_run_step(*s) for s in steps))
+    elapsed = time.perf_counter() - started
+    readiness.ready = True
+    APP_READY.set(1)
+    WARMUP_SECONDS.set(elapsed)
+    log.info("app_ready", seconds=round(elapsed, 3))
+
+
+async def shutdown() -> None:
+    from .db import engine
+    from .services.llm import llm_client
+    from .services.web_search import aclose_http_client
+
+    readiness.reset()
+    await llm_client.aclose()
+    await aclose_http_client()
+    await engine.dispose()
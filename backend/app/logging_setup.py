@@ -1,7 +1,94 @@
+import atexit
 import logging
+import queue
+import random
 import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Callable, Optional
+import orjson
 import structlog
 
+_EMBEDDING_FILTERED = "(embedding_filtered)"
+_listener: Optional[QueueListener] = None
+
+# Payload logging tiers for large fields (prompts, raw LLM responses, page text):
+#   off       -> field dropped
+#   truncated -> strings cut to LOG_PAYLOAD_MAX_CHARS characters
+#   sampled   -> full payloads on LOG_PAYLOAD_SAMPLE_PCT % of events, dropped otherwise
+#   full      -> everything (debugging only)
+_payload_mode = "truncated"
+_payload_max_chars = 500
+_payload_sample_pct = 5.0
+
+
+class LazyPayload:
+    """Large log field, rendered according to the payload tier. A callable is only invoked if kept."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any) -> None:
+        self.value = value
+
+    def resolve(self) -> Any:
+        return self.value() if callable(self.value) else self.value
+
+
+def payload(value: Any | Callable[[], Any]) -> LazyPayload:
+    """Mark a log field as payload: `log.info("x", prompt=payload(prompt), rows=payload(lambda: build()))`."""
+    return LazyPayload(value)
+
+
+def _render_payloads(_logger, _method_name, event_dict):
+    sampled: Optional[bool] = None
+    for k, v in list(event_dict.items()):
+        if not isinstance(v, LazyPayload):
+            continue
+        if _payload_mode == "off":
+            del event_dict[k]
+            continue
+        if _payload_mode == "sampled":
+            if sampled is None:  # one draw per event so related fields stay together
+                sampled = random.random() * 100.0 < _payload_sample_pct
+            if not sampled:
+                del event_dict[k]
+                continue
+        value = v.resolve()
+        if _payload_mode == "truncated" and isinstance(value, str) and len(value) > _payload_max_chars:
+            value = f"{value[:_payload_max_chars]}…(+{len(value) - _payload_max_chars} chars)"
+        event_dict[k] = value
+    return event_dict
+
+
+def _redact_value(v):
+    # Returns `v` itself when nothing needs redacting, so the common case allocates nothing
+    if isinstance(v, str):
+        # If it looks like a long bracketed numeric list within a string, redact
+        if len(v) > 200 and v[0] == "[" and v[-1] == "]" and "," in v:
+            return _EMBEDDING_FILTERED
+        return v
+    if isinstance(v, (list, tuple)):
+        # Long numeric vector heuristic
+        if len(v) > 32 and all(isinstance(x, (int, float)) for x in v[:10]):
+            return _EMBEDDING_FILTERED
+        out = None
+        for i, x in enumerate(v):
+            r = _redact_value(x)
+            if r is not x:
+                if out is None:
+                    out = list(v)
+                out[i] = r
+        return v if out is None else out
+    if isinstance(v, dict):
+        out_d = None
+        for k, val in v.items():
+            r = _EMBEDDING_FILTERED if isinstance(k, str) and "embedding" in k.lower() else _redact_value(val)
+            if r is not val:
+                if out_d is None:
+                    out_d = dict(v)
+                out_d[k] = r
+        return v if out_d is None else out_d
+    return v
+
 
 def _redact_embeddings(_logger, _method_name, event_dict):
     """
@@ -9,47 +96,96 @@ def _redact_embeddings(_logger, _method_name, event_dict):
     Rules:
     - If a key name contains 'embedding', value becomes '(embedding_filtered)'.
     - If a value looks like a long list of numbers, replace with placeholder.
-    Applies recursively for nested dicts.
+    Applies recursively for nested dicts/lists; values are only copied when something is replaced.
     """
-
-    def redact_value(v):
-        # Long numeric vector heuristic
-        if isinstance(v, (list, tuple)):
-            if len(v) > 32 and all(isinstance(x, (int, float)) for x in v[: min(10, len(v))]):
-                return "(embedding_filtered)"
-            # Recurse into small lists to keep structure
-            return [redact_value(x) for x in v]
-        if isinstance(v, str):
-            # If it looks like a long bracketed numeric list within a string, redact
-            if v.startswith("[") and v.endswith("]") and "," in v and len(v) > 200:
-                return "(embedding_filtered)"
-            return v
-        if isinstance(v, dict):
-            return {k: redact_value(val) for k, val in v.items()}
-        return v
-
-    out = {}
     for k, v in event_dict.items():
         if isinstance(k, str) and "embedding" in k.lower():
-            out[k] = "(embedding_filtered)"
-        else:
-            out[k] = redact_value(v)
-    return out
+            event_dict[k] = _EMBEDDING_FILTERED
+        elif isinstance(v, (str, list, tuple, dict)):
+            r = _redact_value(v)
+            if r is not v:
+                event_dict[k] = r
+    return event_dict
+
+
+class _DeferredQueueHandler(QueueHandler):
+    # Payloads are already resolved and redacted (structlog chain, calling thread); JSON rendering and
+    # the stdout write happen on the listener thread, so the record is passed on as is
+    def prepare(self, record):
+        return record
+
+
+def _orjson_dumps(obj, **_kw) -> str:
+    return orjson.dumps(obj, default=str).decode()
 
 
 def setup_logging(level: str = "INFO") -> None:
-    logging.basicConfig(stream=sys.stdout, level=getattr(logging, level.upper(), logging.INFO))
+    global _listener, _payload_mode, _payload_max_chars, _payload_sample_pct
+    from .config import settings
+
+    _payload_mode = settings.log_payloads.lower()
+    _payload_max_chars = settings.log_payload_max_chars
+    _payload_sample_pct = settings.log_payload_sample_pct
+    log_level = getattr(logging, level.upper(), logging.INFO)
+
+    # Only serialization and I/O run in the handler (listener thread when queued). Payload callables and
+    # redaction run in the structlog chain below, on the calling thread: they read live request objects.
+    formatter = structlog.stdlib.ProcessorFormatter(
+        foreign_pre_chain=[
+            structlog.stdlib.add_log_level,
+            structlog.processors.TimeStamper(fmt="iso"),
+            _redact_embeddings,
+        ],
+        processors=[
+            structlog.stdlib.ProcessorFormatter.remove_processors_meta,
+            structlog.processors.JSONRenderer(serializer=_orjson_dumps),
+        ],
+    )
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+
+    root = logging.getLogger()
+    _stop_listener()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    if settings.log_async:
+        q: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        root.addHandler(_DeferredQueueHandler(q))
+        _listener = QueueListener(q, stream_handler, respect_handler_level=False)
+        _listener.start()
+    else:
+        root.addHandler(stream_handler)
+    root.setLevel(log_level)
 
     structlog.configure(
         processors=[
-            _redact_embeddings,
             structlog.processors.add_log_level,
             structlog.processors.TimeStamper(fmt="iso"),
             structlog.processors.StackInfoRenderer(),
             structlog.processors.format_exc_info,
-            structlog.processors.JSONRenderer(),
+            _render_payloads,
+            _redact_embeddings,
+            structlog.stdlib.ProcessorFormatter.wrap_for_formatter,
         ],
         logger_factory=structlog.stdlib.LoggerFactory(),
-        wrapper_class=structlog.make_filtering_bound_logger(logging.getLevelName(level.upper())),
+        wrapper_class=structlog.make_filtering_bound_logger(log_level),
         cache_logger_on_first_use=True,
     )
+
+
+def _stop_listener() -> None:
+    # `_listener` is only set while its thread runs, so it is stopped exactly once
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+    _listener = None
+
+
+def flush_logging() -> None:
+    """Drain the background log queue (tests, shutdown)."""
+    if _listener is not None:
+        _listener.stop()
+        _listener.start()
+
+
+atexit.register(_stop_listener)
@@ -1,14 +1,37 @@
 from __future__ import annotations
+from contextlib import asynccontextmanager, suppress
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse, PlainTextResponse
+from .admission import AdmissionMiddleware
 from .config import settings
+from .lifecycle import prepare_dirs, readiness, shutdown, warm_up
+from .media import ImmutableStaticFiles
 from .logging_setup import setup_logging
-from .routes import documents, chat
+from .metrics import REGISTRY, ServerTimingMiddleware
+from .profiling import ProfilingMiddleware, loop_monitor
+from .routes import admin, documents, chat
 
 setup_logging(settings.log_level)
-app = FastAPI(title="RAG PDF/Web QA MVP")
 
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    prepare_dirs()
+    loop_monitor.start()
+    # Serve immediately (healthz); readyz passes once the pools and models are warm
+    warmup = asyncio.create_task(warm_up())
+    yield
+    warmup.cancel()
+    with suppress(asyncio.CancelledError):
+        await warmup
+    await shutdown()
+    await loop_monitor.stop()
+
+app = FastAPI(title="RAG PDF/Web QA MVP", lifespan=lifespan)
+
+# Added first so CORS wraps it: browsers can read the 429/503 it returns
+app.add_middleware(AdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -16,13 +39,27 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(ServerTimingMiddleware)
+app.add_middleware(ProfilingMiddleware)
 
-# Serve media files in dev
-app.mount("/media", StaticFiles(directory=settings.media_root), name="media")
+# Serve media files (content-addressed, so cacheable forever; supports ETag/Range)
+# The directory is created by the lifespan, so importing the app has no filesystem side effects
+app.mount("/media", ImmutableStaticFiles(directory=settings.media_root, check_dir=False), name="media")
 
 @app.get("/api/healthz")
 async def healthz():
     return {"ok": True}
 
+@app.get("/api/readyz")
+async def readyz():
+    # 503 until startup warm-up is done (DB pool open, models loaded); use this for load balancer readiness
+    return JSONResponse(readiness.snapshot(), status_code=200 if readiness.ready else 503)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 app.include_router(documents.router)
 app.include_router(chat.router)
+app.include_router(admin.router)
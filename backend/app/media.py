@@ -0,0 +1,75 @@
+from __future__ import annotations
+import os
+import re
+from typing import AsyncIterator, Optional, Tuple
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response, StreamingResponse
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+# Media files are content-addressed (see services/ingestion.py): a name never points at
+# different bytes, so responses can be cached forever and the file stem is a strong ETag.
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_CHUNK = 64 * 1024
+
+
+def _parse_range(value: str, size: int) -> Optional[Tuple[int, int]]:
+    # Single byte range only ("bytes=start-end", "bytes=start-", "bytes=-suffix"); None = unsatisfiable/ignored
+    m = _RANGE_RE.match(value.strip())
+    if not m or (not m.group(1) and not m.group(2)):
+        return None
+    if m.group(1):
+        start = int(m.group(1))
+        end = int(m.group(2)) if m.group(2) else size - 1
+    else:
+        start = max(0, size - int(m.group(2)))
+        end = size - 1
+    end = min(end, size - 1)
+    if start > end:
+        return None
+    return start, end
+
+
+async def _read_range(path: str, start: int, end: int) -> AsyncIterator[bytes]:
+    async with await anyio.open_file(path, "rb") as f:
+        await f.seek(start)
+        left = end - start + 1
+        while left > 0:
+            chunk = await f.read(min(_CHUNK, left))
+            if not chunk:
+                break
+            left -= len(chunk)
+            yield chunk
+
+
+class ImmutableStaticFiles(StaticFiles):
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        etag = '"' + os.path.splitext(os.path.basename(full_path))[0] + '"'
+        headers = {"etag": etag, "cache-control": IMMUTABLE_CACHE_CONTROL, "accept-ranges": "bytes"}
+
+        if status_code == 200:
+            if_none_match = request_headers.get("if-none-match", "")
+            if etag in [t.strip() for t in if_none_match.split(",")] or if_none_match.strip() == "*":
+                return Response(status_code=304, headers=headers)
+
+            range_header = request_headers.get("range")
+            if_range = request_headers.get("if-range")
+            if range_header and (not if_range or if_range == etag):
+                size = stat_result.st_size
+                rng = _parse_range(range_header, size)
+                if rng is None:
+                    return Response(status_code=416, headers={**headers, "content-range": f"bytes */{size}"})
+                start, end = rng
+                media_type = FileResponse(full_path, stat_result=stat_result).media_type
+                return StreamingResponse(
+                    _read_range(str(full_path), start, end),
+                    status_code=206,
+                    media_type=media_type,
+                    headers={**headers, "content-range": f"bytes {start}-{end}/{size}", "content-length": str(end - start + 1)},
+                )
+
+        return FileResponse(full_path, status_code=status_code, stat_result=stat_result, headers=headers)
@@ -0,0 +1,239 @@
+from __future__ import annotations
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import bisect
+import threading
+import time
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Minimal in-process Prometheus metrics (text exposition format 0.0.4), served at /metrics.
+# Values are per worker process; scrape each worker or aggregate upstream.
+
+LabelValues = Tuple[str, ...]
+
+_DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()  # ingestion/log threads may record too
+
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: object) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_value(v)}" for k, v in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: object) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1.0, **labels: object) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = _DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._sums[key] += value
+
+    def count(self, **labels: object) -> int:
+        return sum(self._counts.get(self._key(labels), []))
+
+    def _samples(self) -> List[str]:
+        out: List[str] = []
+        for key in sorted(self._counts):
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), self._counts[key]):
+                cumulative += c
+                le = 'le="%s"' % _fmt_value(bound)
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, le)} {cumulative}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {_fmt_value(self._sums[key])}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {cumulative}")
+        return out
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        return "\n".join(line for m in self._metrics.values() for line in m.render()) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labelnames))  # type: ignore[return-value]
+
+
+def gauge(name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, labelnames))  # type: ignore[return-value]
+
+
+def histogram(name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = _DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))  # type: ignore[return-value]
+
+
+# --- RAG pipeline metrics -----------------------------------------------------------------------
+
+STAGE_SECONDS = histogram(
+    "rag_stage_seconds",
+    "Latency of chat pipeline stages (rewrite, query_embedding, routing, retrieval, batch, select, final_synthesis, web_search, sse_ttfb).",
+    ["stage"],
+)
+BATCHES_PER_REQUEST = histogram(
+    "rag_batches_per_request", "Structured batch rounds run per chat request.", buckets=(0, 1, 2, 3, 4, 5, 10),
+)
+BATCH_OUTCOMES = counter("rag_batch_outcomes_total", "Structured batch decisions by code (1 answer, 2 next batch, 3 web).", ["code"])
+LLM_TOKENS = counter("llm_tokens_total", "LLM tokens reported by the provider.", ["model", "kind"])
+LLM_REQUEST_SECONDS = histogram("llm_request_seconds", "LLM API call latency.", ["op"])
+STRUCTURED_PARSE = counter(
+    "llm_structured_parse_total", "Structured LLM replies by call and parse result (ok, extracted, fixed, repaired, failed).",
+    ["call", "result"],
+)
+SELECT_OUTCOMES = counter(
+    "rag_select_outcomes_total", "Single-call page selection results (pages, web, none, failed).", ["result"],
+)
+CHAT_DISCONNECTS = counter(
+    "chat_client_disconnects_total", "Chat requests cancelled because the client went away, by the phase cut short (rewrite, pipeline).",
+    ["phase"],
+)
+CHAT_DISCONNECT_BUDGET_SAVED = counter(
+    "chat_disconnect_budget_seconds_total", "Latency budget left on chat pipelines cancelled by a client disconnect (upper bound of work avoided).",
+)
+CACHE_LOOKUPS = counter("rag_cache_lookups_total", "Cache lookups by cache and result (hit/miss).", ["cache", "result"])
+INGEST_PAGES = counter("ingest_pages_total", "Pages ingested.")
+INGEST_SECONDS = histogram("ingest_document_seconds", "Wall time to ingest one document.", buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+INGEST_PAGES_PER_SECOND = gauge("ingest_pages_per_second", "Throughput of the most recent document ingestion.")
+NEAR_DUP_REUSED = counter("ingest_embeddings_reused_total", "Pages that reused a near-duplicate page's vector instead of an embedding call.")
+NEAR_DUP_DROPPED = counter("rag_near_duplicates_dropped_total", "Candidate pages dropped from chat pools as near-duplicates of a better-ranked page.")
+
+
+# --- Per-request timings (Server-Timing header / opt-in envelope block) ---------------------------
+
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+def start_request_timings() -> Dict[str, float]:
+    timings: Dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        # Repeated stages (e.g. several batches) accumulate
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def timings_ms(timings: Dict[str, float]) -> Dict[str, float]:
+    return {k: round(v * 1000.0, 1) for k, v in timings.items()}
+
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{k};dur={v * 1000.0:.1f}" for k, v in timings.items())
+
+
+class ServerTimingMiddleware:
+    """Collects stage timings per request and reports them in a `Server-Timing` response header.
+
+    Headers go out before a streamed body, so SSE responses only see stages finished before the
+    first byte; /api/chat offers the full breakdown in its final envelope instead (`include_timings`).
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = start_request_timings()
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start" and timings:
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing_header(timings).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,7 +1,7 @@
 from __future__ import annotations
 from sqlalchemy.orm import DeclarativeBase, relationship, Mapped, mapped_column
-from sqlalchemy import Text, Integer, DateTime, ForeignKey
-from sqlalchemy.dialects.postgresql import UUID, JSONB
+from sqlalchemy import BigInteger, Boolean, Text, Integer, DateTime, ForeignKey, ForeignKeyConstraint, LargeBinary
+from sqlalchemy.dialects.postgresql import ARRAY, UUID, JSONB
 from datetime import datetime
 import uuid
 
@@ -13,29 +13,61 @@ class Document(Base):
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     title: Mapped[str] = mapped_column(Text, nullable=False)
     page_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # Ingestion progress: 'ingesting' until every page is committed; pages_ingested is the resume checkpoint
+    status: Mapped[str] = mapped_column(Text, nullable=False, default="ready")
+    pages_ingested: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    content_sha256: Mapped[str | None] = mapped_column(Text, nullable=True)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # Filterable in chat (schemas.RetrievalFilters); GIN-indexed
+    tags: Mapped[list[str]] = mapped_column(ARRAY(Text), nullable=False, default=list)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
 
     pages: Mapped[list[DocumentPage]] = relationship("DocumentPage", back_populates="document", cascade="all, delete-orphan")
 
 class DocumentPage(Base):
     __tablename__ = "document_pages"
+    # Hash-partitioned by document_id (migration 0008), so the key includes it
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    document_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
+    document_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("documents.id", ondelete="CASCADE"), primary_key=True)
     page_number: Mapped[int] = mapped_column(Integer, nullable=False)
     content: Mapped[str | None] = mapped_column(Text, nullable=True)
     # Embedding stored via native pgvector in migrations; ORM can treat as None/opaque
+    embedding_model: Mapped[str | None] = mapped_column(Text, nullable=True)
+    embedding_version: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    embedded_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+    # MinHash signature and LSH band hashes for near-duplicate detection (services/near_dup.py)
+    minhash: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True)
+    minhash_bands: Mapped[list[int] | None] = mapped_column(ARRAY(BigInteger), nullable=True)
+    has_images: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
 
     document: Mapped[Document] = relationship("Document", back_populates="pages")
     images: Mapped[list[DocumentPageImage]] = relationship("DocumentPageImage", back_populates="page", cascade="all, delete-orphan")
 
+class DocumentSummary(Base):
+    __tablename__ = "document_summaries"
+    # Routing vector (sum of page embeddings, pgvector column managed in migrations); see services/summaries.py
+    document_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("documents.id", ondelete="CASCADE"), primary_key=True)
+    embedding_model: Mapped[str] = mapped_column(Text, nullable=False)
+    embedding_version: Mapped[int] = mapped_column(Integer, nullable=False)
+    pages: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+
 class DocumentPageImage(Base):
     __tablename__ = "document_page_images"
+    __table_args__ = (
+        ForeignKeyConstraint(["document_page_id", "document_id"], ["document_pages.id", "document_pages.document_id"], ondelete="CASCADE"),
+    )
+    # Partitioned with its page by document_id
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    document_page_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("document_pages.id", ondelete="CASCADE"), nullable=False)
+    document_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True)
+    document_page_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
     position: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
     file_url: Mapped[str] = mapped_column(Text, nullable=False)
     dimensions: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
+    thumbnail_url: Mapped[str | None] = mapped_column(Text, nullable=True)
+    thumbnail_dimensions: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
 
     page: Mapped[DocumentPage] = relationship("DocumentPage", back_populates="images")
@@ -43,6 +75,21 @@ class DocumentPageImage(Base):
 class ChatEntry(Base):
     __tablename__ = "chat_entries"
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    session_id: Mapped[uuid.UUID | None] = mapped_column(UUID(as_uuid=True), nullable=True)
     content: Mapped[str] = mapped_column(Text, nullable=False)
     role: Mapped[str] = mapped_column(Text, nullable=False)
+    # Assistant turns: rewritten query and source pages used
+    meta: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+
+class EmbeddingBackfillJob(Base):
+    __tablename__ = "embedding_backfill_jobs"
+    id: Mapped[str] = mapped_column(Text, primary_key=True)  # "<model>:<version>"
+    embedding_model: Mapped[str] = mapped_column(Text, nullable=False)
+    embedding_version: Mapped[int] = mapped_column(Integer, nullable=False)
+    last_page_id: Mapped[uuid.UUID | None] = mapped_column(UUID(as_uuid=True), nullable=True)
+    processed: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    failed: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    status: Mapped[str] = mapped_column(Text, nullable=False, default="running")
+    started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
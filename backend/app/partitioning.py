@@ -0,0 +1,64 @@
+from __future__ import annotations
+from typing import List
+
+# Hash partitioning of document_pages / document_page_images by document_id (migration 0008).
+# Every page query is scoped to documents, so a filter on document_id touches only the partitions
+# holding those documents; vacuum, index builds and dumps work partition by partition.
+#
+# Pruning needs the document ids as separate values: `document_id IN (:d1, :d2, ...)` prunes (at plan
+# time, or at executor startup for generic plans), while `= ANY(:doc_ids)` with one array parameter
+# scans every partition. Queries use expanding bind parameters for that (see ranking.ann_search_pages).
+#
+# Plain module (no settings import) so Alembic migrations and benchmarks can use it.
+
+DEFAULT_PARTITIONS = 16
+
+
+def partition_name(table: str, remainder: int) -> str:
+    return f"{table}_p{remainder:02d}"
+
+
+def create_partitioned_table(table: str, columns_sql: str, key: str, modulus: int) -> List[str]:
+    """DDL for a hash-partitioned table and its `modulus` partitions."""
+    stmts = [f"CREATE TABLE {table} ({columns_sql}) PARTITION BY HASH ({key})"]
+    stmts += [
+        f"CREATE TABLE {partition_name(table, r)} PARTITION OF {table} FOR VALUES WITH (MODULUS {modulus}, REMAINDER {r})"
+        for r in range(modulus)
+    ]
+    return stmts
+
+
+def concurrent_index(table: str, name: str, columns: str, modulus: int, unique: bool = False, using: str = "",
+                     where: str = "") -> List[str]:
+    """Build an index on every partition with CONCURRENTLY, then attach them to an index on the parent.
+
+    CREATE INDEX CONCURRENTLY is not allowed on a partitioned table itself; the parent index is created
+    ON ONLY (invalid, no build) and becomes valid once every partition's index is attached.
+    A partial index (`where`) needs the same predicate on the parent and every partition.
+    Must run outside a transaction (Alembic: op.get_context().autocommit_block()).
+    """
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    method = f" USING {using}" if using else ""
+    predicate = f" WHERE {where}" if where else ""
+    stmts = [
+        f"CREATE {kind} CONCURRENTLY IF NOT EXISTS {partition_name(name, r)} ON {partition_name(table, r)}{method} ({columns}){predicate}"
+        for r in range(modulus)
+    ]
+    stmts.append(f"CREATE {kind} IF NOT EXISTS {name} ON ONLY {table}{method} ({columns}){predicate}")
+    stmts += [f"ALTER INDEX {name} ATTACH PARTITION {partition_name(name, r)}" for r in range(modulus)]
+    return stmts
+
+
+def concurrent_constraint(table: str, name: str, kind: str, columns: str, modulus: int) -> List[str]:
+    """PRIMARY KEY / UNIQUE on a partitioned table without building its indexes under the table lock.
+
+    The per-partition unique indexes are built CONCURRENTLY first; ADD CONSTRAINT then finds and
+    attaches them instead of building new ones.
+    """
+    stmts = [
+        f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {partition_name(name, r)} ON {partition_name(table, r)} ({columns})"
+        for r in range(modulus)
+    ]
+    stmts.append(f"ALTER TABLE {table} ADD CONSTRAINT {name} {kind} ({columns})")
+    return stmts
+
@@ -0,0 +1,177 @@
+from __future__ import annotations
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+import asyncio
+import cProfile
+import hashlib
+import hmac
+import os
+import pstats
+import random
+import re
+import time
+import structlog
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from .config import settings
+from .metrics import counter, histogram
+
+log = structlog.get_logger(__name__)
+
+# Opt-in request profiling.
+# - PROFILING_ENABLED=true profiles PROFILING_SAMPLE_PCT % of /api requests.
+# - Any single request can ask for a profile with `X-Profile: <unix_ts>:<hex hmac_sha256(PROFILING_SECRET, unix_ts)>`
+#   (valid for 5 minutes, see `sign_profile_request`).
+# Profiles are pstats dumps in PROFILING_DIR, kept as a ring buffer of PROFILING_MAX_FILES files and
+# downloadable from /api/admin/profiles. cProfile sees the whole thread, so a profile of one request
+# also contains whatever other requests ran on the loop meanwhile; only one profile runs at a time.
+
+PROFILE_HEADER = "x-profile"
+_SIGNATURE_MAX_AGE_S = 300
+_SAFE_NAME_RE = re.compile(r"[^A-Za-z0-9_.-]+")
+
+PROFILES_WRITTEN = counter("profiles_written_total", "Request profiles written to disk.")
+LOOP_LAG_SECONDS = histogram(
+    "event_loop_lag_seconds", "Event loop scheduling delay seen by the lag monitor.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+LOOP_BLOCKED = counter("event_loop_blocked_total", "Event loop stalls over LOOP_BLOCK_THRESHOLD_MS.")
+
+_active = False  # cProfile hooks the whole thread: never nest two profiles
+
+
+def sign_profile_request(secret: str, ts: Optional[int] = None) -> str:
+    ts = int(time.time()) if ts is None else ts
+    sig = hmac.new(secret.encode(), str(ts).encode(), hashlib.sha256).hexdigest()
+    return f"{ts}:{sig}"
+
+
+def _valid_signature(value: str) -> bool:
+    if not settings.profiling_secret or ":" not in value:
+        return False
+    ts, _, sig = value.partition(":")
+    try:
+        if abs(time.time() - int(ts)) > _SIGNATURE_MAX_AGE_S:
+            return False
+    except ValueError:
+        return False
+    expected = sign_profile_request(settings.profiling_secret, int(ts)).partition(":")[2]
+    return hmac.compare_digest(expected, sig)
+
+
+def _should_profile(scope: Scope) -> bool:
+    header = Headers(scope=scope).get(PROFILE_HEADER)
+    if header is not None:
+        return _valid_signature(header)
+    if not settings.profiling_enabled or not scope["path"].startswith("/api/"):
+        return False
+    return random.random() * 100.0 < settings.profiling_sample_pct
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    try:
+        entries = [e for e in os.scandir(settings.profiling_dir) if e.is_file() and e.name.endswith(".prof")]
+    except FileNotFoundError:
+        return []
+    entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+    return [{"name": e.name, "size": e.stat().st_size, "created_at": e.stat().st_mtime} for e in entries]
+
+
+def profile_path(name: str) -> Optional[str]:
+    # Only names produced by list_profiles() are served (no path traversal)
+    if name not in {p["name"] for p in list_profiles()}:
+        return None
+    return os.path.join(settings.profiling_dir, name)
+
+
+def _write_profile(profiler: cProfile.Profile, name: str) -> None:
+    os.makedirs(settings.profiling_dir, exist_ok=True)
+    pstats.Stats(profiler).dump_stats(os.path.join(settings.profiling_dir, name))
+    # Ring buffer: drop the oldest files beyond the limit
+    for old in list_profiles()[settings.profiling_max_files:]:
+        try:
+            os.remove(os.path.join(settings.profiling_dir, old["name"]))
+        except OSError:
+            pass
+
+
+class ProfilingMiddleware:
+    """Profiles selected requests end to end (including the streamed body) and stores a pstats file.
+
+    The response carries `X-Profile-Id` with the file name to download from /api/admin/profiles/{name}.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        global _active
+        if scope["type"] != "http" or _active or not _should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        started = time.time()
+        slug = _SAFE_NAME_RE.sub("_", scope["path"].strip("/"))[:60] or "root"
+        name = f"{int(started * 1000)}_{scope['method']}_{slug}.prof"
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", name.encode())]}
+            await send(message)
+
+        profiler = cProfile.Profile()
+        _active = True
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.disable()
+            _active = False
+            try:
+                await asyncio.to_thread(_write_profile, profiler, name)
+                PROFILES_WRITTEN.inc()
+                log.info("request_profiled", profile=name, path=scope["path"], elapsed_s=round(time.time() - started, 3))
+            except Exception as e:
+                log.warning("profile_write_failed", profile=name, error=str(e))
+
+
+class LoopLagMonitor:
+    """Wakes up every `interval_s` and measures how late it was scheduled.
+
+    A late wake-up means something held the event loop (sync PyMuPDF work, big regexes, JSON parsing…).
+    Stalls over `threshold_ms` are logged, counted and kept for /api/admin/loop-stalls.
+    """
+
+    def __init__(self, threshold_ms: float, interval_s: float = 0.05, keep: int = 200) -> None:
+        self.threshold_s = threshold_ms / 1000.0
+        self.interval_s = interval_s
+        self.stalls: Deque[Dict[str, float]] = deque(maxlen=keep)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None and self.threshold_s > 0:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval_s
+            await asyncio.sleep(self.interval_s)
+            lag = max(0.0, loop.time() - expected)
+            LOOP_LAG_SECONDS.observe(lag)
+            if lag >= self.threshold_s:
+                LOOP_BLOCKED.inc()
+                self.stalls.append({"at": time.time(), "blocked_ms": round(lag * 1000.0, 1)})
+                log.warning("event_loop_blocked", blocked_ms=round(lag * 1000.0, 1))
+
+
+loop_monitor = LoopLagMonitor(settings.loop_block_threshold_ms)
@@ -0,0 +1,66 @@
+from __future__ import annotations
+from datetime import datetime, timezone
+from typing import Optional
+import hmac
+import os
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import FileResponse
+from ..config import settings
+from ..profiling import list_profiles, loop_monitor, profile_path
+from ..services import snapshot
+
+async def require_admin(x_admin_token: Optional[str] = Header(default=None)) -> None:
+    # No ADMIN_TOKEN configured -> admin surface doesn't exist
+    if not settings.admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, settings.admin_token):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+router = APIRouter(prefix="/api/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+@router.get("/profiles")
+async def get_profiles():
+    return {"items": list_profiles()}
+
+@router.get("/profiles/{name}")
+async def download_profile(name: str):
+    path = profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    # Load with `python -m pstats <file>` or snakeviz
+    return FileResponse(path, media_type="application/octet-stream", filename=name)
+
+@router.get("/loop-stalls")
+async def get_loop_stalls():
+    return {"threshold_ms": settings.loop_block_threshold_ms, "items": list(loop_monitor.stalls)}
+
+@router.get("/snapshots")
+async def get_snapshots():
+    return {"items": snapshot.list_snapshots(settings.snapshot_dir), "jobs": list(snapshot.jobs.values())}
+
+@router.post("/snapshots", status_code=202)
+async def create_snapshot(name: Optional[str] = None, dtype: str = "float16"):
+    # Runs in the background; poll GET /api/admin/snapshots for the job
+    if snapshot.running_job():
+        raise HTTPException(status_code=409, detail="A snapshot job is already running")
+    if dtype not in ("float16", "float32"):
+        raise HTTPException(status_code=400, detail="dtype must be float16 or float32")
+    try:
+        name = snapshot.safe_name(name or f"snap_{datetime.now(timezone.utc):%Y%m%d_%H%M%S}")
+    except snapshot.SnapshotError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    path = os.path.join(settings.snapshot_dir, name)
+    if os.path.exists(path):
+        raise HTTPException(status_code=409, detail="Snapshot already exists")
+    return snapshot.start_job("export", name, lambda: snapshot.export_snapshot(path, dtype=dtype))
+
+@router.post("/snapshots/{name}/restore", status_code=202)
+async def restore_snapshot(name: str, replace: bool = False):
+    if snapshot.running_job():
+        raise HTTPException(status_code=409, detail="A snapshot job is already running")
+    try:
+        path = os.path.join(settings.snapshot_dir, snapshot.safe_name(name))
+        snapshot.read_manifest(path)
+    except snapshot.SnapshotError as e:
+        raise HTTPException(status_code=404, detail=str(e)) from e
+    return snapshot.start_job("import", name, lambda: snapshot.import_snapshot(path, replace=replace))
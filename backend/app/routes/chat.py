@@ -1,27 +1,182 @@
 from __future__ import annotations
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import StreamingResponse
-from sqlalchemy.ext.asyncio import AsyncSession
-from ..db import AsyncSessionLocal
-from ..schemas import ChatRequest
+from ..config import settings
+from ..schemas import BatchChatRequest, ChatRequest
+from ..services.llm import llm_client
 from ..services.orchestrator import orchestrate_chat, rewrite_query_with_history
+from ..services.deadline import Deadline
+from ..services.sessions import append_entries, load_history, new_session_id
+from ..metrics import CHAT_DISCONNECT_BUDGET_SAVED, CHAT_DISCONNECTS, record_stage, stage, start_request_timings, timings_ms
+from typing import Any, Awaitable, Dict, List, Optional, TypeVar
+import asyncio
 import json
+import time
+import uuid
+import structlog
 
+log = structlog.get_logger(__name__)
 router = APIRouter(prefix="/api", tags=["chat"])
 
+_T = TypeVar("_T")
+
+async def _wait_for_disconnect(request: Request) -> None:
+    # The body is already read, so the next ASGI message is http.disconnect (client closed the tab, retried...)
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+def _count_disconnect(phase: str, deadline: Deadline) -> None:
+    CHAT_DISCONNECTS.inc(phase=phase)
+    if deadline.budget_s is not None:
+        CHAT_DISCONNECT_BUDGET_SAVED.inc(deadline.remaining())
+    log.info("chat_client_disconnected", phase=phase, elapsed=round(deadline.elapsed(), 3))
+
+async def _unless_disconnected(request: Request, work: Awaitable[_T], phase: str, deadline: Deadline) -> Optional[_T]:
+    """Run `work` as a task and cancel it if the client disconnects first; None when it was cancelled.
+
+    Cancelling the task cancels everything it awaits: in-flight httpx requests are aborted, `session_scope`
+    blocks exit (returning their connection), and the orchestrator cancels its own background tasks.
+    The cancelled task is awaited, so that cleanup is finished before this returns.
+    """
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        # The server noticed the disconnect first and cancelled the response
+        task.cancel()
+        _count_disconnect(phase, deadline)
+        raise
+    finally:
+        watcher.cancel()
+    if task.done():
+        return task.result()
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    _count_disconnect(phase, deadline)
+    return None
+
 @router.post("/chat")
-async def chat(req: ChatRequest):
+async def chat(req: ChatRequest, request: Request):
+    # Sessions: a known session_id resumes server-side history; otherwise a new session is started
+    if req.session_id:
+        try:
+            session_id = str(uuid.UUID(req.session_id))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid session_id") from None
+    else:
+        session_id = new_session_id()
+    received = time.perf_counter()
+
     async def event_stream():
-        # Create a dedicated DB session for the duration of the stream
-        async with AsyncSessionLocal() as db:
-            # Rewrite query with history before passing to orchestrator
-            rewritten_query = await rewrite_query_with_history(req.messages)
-            tokens, env = await orchestrate_chat(db, query=rewritten_query, doc_ids=req.document_ids, force_web=bool(req.force_web))
-            # Stream tokens one by one
-            for t in tokens:
-                yield f"data: {t} \n\n"
-            # Final envelope as JSON
-            yield f"data: {json.dumps(env)}\n\n"
-            yield "event: end\n\n"
-
-    return StreamingResponse(event_stream(), media_type="text/event-stream")
+        timings = start_request_timings()
+        # One latency budget for the whole request, shared by every pipeline stage
+        deadline = Deadline.for_endpoint("chat")
+        messages = list(req.messages)
+        if req.session_id:
+            try:
+                messages = await load_history(session_id) + messages
+            except Exception as e:
+                log.warning("session_history_load_failed", session_id=session_id, error=str(e))
+        # No session is held here: the orchestrator borrows pooled connections only around its SQL.
+        # Both LLM-bound steps stop as soon as the client goes away instead of producing an answer nobody reads.
+        # Rewrite query with history before passing to orchestrator
+        rewritten_query = await _unless_disconnected(
+            request, rewrite_query_with_history(messages, deadline=deadline), "rewrite", deadline,
+        )
+        if rewritten_query is None:
+            return
+        result = await _unless_disconnected(request, orchestrate_chat(
+            query=rewritten_query, doc_ids=req.document_ids, force_web=bool(req.force_web),
+            deadline=deadline, session_id=session_id, filters=req.filters.to_query() if req.filters else None,
+        ), "pipeline", deadline)
+        if result is None:
+            return
+        tokens, env = result
+        env["session_id"] = session_id
+        # Time to first byte of the answer, as the client sees it
+        record_stage("sse_ttfb", time.perf_counter() - received)
+        # Stream tokens one by one
+        for t in tokens:
+            yield f"data: {t} \n\n"
+        try:
+            await append_entries(session_id, [
+                *({"role": m.role, "content": m.content} for m in req.messages),
+                {
+                    "role": "assistant",
+                    "content": " ".join(tokens),
+                    "meta": {
+                        "rewritten_query": rewritten_query,
+                        "sources": [{"doc_id": c.get("doc_id"), "page": c.get("page")} for c in env["citations"] if c["kind"] == "doc"],
+                    },
+                },
+            ])
+        except Exception as e:
+            log.warning("session_persist_failed", session_id=session_id, error=str(e))
+        if req.include_timings:
+            env["timings_ms"] = timings_ms(timings)
+        # Final envelope as JSON
+        yield f"data: {json.dumps(env)}\n\n"
+        yield "event: end\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"X-Session-Id": session_id})
+
+@router.post("/chat/batch")
+async def chat_batch(req: BatchChatRequest):
+    """Answer many independent questions over one document set; plain JSON, no SSE and no sessions.
+
+    All queries are embedded in one embeddings call, then up to CHAT_BATCH_CONCURRENCY pipelines run at once,
+    each with its own CHAT_BUDGET_S deadline. A failed question is reported in its result, not as a request error.
+    """
+    questions = [q.strip() for q in req.questions]
+    if not questions or not all(questions):
+        raise HTTPException(status_code=400, detail="questions must be non-empty strings")
+    if len(questions) > settings.chat_batch_max_questions:
+        raise HTTPException(status_code=400, detail=f"At most {settings.chat_batch_max_questions} questions per batch")
+    received = time.perf_counter()
+    filters = req.filters.to_query() if req.filters else None
+
+    qvecs: List[Optional[List[float]]] = [None] * len(questions)
+    embed_ms = 0.0
+    if not req.force_web:
+        try:
+            with stage("query_embedding"):
+                vecs = await llm_client.embed(questions, timeout=60.0)
+            if len(vecs) == len(questions):
+                qvecs = list(vecs)
+        except Exception as e:
+            # Each pipeline embeds its own query instead
+            log.warning("chat_batch_embed_failed", questions=len(questions), error=str(e))
+        embed_ms = round((time.perf_counter() - received) * 1000.0, 1)
+
+    slots = asyncio.Semaphore(max(1, settings.chat_batch_concurrency))
+
+    async def answer(index: int, question: str) -> Dict[str, Any]:
+        async with slots:
+            # Runs in its own task: the timings below are this question's only
+            timings = start_request_timings()
+            started = time.perf_counter()
+            result: Dict[str, Any] = {"index": index, "question": question}
+            try:
+                tokens, env = await orchestrate_chat(
+                    query=question, doc_ids=req.document_ids, force_web=bool(req.force_web),
+                    deadline=Deadline.for_endpoint("chat"), qvec=qvecs[index], include_context=req.include_context,
+                    filters=filters,
+                )
+                result.update({"answer": " ".join(tokens), **env})
+            except Exception as e:
+                log.warning("chat_batch_question_failed", index=index, error=str(e))
+                result["error"] = str(e)
+            result["timings_ms"] = timings_ms(timings)
+            result["elapsed_ms"] = round((time.perf_counter() - started) * 1000.0, 1)
+            return result
+
+    results = await asyncio.gather(*(answer(i, q) for i, q in enumerate(questions)))
+    elapsed_ms = round((time.perf_counter() - received) * 1000.0, 1)
+    log.info("chat_batch_done", questions=len(questions), failed=sum(1 for r in results if "error" in r), elapsed_ms=elapsed_ms)
+    return {"results": results, "embed_ms": embed_ms, "elapsed_ms": elapsed_ms}
@@ -1,30 +1,65 @@
 from __future__ import annotations
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
 from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import JSONB
 from ..db import get_db
+from datetime import datetime
+from typing import Any, Dict, Optional
+import base64
+import json
 import structlog
-from ..schemas import UploadResponse, DocumentOut
+from ..schemas import DocumentOut, DocumentTags, UploadResponse, normalize_tags
 from ..services.ingestion import ingest_pdf
 
 logger = structlog.get_logger()
 router = APIRouter(prefix="/api", tags=["documents"])
 
+# Keyset pagination: cursors encode the sort key of the last row returned, so each page is an
+# index range scan instead of an OFFSET that re-reads every preceding row.
+
+def _encode_cursor(created_at: datetime, doc_id: Any) -> str:
+    raw = json.dumps([created_at.isoformat(), str(doc_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, doc_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), str(doc_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from None
+
 @router.get("/documents")
-async def list_documents(limit: int = 100, offset: int = 0, db: AsyncSession = Depends(get_db)):
+async def list_documents(limit: int = 100, cursor: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    limit = max(1, min(limit, 500))
+    params: Dict[str, Any] = {"limit": limit + 1}
+    where = "1=1"
+    if cursor:
+        params["c_created_at"], params["c_id"] = _decode_cursor(cursor)
+        where += " AND (created_at, id) < (:c_created_at, CAST(:c_id AS uuid))"
     res = await db.execute(text(
-        "SELECT id, title, page_count, created_at FROM documents ORDER BY created_at DESC LIMIT :limit OFFSET :offset"
-    ), {"limit": limit, "offset": offset})
+        f"SELECT id, title, page_count, status, pages_ingested, tags, created_at FROM documents WHERE {where} ORDER BY created_at DESC, id DESC LIMIT :limit"
+    ), params)
     rows = res.mappings().all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
     items = [
-        {"id": str(r["id"]), "title": r["title"], "page_count": int(r["page_count"]), "created_at": r["created_at"].isoformat() if r["created_at"] else None}
+        {
+            "id": str(r["id"]), "title": r["title"], "page_count": int(r["page_count"]),
+            "status": r["status"], "pages_ingested": int(r["pages_ingested"]), "tags": list(r["tags"] or []),
+            "created_at": r["created_at"].isoformat() if r["created_at"] else None,
+        }
         for r in rows
     ]
-    return {"items": items, "limit": limit, "offset": offset}
+    next_cursor = _encode_cursor(rows[-1]["created_at"], rows[-1]["id"]) if has_more else None
+    return {"items": items, "limit": limit, "next_cursor": next_cursor}
 
 @router.post("/documents", response_model=UploadResponse)
-async def upload_documents(files: list[UploadFile] = File(...), db: AsyncSession = Depends(get_db)):
+async def upload_documents(files: list[UploadFile] = File(...), tags: Optional[str] = Form(None)):
+    # `tags`: comma-separated, applied to every uploaded file (filterable in chat via filters.tags)
+    doc_tags = normalize_tags(tags.split(",")) if tags else []
     docs: list[DocumentOut] = []
     for f in files:
         # Accept common types; some browsers send application/octet-stream or omit
@@ -32,8 +67,9 @@ async def upload_documents(files: list[UploadFile] = File(...), db: AsyncSession
             raise HTTPException(status_code=400, detail=f"Unsupported file type: {f.content_type}")
         try:
             # Size enforcement should be handled by server/client limits; UploadFile doesn't expose size reliably.
-            meta = await ingest_pdf(db, f)
-            docs.append(DocumentOut(id=meta["id"], title=meta["title"], page_count=meta["page_count"]))
+            # Pages are committed in chunks as they are processed (see services/ingestion.py)
+            meta = await ingest_pdf(f, tags=doc_tags)
+            docs.append(DocumentOut(id=meta["id"], title=meta["title"], page_count=meta["page_count"], status=meta["status"], tags=meta["tags"]))
         except Exception as e:
             logger.error("ingestion_failed", filename=f.filename, error=str(e))
             raise HTTPException(status_code=500, detail=f"Ingestion failed for {f.filename}: {e}")
@@ -41,43 +77,66 @@ async def upload_documents(files: list[UploadFile] = File(...), db: AsyncSession
 
 @router.get("/documents/{doc_id}")
 async def get_document(doc_id: str, db: AsyncSession = Depends(get_db)):
-    res = await db.execute(text("SELECT id, title, page_count FROM documents WHERE id = :id"), {"id": doc_id})
+    res = await db.execute(text(
+        "SELECT id, title, page_count, status, pages_ingested, tags, error FROM documents WHERE id = :id"
+    ), {"id": doc_id})
     row = res.mappings().first()
     if not row:
         raise HTTPException(status_code=404, detail="Document not found")
-    return {"id": str(row["id"]), "title": row["title"], "page_count": int(row["page_count"]) }
+    return {
+        "id": str(row["id"]), "title": row["title"], "page_count": int(row["page_count"]),
+        "status": row["status"], "pages_ingested": int(row["pages_ingested"]), "tags": list(row["tags"] or []),
+        "error": row["error"],
+    }
+
+@router.put("/documents/{doc_id}/tags")
+async def set_document_tags(doc_id: str, body: DocumentTags, db: AsyncSession = Depends(get_db)):
+    res = await db.execute(text(
+        "UPDATE documents SET tags = CAST(:tags AS text[]), updated_at = NOW() WHERE id = :id RETURNING id"
+    ), {"id": doc_id, "tags": body.tags})
+    if res.first() is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    await db.commit()
+    return {"id": doc_id, "tags": body.tags}
 
 @router.get("/documents/{doc_id}/pages")
-async def list_pages(doc_id: str, limit: int = 20, offset: int = 0, db: AsyncSession = Depends(get_db)):
+async def list_pages(doc_id: str, limit: int = 20, after_page: int = 0, db: AsyncSession = Depends(get_db)):
+    # One round trip: images are aggregated per page with json_agg instead of a query per page
+    limit = max(1, min(limit, 200))
     res = await db.execute(text(
         """
-        SELECT dp.id, dp.page_number, left(coalesce(dp.content,''), 2000) AS content
+        SELECT dp.id, dp.page_number, left(coalesce(dp.content,''), 2000) AS content,
+               coalesce(img.images, '[]'::jsonb) AS images
         FROM document_pages dp
-        WHERE dp.document_id = :doc_id
+        LEFT JOIN LATERAL (
+            SELECT jsonb_agg(jsonb_build_object(
+                       'id', i.id::text,
+                       'file_url', i.file_url,
+                       'position', i.position,
+                       'dimensions', i.dimensions,
+                       'thumbnail_url', i.thumbnail_url,
+                       'thumbnail_dimensions', i.thumbnail_dimensions
+                   ) ORDER BY i.created_at ASC) AS images
+            FROM document_page_images i
+            WHERE i.document_id = dp.document_id AND i.document_page_id = dp.id
+        ) img ON true
+        WHERE dp.document_id = :doc_id AND dp.page_number > :after_page
         ORDER BY dp.page_number ASC
-        LIMIT :limit OFFSET :offset
+        LIMIT :limit
         """
-    ), {"doc_id": doc_id, "limit": limit, "offset": offset})
+    ).columns(images=JSONB), {"doc_id": doc_id, "after_page": after_page, "limit": limit + 1})
     pages = res.mappings().all()
-    items = []
-    for p in pages:
-        img_res = await db.execute(text(
-            "SELECT id, file_url, position, dimensions FROM document_page_images WHERE document_page_id = :pid ORDER BY created_at ASC"
-        ), {"pid": p["id"]})
-        imgs = [
-            {
-                "id": str(i["id"]),
-                "file_url": i["file_url"],
-                "position": i["position"],
-                "dimensions": i["dimensions"],
-            }
-            for i in img_res.mappings().all()
-        ]
-        items.append({
+    has_more = len(pages) > limit
+    pages = pages[:limit]
+    items = [
+        {
             "id": str(p["id"]),
             "document_id": doc_id,
             "page_number": int(p["page_number"]),
             "content": p["content"],
-            "images": imgs,
-        })
-    return {"items": items, "limit": limit, "offset": offset}
+            "images": p["images"] or [],
+        }
+        for p in pages
+    ]
+    next_after = int(pages[-1]["page_number"]) if has_more else None
+    return {"items": items, "limit": limit, "next_after_page": next_after}
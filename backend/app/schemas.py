@@ -1,17 +1,39 @@
 from __future__ import annotations
-from pydantic import BaseModel, Field
-from typing import List, Literal, Optional
+from datetime import datetime
+from pydantic import BaseModel, Field, field_validator, model_validator
+from typing import Dict, List, Literal, Optional
+
+def normalize_tags(tags: Optional[List[str]]) -> List[str]:
+    # Tags match exactly in SQL (documents.tags @> ...), so both sides are stored/compared trimmed and lowercased
+    out: List[str] = []
+    for t in tags or []:
+        t = t.strip().lower()
+        if t and t not in out:
+            out.append(t)
+    return out
 
 class DocumentOut(BaseModel):
     id: str
     title: str
     page_count: int
+    status: str = "ready"  # ingesting | ready | failed
+    tags: List[str] = Field(default_factory=list)
+
+class DocumentTags(BaseModel):
+    tags: List[str]
+
+    @field_validator("tags")
+    @classmethod
+    def _normalize(cls, v: List[str]) -> List[str]:
+        return normalize_tags(v)
 
 class PageImageOut(BaseModel):
     id: str
     file_url: str
     position: Optional[dict] = None
     dimensions: Optional[dict] = None
+    thumbnail_url: Optional[str] = None
+    thumbnail_dimensions: Optional[dict] = None
 
 class DocumentPageOut(BaseModel):
     id: str
@@ -27,10 +49,56 @@ class ChatMessage(BaseModel):
     role: Literal["user", "assistant", "system"]
     content: str
 
+class RetrievalFilters(BaseModel):
+    # Metadata filters pushed into the page search (ranking.filter_clause); all of them must hold
+    tags: Optional[List[str]] = None  # documents carrying every one of these tags
+    uploaded_after: Optional[datetime] = None  # inclusive
+    uploaded_before: Optional[datetime] = None  # exclusive
+    title_contains: Optional[str] = None  # case-insensitive substring of the document title
+    page_from: Optional[int] = Field(default=None, ge=1)
+    page_to: Optional[int] = Field(default=None, ge=1)
+    has_images: Optional[bool] = None  # only pages with (true) or without (false) images
+
+    @field_validator("tags")
+    @classmethod
+    def _normalize_tags(cls, v: Optional[List[str]]) -> Optional[List[str]]:
+        return normalize_tags(v) or None
+
+    @field_validator("title_contains")
+    @classmethod
+    def _blank_title(cls, v: Optional[str]) -> Optional[str]:
+        return v.strip() or None if v is not None else None
+
+    @model_validator(mode="after")
+    def _check_ranges(self) -> "RetrievalFilters":
+        if self.page_from is not None and self.page_to is not None and self.page_from > self.page_to:
+            raise ValueError("page_from must not be greater than page_to")
+        if self.uploaded_after is not None and self.uploaded_before is not None and self.uploaded_after >= self.uploaded_before:
+            raise ValueError("uploaded_after must be before uploaded_before")
+        return self
+
+    def to_query(self) -> Optional[Dict[str, object]]:
+        """The set filters as a plain dict for the orchestrator, or None when nothing is set."""
+        return self.model_dump(exclude_none=True) or None
+
 class ChatRequest(BaseModel):
+    # With `session_id`, `messages` only needs the new turn; earlier turns are loaded server-side.
     messages: List[ChatMessage]
     document_ids: Optional[List[str]] = None
     force_web: Optional[bool] = False
+    session_id: Optional[str] = None
+    filters: Optional[RetrievalFilters] = None
+    # Adds per-stage latencies (ms) to the final envelope; SSE can't carry them in a Server-Timing header
+    include_timings: bool = False
+
+class BatchChatRequest(BaseModel):
+    # Independent single-turn questions over the same document set (no sessions, no history rewrite)
+    questions: List[str]
+    document_ids: Optional[List[str]] = None
+    force_web: Optional[bool] = False
+    filters: Optional[RetrievalFilters] = None
+    # Adds the full page texts / web snippets behind each answer (`contexts`), e.g. for faithfulness scoring
+    include_context: bool = False
 
 class Citation(BaseModel):
     kind: Literal["doc","web"]
@@ -53,3 +121,6 @@ class SourcesEnvelope(BaseModel):
 class FinalEnvelope(BaseModel):
     citations: List[Citation]
     sources: SourcesEnvelope
+    degradations: List[str] = Field(default_factory=list)
+    session_id: Optional[str] = None
+    timings_ms: Optional[Dict[str, float]] = None
@@ -0,0 +1,43 @@
+from __future__ import annotations
+from typing import List, Optional
+import time
+from ..config import settings
+
+# Request-scoped latency budget. One Deadline is created per request by the route
+# and passed through every stage of the pipeline; stages ask it how much time is
+# left and record which shortcuts ("degradations") they took to stay within budget.
+
+
+class Deadline:
+    def __init__(self, budget_s: Optional[float] = None) -> None:
+        self.budget_s = budget_s if budget_s and budget_s > 0 else None
+        self.started = time.monotonic()
+        self.degradations: List[str] = []
+
+    @classmethod
+    def for_endpoint(cls, endpoint: str) -> "Deadline":
+        """Build a deadline from the `<endpoint>_budget_s` setting (e.g. CHAT_BUDGET_S)."""
+        return cls(getattr(settings, f"{endpoint}_budget_s", None))
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining(self) -> float:
+        if self.budget_s is None:
+            return float("inf")
+        return max(0.0, self.budget_s - self.elapsed())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0.0
+
+    def has(self, seconds: float) -> bool:
+        """True if at least `seconds` of budget are left."""
+        return self.remaining() >= seconds
+
+    def timeout(self, default: float) -> float:
+        """Per-call timeout: the stage default, shortened to what is left of the budget."""
+        return max(settings.llm_min_timeout_s, min(default, self.remaining()))
+
+    def degrade(self, name: str) -> None:
+        if name not in self.degradations:
+            self.degradations.append(name)
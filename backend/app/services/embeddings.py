@@ -1,8 +1,37 @@
 from __future__ import annotations
-from typing import List
-from .llm import LLMClient
+from typing import List, Optional, Sequence
+import structlog
+from ..config import settings
+from .llm import llm_client
 
-client = LLMClient()
+log = structlog.get_logger(__name__)
+
+EMBEDDING_DIM = 3072  # document_pages.embedding is vector(3072)
 
 async def embed_texts(texts: List[str]) -> List[list[float]]:
-    return await client.embed(texts)
+    return await llm_client.embed(texts)
+
+def current_embedding_model() -> tuple[str, int]:
+    """(model, version) of vectors produced by llm_client.embed right now; stored with every page."""
+    return llm_client.embedding_model, settings.embedding_version
+
+def fit_dimension(vec: object, page_id: Optional[str] = None) -> Optional[List[float]]:
+    # Accept shorter dims by zero-padding up to 3072 (cosine is unchanged); truncate longer ones.
+    if not isinstance(vec, list):
+        log.warning("embed_vec_invalid", page_id=page_id, type=str(type(vec)))
+        return None
+    dim = len(vec)
+    if dim == 0:
+        log.warning("embed_vec_empty", page_id=page_id)
+        return None
+    if dim < EMBEDDING_DIM:
+        log.debug("embed_vec_pad", page_id=page_id, dim=dim, target=EMBEDDING_DIM)
+        return vec + [0.0] * (EMBEDDING_DIM - dim)
+    if dim > EMBEDDING_DIM:
+        log.info("embed_vec_truncate", page_id=page_id, dim=dim, target=EMBEDDING_DIM)
+        return vec[:EMBEDDING_DIM]
+    return vec
+
+def vector_literal(vec: Sequence[float]) -> str:
+    # pgvector text form; bound as a string parameter and CAST(:vec AS vector) in SQL
+    return "[" + ",".join(str(float(x)) for x in vec) + "]"
@@ -1,42 +1,294 @@
 from __future__ import annotations
+import asyncio
+import hashlib
 import io
 import os
-import uuid
-from typing import List, Tuple
+import tempfile
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 from fastapi import UploadFile
-import fitz  # PyMuPDF
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
+from sqlalchemy.dialects.postgresql import JSONB
 from ..config import settings
+from ..db import session_scope
 from .llm import llm_client
+from .embeddings import current_embedding_model, fit_dimension, vector_literal
+from . import near_dup, summaries
+from ..metrics import INGEST_PAGES, INGEST_PAGES_PER_SECOND, INGEST_SECONDS, NEAR_DUP_REUSED
 import structlog
 
+if TYPE_CHECKING:
+    import fitz  # PyMuPDF: imported on first use (or by the warm-up in app/lifecycle.py), not at app startup
+
 log = structlog.get_logger()
 
 # Notes:
-# - We store images as JPG files under MEDIA_ROOT with UUID filenames.
+# - We store images as JPG files under MEDIA_ROOT named by content hash, plus a small
+#   `<hash>_thumb.jpg` next to each one. Names never change, so /media serves them as immutable.
 # - We extract per-page text; if empty, we still create the page row, but skip embedding.
-# - Embeddings are deferred (stubbed) to keep pipeline fast; hook left below.
+# - Ingestion is a pipeline: parse -> embed -> write, connected by bounded queues, so the stages
+#   overlap and memory per document stays constant (besides the uploaded PDF bytes).
+# - Pages are committed in chunks of INGEST_CHUNK_PAGES. `documents.pages_ingested` is the checkpoint
+#   and `documents.status` is 'ingesting' until the last chunk lands, so committed pages are already
+#   listed and searchable. Re-uploading the same file (same sha256) after a crash or failure resumes
+#   after the checkpoint instead of starting over.
+# - Each page with text gets a MinHash signature at parse time (services/near_dup.py). A page that is a
+#   near-duplicate of an already-embedded page, or of an earlier page in its chunk, reuses that vector
+#   instead of being sent to the embeddings API (boilerplate: terms, headers, appendix templates).
 
 async def ensure_media_dirs() -> None:
     os.makedirs(settings.media_root, exist_ok=True)
 
-async def save_image_jpg(pix: fitz.Pixmap) -> Tuple[str, dict]:
-    # Convert to RGB if needed
-    if pix.n > 3:  # has alpha
-        pix = fitz.Pixmap(fitz.csRGB, pix)
-    img_bytes = pix.tobytes("jpg", quality=85)
-    name = f"{uuid.uuid4().hex}.jpg"
+def _write_once(name: str, data: bytes) -> None:
+    # Content-addressed: an existing file with this name already holds these bytes
     path = os.path.join(settings.media_root, name)
-    with open(path, "wb") as f:
-        f.write(img_bytes)
-    # Return file url path mounted at /media
-    return f"/media/{name}", {"width": pix.width, "height": pix.height}
+    if os.path.exists(path):
+        return
+    # Unique temp name: concurrent ingests extracting the same image (logos) must not share a half-written file
+    with tempfile.NamedTemporaryFile(dir=settings.media_root, prefix=f".{name}.", suffix=".tmp", delete=False) as f:
+        f.write(data)
+    try:
+        os.replace(f.name, path)
+    except BaseException:
+        os.unlink(f.name)
+        raise
+
+def _thumbnail(pix: fitz.Pixmap) -> fitz.Pixmap:
+    import fitz
+    max_px = settings.media_thumb_max_px
+    scale = min(1.0, max_px / max(pix.width, pix.height, 1))
+    if scale >= 1.0:
+        return pix
+    return fitz.Pixmap(pix, max(1, round(pix.width * scale)), max(1, round(pix.height * scale)), None)
+
+def save_image_jpg(pix: fitz.Pixmap) -> Dict[str, Any]:
+    import fitz
+    # Convert to RGB if needed (JPEG has no alpha; CMYK etc. are converted too)
+    if pix.colorspace is None or pix.colorspace.n != 3:
+        pix = fitz.Pixmap(fitz.csRGB, pix)
+    if pix.alpha:
+        pix = fitz.Pixmap(pix, 0)
+    img_bytes = pix.tobytes("jpg", jpg_quality=85)
+    digest = hashlib.sha256(img_bytes).hexdigest()[:32]
+    name = f"{digest}.jpg"
+    _write_once(name, img_bytes)
+    thumb = _thumbnail(pix)
+    thumb_name = f"{digest}_thumb.jpg"
+    _write_once(thumb_name, img_bytes if thumb is pix else thumb.tobytes("jpg", jpg_quality=settings.media_thumb_quality))
+    # Return file url paths mounted at /media
+    return {
+        "file_url": f"/media/{name}",
+        "dimensions": {"width": pix.width, "height": pix.height},
+        "thumbnail_url": f"/media/{thumb_name}",
+        "thumbnail_dimensions": {"width": thumb.width, "height": thumb.height},
+    }
+
+_DONE = None  # end-of-stream marker on the stage queues
+
+_IMAGE_INSERT = text("""
+    INSERT INTO document_page_images (document_id, document_page_id, position, file_url, dimensions, thumbnail_url, thumbnail_dimensions)
+    VALUES (:doc_id, :page_id, :position, :file_url, :dimensions, :thumbnail_url, :thumbnail_dimensions)
+""").bindparams(bindparam("dimensions", type_=JSONB), bindparam("thumbnail_dimensions", type_=JSONB))
+
+def _parse_page(doc: fitz.Document, pno: int) -> Dict[str, Any]:
+    # Runs in a worker thread (PyMuPDF + JPEG encoding are CPU-bound); pages are parsed one at a time
+    import fitz
+    page = doc.load_page(pno)
+    text_content = page.get_text("text") or None
+    images: List[Dict[str, Any]] = []
+    try:
+        for img in page.get_images(full=True):
+            xref = img[0]
+            try:
+                pix = fitz.Pixmap(doc, xref)
+            except Exception as e:
+                log.warning("image_pixmap_error", page_number=pno + 1, error=str(e))
+                continue
+            try:
+                images.append(save_image_jpg(pix))
+            except Exception as e:
+                log.error("image_write_error", page_number=pno + 1, error=str(e))
+    except Exception as e:
+        log.error("image_extract_error", page_number=pno + 1, error=str(e))
+    page_data = {"page_number": pno + 1, "content": text_content, "images": images, "embedding": None,
+                 "minhash": None, "minhash_bands": None}
+    if settings.near_dup_enabled:
+        near_dup.sign_pages([page_data])
+    return page_data
+
+async def _parse_stage(doc: fitz.Document, start_page: int, out: "asyncio.Queue[Optional[Dict[str, Any]]]") -> None:
+    for pno in range(start_page, doc.page_count):
+        work = asyncio.ensure_future(asyncio.to_thread(_parse_page, doc, pno))
+        try:
+            page = await asyncio.shield(work)
+        except asyncio.CancelledError:
+            # A worker thread can't be interrupted: let it finish with `doc` before the caller closes it
+            while not work.done():
+                try:
+                    await asyncio.wait({work})
+                except asyncio.CancelledError:
+                    continue
+            raise
+        await out.put(page)
+    await out.put(_DONE)
+
+async def _reuse_near_duplicates(todo: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Tuple[Dict[str, Any], Dict[str, Any]]]]:
+    """Returns (pages that still need an embedding call, (copy, original) pairs within the chunk).
+    Pages matching an already-embedded page get its vector here."""
+    if not settings.near_dup_enabled:
+        return todo, []
+    model, version = current_embedding_model()
+    try:
+        async with session_scope() as db:
+            found = await near_dup.find_embedded_duplicates(db, todo, model, version)
+    except Exception as e:
+        # Only an optimization: on failure every page is embedded as usual
+        log.warning("near_dup_lookup_failed", count=len(todo), error=str(e))
+        found = {}
+    rest: List[Dict[str, Any]] = []
+    copies: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+    for p in todo:
+        if p["page_number"] in found:
+            p["embedding"] = found[p["page_number"]]
+            continue
+        original = next((q for q in rest if near_dup.similarity(p["minhash"], q["minhash"]) >= settings.near_dup_threshold), None)
+        if original is not None:
+            copies.append((p, original))
+        else:
+            rest.append(p)
+    return rest, copies
+
+async def _embed_chunk(chunk: List[Dict[str, Any]]) -> None:
+    # Skip empty texts. Without an API key these are small stub vectors, zero-padded to 3072 and
+    # tagged "stub-hash" so they are never searched against real query vectors
+    todo = [p for p in chunk if p["content"] and p["content"].strip()]
+    if not todo:
+        return
+    rest, copies = await _reuse_near_duplicates(todo)
+    reused = len(todo) - len(rest) - len(copies)
+    if rest:
+        try:
+            embs = await llm_client.embed([p["content"][:6000] for p in rest])  # guard tokenization, simple cut
+        except Exception as e:
+            # Pages are still written; services/reembed.py fills in missing vectors later
+            log.warning("embed_failed", count=len(rest), first_page=rest[0]["page_number"], error=str(e))
+            embs = []
+        for p, vec in zip(rest, embs):
+            p["embedding"] = fit_dimension(vec, f"p{p['page_number']}")
+    for p, original in copies:
+        p["embedding"] = original["embedding"]
+        reused += p["embedding"] is not None
+    if reused:
+        NEAR_DUP_REUSED.inc(reused)
+        log.info("ingest_embeddings_reused", pages=reused, first_page=todo[0]["page_number"])
+
+async def _embed_stage(
+    inp: "asyncio.Queue[Optional[Dict[str, Any]]]",
+    out: "asyncio.Queue[Optional[List[Dict[str, Any]]]]",
+    chunk_pages: int,
+) -> None:
+    chunk: List[Dict[str, Any]] = []
+    while True:
+        item = await inp.get()
+        if item is not _DONE:
+            chunk.append(item)
+        if chunk and (item is _DONE or len(chunk) >= chunk_pages):
+            await _embed_chunk(chunk)
+            await out.put(chunk)
+            chunk = []
+        if item is _DONE:
+            await out.put(_DONE)
+            return
 
-async def ingest_pdf(db: AsyncSession, file: UploadFile) -> dict:
+async def _write_chunk(doc_id: Any, chunk: List[Dict[str, Any]]) -> None:
+    # One transaction per chunk: its pages, their images and the checkpoint land together
+    model, version = current_embedding_model()
+    async with session_scope() as db:
+        for p in chunk:
+            vec = p["embedding"]
+            res = await db.execute(text("""
+                INSERT INTO document_pages (document_id, page_number, content, embedding, embedding_model, embedding_version, embedded_at,
+                                            minhash, minhash_bands, has_images)
+                VALUES (:doc_id, :page_number, :content, CAST(:vec AS vector), :model, :version, CASE WHEN :has_vec THEN NOW() END,
+                        :minhash, CAST(:bands AS bigint[]), :has_images)
+                RETURNING id
+            """), {
+                "doc_id": doc_id, "page_number": p["page_number"], "content": p["content"],
+                "minhash": p.get("minhash"), "bands": p.get("minhash_bands"), "has_images": bool(p["images"]),
+                "vec": vector_literal(vec) if vec is not None else None,
+                "model": model if vec is not None else None,
+                "version": version if vec is not None else None,
+                "has_vec": vec is not None,
+            })
+            page_id = res.scalar_one()
+            if p["images"]:
+                await db.execute(_IMAGE_INSERT, [{"doc_id": doc_id, "page_id": page_id, "position": None, **img} for img in p["images"]])
+        if any(p["embedding"] is not None for p in chunk):
+            # The document's routing vector moves with its committed pages
+            await summaries.add_pages(db, doc_id, chunk[0]["page_number"], chunk[-1]["page_number"], model, version)
+        await db.execute(text(
+            "UPDATE documents SET pages_ingested = :done, updated_at = NOW() WHERE id = :id"
+        ), {"id": doc_id, "done": chunk[-1]["page_number"]})
+        await db.commit()
+    log.info("ingest_chunk_committed", document_id=str(doc_id), first_page=chunk[0]["page_number"], last_page=chunk[-1]["page_number"])
+
+async def _write_stage(doc_id: Any, inp: "asyncio.Queue[Optional[List[Dict[str, Any]]]]") -> int:
+    written = 0
+    while True:
+        chunk = await inp.get()
+        if chunk is _DONE:
+            return written
+        await _write_chunk(doc_id, chunk)
+        written += len(chunk)
+
+async def _start_document(title: str, page_count: int, sha256: str, tags: Optional[List[str]] = None) -> Tuple[Any, int]:
+    """Returns (document id, pages already committed). Resumes an interrupted ingestion of the same file."""
+    async with session_scope() as db:
+        res = await db.execute(text("""
+            SELECT id, pages_ingested FROM documents
+            WHERE content_sha256 = :sha AND page_count = :page_count
+              AND (status = 'failed'
+                   OR (status = 'ingesting' AND updated_at < NOW() - make_interval(secs => CAST(:stale AS double precision))))
+            ORDER BY created_at DESC
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        """), {"sha": sha256, "page_count": page_count, "stale": settings.ingest_stale_s})
+        row = res.mappings().first()
+        if row is not None:
+            doc_id, done = row["id"], int(row["pages_ingested"])
+            # Chunks commit atomically, but be strict: nothing past the checkpoint survives
+            await db.execute(text(
+                "DELETE FROM document_pages WHERE document_id = :id AND page_number > :done"
+            ), {"id": doc_id, "done": done})
+            await db.execute(text(
+                "UPDATE documents SET status = 'ingesting', error = NULL, tags = coalesce(CAST(:tags AS text[]), tags), updated_at = NOW() WHERE id = :id"
+            ), {"id": doc_id, "tags": tags or None})
+            await db.commit()
+            log.info("ingest_resume", document_id=str(doc_id), pages_ingested=done, page_count=page_count)
+            return doc_id, done
+        res = await db.execute(text("""
+            INSERT INTO documents (title, page_count, status, content_sha256, tags)
+            VALUES (:title, :page_count, 'ingesting', :sha, CAST(:tags AS text[]))
+            RETURNING id
+        """), {"title": title, "page_count": page_count, "sha": sha256, "tags": list(tags or [])})
+        doc_id = res.scalar_one()
+        await db.commit()
+    log.info("doc_inserted", document_id=str(doc_id), page_count=page_count)
+    return doc_id, 0
+
+async def _finish_document(doc_id: Any, status: str, error: Optional[str] = None) -> None:
+    async with session_scope() as db:
+        await db.execute(text(
+            "UPDATE documents SET status = :status, error = :error, updated_at = NOW() WHERE id = :id"
+        ), {"id": doc_id, "status": status, "error": error[:2000] if error else None})
+        await db.commit()
+
+async def ingest_pdf(file: UploadFile, tags: Optional[List[str]] = None) -> dict:
+    import fitz
     await ensure_media_dirs()
     # Read file into memory (25MB cap should be enforced by request size elsewhere)
     data = await file.read()
+    started = time.perf_counter()
     title = file.filename or "untitled.pdf"
     log.info("ingest_start", filename=title, size=len(data))
     try:
@@ -45,88 +297,33 @@ async def ingest_pdf(db: AsyncSession, file: UploadFile) -> dict:
         log.error("pdf_open_error", filename=title, error=str(e))
         raise
 
-    # Insert document row
-    res = await db.execute(text("""
-        INSERT INTO documents (title, page_count) VALUES (:title, :page_count)
-        RETURNING id
-    """), {"title": title, "page_count": doc.page_count})
-    doc_id = res.scalar_one()
-    log.info("doc_inserted", document_id=str(doc_id), page_count=doc.page_count)
-
-    # Iterate pages (collect for embeddings)
-    page_rows: List[tuple[str, str | None]] = []  # (page_id, text)
-    for pno in range(doc.page_count):
-        page = doc.load_page(pno)
-        text_content = page.get_text("text") or None
-        # Insert page row first (embedding NULL for now)
-        res = await db.execute(text("""
-            INSERT INTO document_pages (document_id, page_number, content)
-            VALUES (:doc_id, :page_number, :content)
-            RETURNING id
-        """), {"doc_id": doc_id, "page_number": pno + 1, "content": text_content})
-        page_id = res.scalar_one()
-        page_rows.append((str(page_id), text_content))
-        if (pno + 1) % 25 == 0 or pno == 0:
-            log.info("page_inserted", page_number=pno + 1, page_id=str(page_id))
-
-        # Extract images
-        try:
-            for img in page.get_images(full=True):
-                xref = img[0]
-                try:
-                    pix = fitz.Pixmap(doc, xref)
-                except Exception as e:
-                    log.warning("image_pixmap_error", page_number=pno + 1, error=str(e))
-                    continue
-                try:
-                    file_url, dims = await save_image_jpg(pix)
-                except Exception as e:
-                    log.error("image_write_error", page_number=pno + 1, error=str(e))
-                    continue
-                await db.execute(text("""
-                    INSERT INTO document_page_images (document_page_id, position, file_url, dimensions)
-                    VALUES (:page_id, :position, :file_url, :dimensions)
-                """), {"page_id": page_id, "position": None, "file_url": file_url, "dimensions": dims})
-        except Exception as e:
-            log.error("image_extract_error", page_number=pno + 1, error=str(e))
-
-    # Generate embeddings in batch (skip empty texts). If API key missing, this will produce small vectors; we only write if dim==3072
-    texts: List[str] = []
-    ids: List[str] = []
-    for pid, t in page_rows:
-        if t and t.strip():
-            ids.append(pid)
-            texts.append(t[:6000])  # guard tokenization, simple cut
-    if texts:
-        try:
-            embs = await llm_client.embed(texts)
-            # Persist embeddings; accept shorter dims by zero-padding up to 3072.
-            for pid, vec in zip(ids, embs):
-                if not isinstance(vec, list):
-                    log.warning("embed_vec_invalid", page_id=pid, type=str(type(vec)))
-                    continue
-                dim = len(vec)
-                if dim == 0:
-                    log.warning("embed_vec_empty", page_id=pid)
-                    continue
-                if dim < 3072:
-                    log.info("embed_vec_pad", page_id=pid, dim=dim, target=3072)
-                    vec = vec + [0.0] * (3072 - dim)
-                elif dim > 3072:
-                    log.info("embed_vec_truncate", page_id=pid, dim=dim, target=3072)
-                    vec = vec[:3072]
-                # Now exactly 3072; send as string parameter and cast to vector
-                vec_str = "[" + ",".join(str(float(x)) for x in vec) + "]"
-                try:
-                    await db.execute(text(
-                        "UPDATE document_pages SET embedding = CAST(:vec AS vector) WHERE id = :pid"
-                    ), {"pid": pid, "vec": vec_str})
-                except Exception as e:
-                    log.warning("embed_write_failed", page_id=pid, error=str(e))
-        except Exception as e:
-            # On failure, continue without embeddings
-            log.warning("embed_failed", count=len(texts), error=str(e))
+    page_count = doc.page_count
+    doc_id, start_page = await _start_document(title, page_count, hashlib.sha256(data).hexdigest(), tags)
+    chunk_pages = max(1, settings.ingest_chunk_pages)
+    parsed: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue(maxsize=chunk_pages * 2)
+    embedded: "asyncio.Queue[Optional[List[Dict[str, Any]]]]" = asyncio.Queue(maxsize=2)
+    try:
+        # A failing stage cancels the others; committed chunks stay and the next upload resumes
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(_parse_stage(doc, start_page, parsed))
+            tg.create_task(_embed_stage(parsed, embedded, chunk_pages))
+            writer = tg.create_task(_write_stage(doc_id, embedded))
+    except BaseException as e:
+        err = e.exceptions[0] if isinstance(e, BaseExceptionGroup) else e
+        log.error("ingest_failed", document_id=str(doc_id), error=repr(err))
+        await asyncio.shield(_finish_document(doc_id, "failed", repr(err)))
+        if isinstance(e, BaseExceptionGroup) and isinstance(err, Exception):
+            raise err from e  # callers see the stage's own error
+        raise
+    finally:
+        doc.close()
+    await _finish_document(doc_id, "ready")
 
-    await db.commit()
-    log.info("ingest_complete", document_id=str(doc_id))
-    return {"id": str(doc_id), "title": title, "page_count": doc.page_count}
+    written = writer.result()
+    elapsed = time.perf_counter() - started
+    INGEST_PAGES.inc(written)
+    INGEST_SECONDS.observe(elapsed)
+    if elapsed > 0:
+        INGEST_PAGES_PER_SECOND.set(written / elapsed)
+    log.info("ingest_complete", document_id=str(doc_id), pages=written, resumed_from=start_page, elapsed_s=round(elapsed, 3))
+    return {"id": str(doc_id), "title": title, "page_count": page_count, "status": "ready", "tags": list(tags or [])}
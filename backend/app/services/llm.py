@@ -1,16 +1,68 @@
 from __future__ import annotations
-from typing import Any, Dict, List, Literal
+from typing import Any, Dict, List, Literal, Optional
 import asyncio
 import httpx
 import os
+import time
 from ..config import settings
+from ..metrics import LLM_REQUEST_SECONDS, LLM_TOKENS
 
 # Simple OpenAI-compatible client with fallback stubs when no API key.
 
+def _count_tokens(model: str, usage: Dict[str, Any] | None) -> None:
+    # OpenAI-style `usage` block; providers that omit it simply aren't counted
+    if not usage:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if usage.get(kind):
+            LLM_TOKENS.inc(usage[kind], model=model, kind=kind.split("_")[0])
+
+def _rejects_json_mode(r: httpx.Response) -> bool:
+    # Only a 400 about the structured-output parameter itself; context length, content filter
+    # and other bad requests must surface instead of switching JSON mode off for the process
+    body = r.text.lower()
+    return "response_format" in body or "json_schema" in body
+
 class LLMClient:
     def __init__(self) -> None:
         self.api_key = settings.openai_api_key or os.getenv("OPENAI_API_KEY")
         self.base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+        self._http: Optional[httpx.AsyncClient] = None
+        # Cleared when the provider rejects response_format (some OpenAI-compatible servers do)
+        self._json_mode_supported = True
+
+    def http_client(self) -> httpx.AsyncClient:
+        # One pooled client per process: keep-alive connections skip the TLS handshake on every call
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                timeout=httpx.Timeout(30.0),
+                limits=httpx.Limits(max_connections=settings.llm_max_connections, max_keepalive_connections=settings.llm_max_connections),
+            )
+        return self._http
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def warm(self) -> bool:
+        """Open a pooled connection to the provider (DNS + TLS) before the first real request."""
+        if not self.api_key:
+            return False
+        r = await self.http_client().get(f"{self.base_url}/models", headers={"Authorization": f"Bearer {self.api_key}"}, timeout=10.0)
+        return r.status_code < 500
+
+    @property
+    def local_embeddings(self) -> bool:
+        return settings.embedding_backend.lower() == "local"
+
+    @property
+    def embedding_model(self) -> str:
+        # Name recorded next to stored vectors; stub vectors must never be compared with real ones
+        if self.local_embeddings:
+            from .local_embeddings import get_local_embedder
+            return get_local_embedder().model_id
+        return settings.embedding_model if self.api_key else "stub-hash"
 
     async def chat(self, model: Literal['gpt-5','gpt-5-mini'], messages: List[Dict[str, str]], **kwargs: Any) -> str:
         if not self.api_key:
@@ -22,25 +74,63 @@ class LLMClient:
         if model in ("gpt-5", "gpt-5-mini"):
             real_model = "gpt-4o-mini"
         payload = {"model": real_model, "messages": messages, "temperature": kwargs.get("temperature", 0.2)}
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            r = await client.post(f"{self.base_url}/chat/completions", headers={"Authorization": f"Bearer {self.api_key}"}, json=payload)
-            r.raise_for_status()
-            data = r.json()
-            return data["choices"][0]["message"]["content"]
+        response_format = self._response_format(kwargs.get("json_schema"))
+        if response_format:
+            payload["response_format"] = response_format
+        started = time.perf_counter()
+
+        async def post() -> httpx.Response:
+            return await self.http_client().post(
+                f"{self.base_url}/chat/completions",
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                json=payload,
+                timeout=kwargs.get("timeout", 30.0),
+            )
 
-    async def embed(self, texts: List[str]) -> List[List[float]]:
+        r = await post()
+        if r.status_code == 400 and response_format and _rejects_json_mode(r):
+            # JSON mode not supported here: retry plain (the tolerant parser copes) and stop asking
+            self._json_mode_supported = False
+            payload.pop("response_format")
+            r = await post()
+        r.raise_for_status()
+        data = r.json()
+        LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, op="chat")
+        _count_tokens(real_model, data.get("usage"))
+        return data["choices"][0]["message"]["content"]
+
+    def _response_format(self, json_schema: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        # `json_schema` = {"name", "strict", "schema"}; LLM_JSON_MODE picks how much of it the provider is asked to enforce
+        mode = settings.llm_json_mode.lower()
+        if not json_schema or mode == "off" or not self._json_mode_supported:
+            return None
+        if mode == "object":
+            return {"type": "json_object"}
+        return {"type": "json_schema", "json_schema": json_schema}
+
+    async def embed(self, texts: List[str], timeout: float = 60.0) -> List[List[float]]:
+        if self.local_embeddings:
+            # CPU-bound: keep it off the event loop
+            from .local_embeddings import get_local_embedder
+            started = time.perf_counter()
+            vecs = await asyncio.to_thread(get_local_embedder().embed, texts)
+            LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, op="embed_local")
+            return vecs
         if not self.api_key:
             # Deterministic tiny vectors as placeholder
             return [[(float((hash(t) % 1000)) / 1000.0) for _ in range(8)] for t in texts]
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            r = await client.post(
-                f"{self.base_url}/embeddings",
-                headers={"Authorization": f"Bearer {self.api_key}"},
-                json={"model": "text-embedding-3-large", "input": texts},
-            )
-            r.raise_for_status()
-            data = r.json()
-            return [item["embedding"] for item in data["data"]]
+        started = time.perf_counter()
+        r = await self.http_client().post(
+            f"{self.base_url}/embeddings",
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            json={"model": settings.embedding_model, "input": texts},
+            timeout=timeout,
+        )
+        r.raise_for_status()
+        data = r.json()
+        LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, op="embed")
+        _count_tokens(settings.embedding_model, data.get("usage"))
+        return [item["embedding"] for item in data["data"]]
 
     async def stream_chat(self, model: Literal['gpt-5','gpt-5-mini'], messages: List[Dict[str, str]]):
         # For MVP, chunk the non-stream chat response into tokens
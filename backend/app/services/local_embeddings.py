@@ -0,0 +1,165 @@
+from __future__ import annotations
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+import argparse
+import asyncio
+import hashlib
+import os
+import threading
+import numpy as np
+import structlog
+from ..config import settings
+
+log = structlog.get_logger(__name__)
+
+# Offline CPU embeddings (EMBEDDING_BACKEND=local), built from scikit-learn only:
+#   hashing vectorizer (words) -> TF-IDF -> TruncatedSVD projection -> L2 norm
+# The TF-IDF weights and the SVD basis are fitted per corpus and persisted to LOCAL_EMBEDDING_PATH.
+# Until a model is fitted, vectors are the normalized hashed TF features themselves (lexical match only).
+# Vectors are zero-padded to 3072 like every other backend. The model id changes on each fit, so
+# `python -m app.services.reembed` picks up every page after a refit. Running workers notice a refit
+# by the file's mtime and reload it on their next embed call.
+#
+#   python -m app.services.local_embeddings fit [--max-pages N]
+
+_TARGET_DIM = 3072  # document_pages.embedding is vector(3072)
+_N_FEATURES = 2 ** 16
+
+
+def _vectorizer(n_features: int = _N_FEATURES, alternate_sign: bool = False):
+    from sklearn.feature_extraction.text import HashingVectorizer
+
+    return HashingVectorizer(
+        n_features=n_features, alternate_sign=alternate_sign, norm=None, dtype=np.float32,
+    )
+
+
+class LocalEmbedder:
+    def __init__(self, tfidf: Any = None, svd: Any = None, model_id: Optional[str] = None) -> None:
+        self.tfidf = tfidf
+        self.svd = svd
+        self.model_id = model_id or "local-hashing"
+        # Unfitted: hash straight into the stored dimension (signed, so collisions tend to cancel)
+        self.vectorizer = _vectorizer() if svd is not None else _vectorizer(_TARGET_DIM, alternate_sign=True)
+
+    @property
+    def fitted(self) -> bool:
+        return self.svd is not None
+
+    @classmethod
+    def fit(cls, texts: List[str], dim: Optional[int] = None) -> "LocalEmbedder":
+        from sklearn.decomposition import TruncatedSVD
+        from sklearn.feature_extraction.text import TfidfTransformer
+
+        texts = [t for t in texts if t and t.strip()]
+        if len(texts) < 2:
+            raise ValueError("need at least 2 non-empty texts to fit the local embedder")
+        dim = min(dim or settings.local_embedding_dim, len(texts) - 1, _TARGET_DIM)
+        counts = _vectorizer().transform(texts)
+        tfidf = TfidfTransformer(sublinear_tf=True).fit(counts)
+        svd = TruncatedSVD(n_components=dim, random_state=0).fit(tfidf.transform(counts))
+        digest = hashlib.sha256(f"{datetime.now(timezone.utc).isoformat()}:{len(texts)}:{dim}".encode()).hexdigest()[:10]
+        return cls(tfidf, svd, f"local-tfidf-svd-{dim}-{digest}")
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        X = self.vectorizer.transform(texts)
+        if self.fitted:
+            dense = self.svd.transform(self.tfidf.transform(X)).astype(np.float32)
+        else:
+            X.data = np.log1p(np.abs(X.data)) * np.sign(X.data)  # sublinear TF
+            dense = X.toarray().astype(np.float32)
+        norms = np.linalg.norm(dense, axis=1, keepdims=True)
+        dense /= np.where(norms == 0, 1.0, norms)
+        # Pad as Python lists: converting a zero-padded 3072-wide array costs more than the projection
+        pad = [0.0] * (_TARGET_DIM - dense.shape[1])
+        return [row + pad for row in dense.tolist()] if pad else dense.tolist()
+
+    def save(self, path: str) -> None:
+        import joblib
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.tmp"
+        joblib.dump({"tfidf": self.tfidf, "svd": self.svd, "model_id": self.model_id}, tmp)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LocalEmbedder":
+        import joblib
+
+        data: Dict[str, Any] = joblib.load(path)
+        return cls(data["tfidf"], data["svd"], data["model_id"])
+
+
+_embedder: Optional[LocalEmbedder] = None
+_loaded_mtime: Optional[int] = None  # st_mtime_ns of the file _embedder came from; None = unfitted
+_lock = threading.Lock()
+
+
+def _model_mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def get_local_embedder() -> LocalEmbedder:
+    """Process-wide embedder: the fitted model at LOCAL_EMBEDDING_PATH if present, else hashing-only.
+
+    Reloaded when the file changes (a `fit` in another process), so queries use the new model id.
+    """
+    global _embedder, _loaded_mtime
+    path = settings.local_embedding_path
+    mtime = _model_mtime(path)
+    if _embedder is None or mtime != _loaded_mtime:
+        with _lock:
+            if _embedder is None or mtime != _loaded_mtime:
+                if mtime is not None:
+                    _embedder = LocalEmbedder.load(path)
+                    log.info("local_embedder_loaded", path=path, model=_embedder.model_id)
+                else:
+                    _embedder = LocalEmbedder()
+                    log.warning("local_embedder_unfitted", path=path)
+                _loaded_mtime = mtime
+    return _embedder
+
+
+def reset_local_embedder() -> None:
+    # Next call reloads from disk
+    global _embedder, _loaded_mtime
+    _embedder = None
+    _loaded_mtime = None
+
+
+async def fit_from_corpus(max_pages: Optional[int] = None) -> LocalEmbedder:
+    from sqlalchemy import text
+    from ..db import session_scope
+
+    async with session_scope() as db:
+        res = await db.execute(text(
+            "SELECT content FROM document_pages WHERE btrim(coalesce(content, '')) <> '' ORDER BY random() LIMIT :limit"
+        ), {"limit": max_pages or 2_000_000_000})
+        texts = [r[0][:6000] for r in res.all()]
+    log.info("local_embedder_fit_start", pages=len(texts))
+    embedder = await asyncio.to_thread(LocalEmbedder.fit, texts)
+    embedder.save(settings.local_embedding_path)
+    reset_local_embedder()
+    log.info("local_embedder_fitted", model=embedder.model_id, pages=len(texts), path=settings.local_embedding_path)
+    return embedder
+
+
+def main() -> None:
+    from ..logging_setup import setup_logging
+    parser = argparse.ArgumentParser(description="Local CPU embedder maintenance.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    fit = sub.add_parser("fit", help="fit TF-IDF/SVD on the pages in the database and save it")
+    fit.add_argument("--max-pages", type=int, default=None, help="fit on a random sample of N pages")
+    args = parser.parse_args()
+    setup_logging(settings.log_level)
+    if args.cmd == "fit":
+        asyncio.run(fit_from_corpus(args.max_pages))
+
+
+if __name__ == "__main__":
+    main()
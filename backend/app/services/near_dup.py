@@ -0,0 +1,191 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import argparse
+import asyncio
+import hashlib
+import json
+import re
+import structlog
+from sqlalchemy import bindparam, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import settings
+from ..db import session_scope
+from ..metrics import NEAR_DUP_DROPPED
+
+log = structlog.get_logger(__name__)
+
+# Near-duplicate pages (terms and conditions, templates, repeated headers) via MinHash + LSH.
+# - Every page with text gets a MinHash signature over its word 3-shingles (document_pages.minhash,
+#   NUM_PERM 32-bit values) and BANDS band hashes (document_pages.minhash_bands, GIN-indexed).
+# - Ingestion: a page whose estimated Jaccard similarity to an already-embedded page (same model/version)
+#   reaches NEAR_DUP_THRESHOLD reuses that page's vector instead of being sent to the embeddings API.
+#   Candidates come from band overlap (`minhash_bands && :bands`) and are confirmed on the full signature.
+# - Chat: near-duplicates are dropped from the candidate pool before batching, keeping the best-ranked copy.
+# - `python -m app.services.near_dup backfill` signs pages ingested before signatures existed.
+
+NUM_PERM = 64
+BANDS = 8  # 8 bands x 8 rows: pairs at Jaccard 0.9 share a band ~99% of the time, at 0.5 ~3%
+SHINGLE_WORDS = 3
+_MERSENNE = (1 << 61) - 1
+_MAX32 = (1 << 32) - 1
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _perms() -> Tuple[Any, Any]:
+    import numpy as np
+    # Fixed seed: signatures must stay comparable across processes and releases
+    rng = np.random.RandomState(1)
+    a = rng.randint(1, _MAX32, size=NUM_PERM, dtype=np.uint64)
+    b = rng.randint(0, _MAX32, size=NUM_PERM, dtype=np.uint64)
+    return a, b
+
+
+_PERMS: Optional[Tuple[Any, Any]] = None
+
+
+def signature(content: Optional[str]) -> Optional[bytes]:
+    """MinHash of the page's word shingles (NUM_PERM little-endian uint32), or None for pages without text."""
+    import numpy as np
+    global _PERMS
+    words = _WORD_RE.findall((content or "").lower())
+    if not words:
+        return None
+    if len(words) < SHINGLE_WORDS:
+        shingles = {" ".join(words)}
+    else:
+        shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(), "little") for s in shingles),
+        dtype=np.uint64, count=len(shingles),
+    )
+    if _PERMS is None:
+        _PERMS = _perms()
+    a, b = _PERMS
+    # a, x < 2^32, so a*x + b stays below 2^64
+    permuted = (np.outer(hashes, a) + b) % np.uint64(_MERSENNE) & np.uint64(_MAX32)
+    return permuted.min(axis=0).astype("<u4").tobytes()
+
+
+def band_hashes(sig: bytes) -> List[int]:
+    """One signed 64-bit hash per band (rows NUM_PERM / BANDS); two pages sharing any band are LSH candidates."""
+    rows = len(sig) // 4 // BANDS
+    out = []
+    for band in range(BANDS):
+        chunk = sig[band * rows * 4:(band + 1) * rows * 4]
+        digest = hashlib.blake2b(bytes([band]) + chunk, digest_size=8).digest()
+        out.append(int.from_bytes(digest, "little", signed=True))
+    return out
+
+
+def similarity(a: Optional[bytes], b: Optional[bytes]) -> float:
+    """Estimated Jaccard similarity: the share of equal signature slots."""
+    if not a or not b or len(a) != len(b):
+        return 0.0
+    import numpy as np
+    return float(np.mean(np.frombuffer(a, dtype="<u4") == np.frombuffer(b, dtype="<u4")))
+
+
+def sign_pages(pages: Sequence[Dict[str, Any]]) -> None:
+    """Set `minhash` / `minhash_bands` on parsed pages (CPU work: call from a worker thread)."""
+    for p in pages:
+        sig = signature(p.get("content"))
+        p["minhash"] = sig
+        p["minhash_bands"] = band_hashes(sig) if sig is not None else None
+
+
+def drop_near_duplicates(candidates: List[Dict[str, Any]], threshold: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Keep the first (best-ranked) page of every near-duplicate group; pages without a signature are kept."""
+    threshold = settings.near_dup_threshold if threshold is None else threshold
+    kept: List[Dict[str, Any]] = []
+    dropped = 0
+    for c in candidates:
+        sig = c.get("minhash")
+        if sig is not None and any(similarity(sig, k.get("minhash")) >= threshold for k in kept):
+            dropped += 1
+            continue
+        kept.append(c)
+    if dropped:
+        NEAR_DUP_DROPPED.inc(dropped)
+        log.info("near_duplicates_dropped", dropped=dropped, kept=len(kept))
+    return kept
+
+
+async def find_embedded_duplicates(
+    db: AsyncSession, pages: Sequence[Dict[str, Any]], model: str, version: int, threshold: Optional[float] = None,
+) -> Dict[int, List[float]]:
+    """Map page_number -> vector of an already-embedded near-duplicate page (same model/version)."""
+    threshold = settings.near_dup_threshold if threshold is None else threshold
+    signed = [p for p in pages if p.get("minhash_bands")]
+    if not signed:
+        return {}
+    bands = sorted({h for p in signed for h in p["minhash_bands"]})
+    # Band overlap finds the candidates; signatures decide. Vectors are fetched only for the matches.
+    res = await db.execute(text("""
+        SELECT dp.id, dp.document_id, dp.minhash
+        FROM document_pages dp
+        WHERE dp.minhash_bands && CAST(:bands AS bigint[])
+          AND dp.embedding IS NOT NULL AND dp.embedding_model = :model AND dp.embedding_version = :version
+        LIMIT :limit
+    """), {"bands": bands, "model": model, "version": version, "limit": settings.near_dup_max_candidates})
+    rows = res.mappings().all()
+    matches: Dict[int, Tuple[Any, Any]] = {}
+    for p in signed:
+        best, best_sim = None, threshold
+        for r in rows:
+            sim = similarity(p["minhash"], r["minhash"])
+            if sim >= best_sim:
+                best, best_sim = r, sim
+        if best is not None:
+            matches[p["page_number"]] = (best["id"], best["document_id"])
+    if not matches:
+        return {}
+    ids = sorted({m[0] for m in matches.values()}, key=str)
+    docs = sorted({m[1] for m in matches.values()}, key=str)
+    res = await db.execute(text("""
+        SELECT dp.id, dp.embedding::text AS vec FROM document_pages dp
+        WHERE dp.document_id IN :doc_ids AND dp.id IN :ids
+    """).bindparams(bindparam("doc_ids", expanding=True), bindparam("ids", expanding=True)), {"doc_ids": docs, "ids": ids})
+    vectors = {r["id"]: json.loads(r["vec"]) for r in res.mappings().all()}
+    return {pno: vectors[src] for pno, (src, _doc) in matches.items() if src in vectors}
+
+
+async def backfill(batch_size: int = 500) -> int:
+    """Sign every page that has text but no signature yet (pages ingested before migration 0009)."""
+    done = 0
+    while True:
+        async with session_scope() as db:
+            res = await db.execute(text("""
+                SELECT id, document_id, content FROM document_pages
+                WHERE minhash IS NULL AND content IS NOT NULL AND content <> ''
+                LIMIT :limit
+            """), {"limit": batch_size})
+            rows = [dict(r) for r in res.mappings().all()]
+            if not rows:
+                break
+            await asyncio.to_thread(sign_pages, rows)
+            for r in rows:
+                # Pages whose text has no words get an empty signature so they are not picked up again
+                await db.execute(text("""
+                    UPDATE document_pages SET minhash = :sig, minhash_bands = CAST(:bands AS bigint[])
+                    WHERE id = :id AND document_id = :doc_id
+                """), {"id": r["id"], "doc_id": r["document_id"], "sig": r["minhash"] or b"", "bands": r["minhash_bands"] or []})
+            await db.commit()
+        done += len(rows)
+        log.info("near_dup_backfill_batch", pages=len(rows), total=done)
+    return done
+
+
+def main() -> None:
+    from ..logging_setup import setup_logging
+    parser = argparse.ArgumentParser(description="Near-duplicate page signatures (MinHash/LSH).")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    fill = sub.add_parser("backfill", help="sign pages that have no signature yet")
+    fill.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    setup_logging(settings.log_level)
+    if args.cmd == "backfill":
+        print(asyncio.run(backfill(args.batch_size)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,34 @@
 from __future__ import annotations
-from typing import Any, Dict, List, Optional, Tuple
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Coroutine, Dict, List, Optional, Tuple, TypeVar
+import asyncio
+import functools
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
 from .llm import llm_client
-from .ranking import ann_search_pages
+from .near_dup import drop_near_duplicates
+from .ranking import ann_search_documents, ann_search_pages, filter_clause
+from .deadline import Deadline
+from ..config import settings
+from ..db import session_scope
+from .embeddings import current_embedding_model
+from .sessions import get_retrieval_state, set_retrieval_state
+from .structured import BATCH_DECISION_SCHEMA, CANDIDATE_DECISION_SCHEMA, PAGE_SELECTION_SCHEMA, chat_json
 from ..prompts import DECISION_PROMPT, GROUNDED_SYNTHESIS_PROMPT, REWRITE_QUERY_PROMPT
 from ..schemas import ChatMessage as Message
+from ..logging_setup import payload
+from ..metrics import BATCHES_PER_REQUEST, BATCH_OUTCOMES, CACHE_LOOKUPS, SELECT_OUTCOMES, stage
 import structlog
 
 log = structlog.get_logger(__name__)
 
-async def rewrite_query_with_history(messages: List[Message]) -> str:
+async def rewrite_query_with_history(messages: List[Message], deadline: Optional[Deadline] = None) -> str:
     """
     Uses an LLM to rewrite the user's last question to be self-contained,
     using the conversation history as context.
+    Skipped (original question kept) when the request budget can't afford an extra LLM call.
     """
+    deadline = deadline or Deadline()
     if not messages:
         return ""
 
@@ -25,21 +39,27 @@ async def rewrite_query_with_history(messages: List[Message]) -> str:
     if len(history) <= 1:
         return last_user_message
 
+    if not deadline.has(settings.chat_synthesis_reserve_s + settings.chat_batch_min_s):
+        deadline.degrade("rewrite_skipped")
+        log.info("rewrite_query_skipped", remaining=deadline.remaining())
+        return last_user_message
+
     # Format history for the prompt
     formatted_history = "\n".join([f"{m.role}: {m.content}" for m in history])
 
     prompt = REWRITE_QUERY_PROMPT.format(history=formatted_history)
 
-    log.info("rewrite_query_prompt", prompt=prompt)
+    log.info("rewrite_query_prompt", prompt=payload(prompt))
     try:
-        rewritten_query = await llm_client.chat('gpt-5', [
-            {"role": "user", "content": prompt}
-        ], temperature=0.0)
+        with stage("rewrite"):
+            rewritten_query = await llm_client.chat('gpt-5', [
+                {"role": "user", "content": prompt}
+            ], temperature=0.0, timeout=deadline.timeout(30.0))
         
         # Clean up the response, LLM might add quotes
         rewritten_query = rewritten_query.strip().strip('\"')
 
-        log.info("rewrite_query_result", original=last_user_message, rewritten=rewritten_query)
+        log.info("rewrite_query_result", original=payload(last_user_message), rewritten=payload(rewritten_query))
         # As a safeguard, if the rewritten query is empty, fall back to the original.
         if not rewritten_query:
              return last_user_message
@@ -48,24 +68,59 @@ async def rewrite_query_with_history(messages: List[Message]) -> str:
         log.warning("rewrite_query_failed", error=str(e))
         return last_user_message # Fallback to the original query on error
 
-async def route_decision(query: str, doc_ids: Optional[List[str]], force_web: bool) -> Dict[str, Any]:
+async def route_decision(
+    query: str, doc_ids: Optional[List[str]], force_web: bool, qvec: Optional[List[float]] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
     if force_web:
         return {"use_docs": False, "use_web": True, "doc_ids": doc_ids or [], "reason": "force_web"}
-    # Heuristic bias to docs if any provided
-    use_docs = bool(doc_ids)
-    return {"use_docs": use_docs, "use_web": not use_docs, "doc_ids": doc_ids or [], "reason": "heuristic"}
+    if doc_ids:
+        # The user picked the documents; the batch loop still falls back to web when they can't answer
+        return {"use_docs": True, "use_web": False, "doc_ids": doc_ids, "reason": "selected_docs"}
+    if not settings.corpus_search_enabled or not (isinstance(qvec, list) and len(qvec) == 3072):
+        return {"use_docs": False, "use_web": True, "doc_ids": [], "reason": "no_docs"}
+    # Corpus-wide: route on document summary similarity (first level of the two-level search)
+    try:
+        model, version = current_embedding_model()
+        async with session_scope() as db:
+            docs = await ann_search_documents(
+                db, qvec, limit=settings.corpus_route_top_docs, embedding_model=model, embedding_version=version, filters=filters,
+            )
+    except Exception as e:
+        log.warning("route_documents_failed", error=str(e))
+        return {"use_docs": False, "use_web": True, "doc_ids": [], "reason": "route_error"}
+    best = docs[0]["similarity"] if docs else 0.0
+    if best < settings.corpus_route_min_similarity:
+        return {"use_docs": False, "use_web": True, "doc_ids": [], "reason": "low_doc_similarity", "best_similarity": best}
+    return {
+        "use_docs": True, "use_web": False, "doc_ids": [d["document_id"] for d in docs],
+        "reason": "doc_similarity", "best_similarity": best,
+    }
 
-async def fetch_pages_basic(db: AsyncSession, doc_ids: Optional[List[str]], limit: int = 12) -> List[Dict[str, Any]]:
-    # Fallback when no embeddings: grab first pages
+async def fetch_pages_basic(
+    db: AsyncSession,
+    doc_ids: Optional[List[str]],
+    limit: int = 12,
+    stale_for: Optional[Tuple[str, int]] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    # Fallback when no embeddings: grab first pages.
+    # `stale_for=(model, version)` restricts to pages ANN can't see yet (NULL or other-model vectors).
+    # `filters` (schemas.RetrievalFilters) are pushed into the WHERE clause, as in ann_search_pages.
     params: Dict[str, Any] = {"limit": limit}
     where = "1=1"
+    if stale_for is not None:
+        where += (" AND (dp.embedding IS NULL OR dp.embedding_model IS DISTINCT FROM :emb_model"
+                  " OR dp.embedding_version IS DISTINCT FROM :emb_version)")
+        params["emb_model"], params["emb_version"] = stale_for
     if doc_ids:
-        # Let asyncpg adapt Python list to uuid[] for ANY(:doc_ids)
-        where += " AND dp.document_id = ANY(:doc_ids)"
-        params["doc_ids"] = doc_ids
+        # Expanded to IN ($1, $2, ...) so the document_pages partitions are pruned
+        where += " AND dp.document_id IN :doc_ids"
+        params["doc_ids"] = list(doc_ids)
+    where += filter_clause(filters, params)
     sql = text(
         """
-        SELECT dp.id, dp.document_id, dp.page_number, coalesce(dp.content,'') AS content, d.title
+        SELECT dp.id, dp.document_id, dp.page_number, coalesce(dp.content,'') AS content, d.title, dp.minhash
         FROM document_pages dp
         JOIN documents d ON d.id = dp.document_id
         WHERE {where}
@@ -73,6 +128,8 @@ async def fetch_pages_basic(db: AsyncSession, doc_ids: Optional[List[str]], limi
         LIMIT :limit
         """.format(where=where)
     )
+    if doc_ids:
+        sql = sql.bindparams(bindparam("doc_ids", expanding=True))
     res = await db.execute(sql, params)
     rows = res.mappings().all()
     log.info("fetch_pages_basic_result", limit=limit, doc_ids=doc_ids or [], count=len(rows))
@@ -85,6 +142,7 @@ async def fetch_pages_basic(db: AsyncSession, doc_ids: Optional[List[str]], limi
             "content": r["content"],
             "title": r["title"],
             "similarity": 0.0,
+            "minhash": r["minhash"],
         })
     return out
 
@@ -92,23 +150,39 @@ async def decision_on_candidates(query: str, candidates: List[Dict[str, Any]]) -
     # Compose prompt context
     snippets = "\n\n".join([f"Doc: {c['title']} p.{c['page_number']}\n{(c['content'] or '')[:1500]}" for c in candidates])
     user = f"Question: {query}\n\nPages:\n{snippets}\n\n{DECISION_PROMPT}"
-    log.info("decision_prompt", user=user)
+    log.info("decision_prompt", user=payload(user))
     try:
-        resp = await llm_client.chat('gpt-5', [{"role":"user","content": user}], temperature=0.0)
-        log.info("decision_response_raw", resp=resp)
-        # Best-effort parse JSON
-        import json
-        data = json.loads(resp)
-    except Exception:
+        data = await chat_json(llm_client, "candidate_decision", 'gpt-5', [{"role":"user","content": user}], CANDIDATE_DECISION_SCHEMA, Deadline())
+    except Exception as e:
+        log.warning("decision_call_failed", error=str(e))
+        data = None
+    if data is None:
+        # Counted in llm_structured_parse_total when the reply was unusable
         data = {"answerable": True, "rationale": "fallback", "key_spans": [], "missing_info": ""}
     log.info("decision_parsed", data=data)
     return data
 
-async def synthesize_answer(query: str, used: List[Dict[str, Any]], web_items: Optional[List[Dict[str, Any]]] = None) -> str:
+def _draft_answer(query: str, used: List[Dict[str, Any]], web_items: Optional[List[Dict[str, Any]]] = None) -> str:
+    # Extractive answer built without the LLM: used when synthesis fails or there is no budget left
+    body = []
+    for c in used:
+        body.append(f"(Doc: \"{c['title']}\", p.{c['page_number']}) {((c['content'] or '')[:300]).strip()}")
+    answer = f"Answer (draft) to: {query}\n\n" + "\n\n".join(body)
+    if web_items:
+        answer += "\n\nFrom the web:\n" + "\n".join([f"- [{w['title']}]({w['url']}) — {w['snippet']}" for w in web_items])
+    return answer
+
+async def synthesize_answer(query: str, used: List[Dict[str, Any]], web_items: Optional[List[Dict[str, Any]]] = None, deadline: Optional[Deadline] = None) -> str:
     # Prefer concise, grounded synthesis with bracket citations [n].
     # Build compact, deduped context with numbered sources and query-focused excerpts.
     if not used and not web_items:
         return "Não encontrei trechos relevantes para responder com base nos documentos fornecidos."
+    deadline = deadline or Deadline()
+    if not deadline.has(settings.llm_min_timeout_s):
+        deadline.degrade("draft_answer")
+        answer = _draft_answer(query, used, web_items)
+        log.info("synth_answer_fallback", reason="budget_exhausted", answer=payload(answer))
+        return answer
 
     # Prepare numbered sources for citations
     import re
@@ -166,6 +240,11 @@ async def synthesize_answer(query: str, used: List[Dict[str, Any]], web_items: O
         numbered.append({"n": idx, **c})
         lines.append(f"[{idx}] {title} (p.{page}):\n{excerpt}")
         raw_sources.append({"n": idx, "title": title, "page": page, "content": content})
+    # Web results continue the numbering; fetched page text is preferred over the search snippet
+    for w in web_items or []:
+        idx = len(lines) + 1
+        excerpt = make_excerpt(w.get("content") or w.get("snippet") or "")
+        lines.append(f"[{idx}] {w.get('title') or ''} ({w.get('url') or ''}):\n{excerpt}")
     context = "\n\n".join(lines)
 
     # Removed query-specific numeric candidate hints to keep prompts pure RAG.
@@ -184,8 +263,8 @@ async def synthesize_answer(query: str, used: List[Dict[str, Any]], web_items: O
     )
     log.info(
         "synth_prompts",
-        system=sys,
-        user=user,
+        system=payload(sys),
+        user=payload(user),
         candidates_count=0,
         context_chars=len(context),
     )
@@ -194,52 +273,90 @@ async def synthesize_answer(query: str, used: List[Dict[str, Any]], web_items: O
         answer = await llm_client.chat('gpt-5', [
             {"role": "system", "content": sys},
             {"role": "user", "content": user},
-        ], temperature=0.0)
-        log.info("synth_answer", answer=answer)
+        ], temperature=0.0, timeout=deadline.timeout(30.0))
+        log.info("synth_answer", answer=payload(answer))
     except Exception:
-        # Fallback to a simple draft if LLM fails
-        body = []
-        for c in used:
-            body.append(f"(Doc: \"{c['title']}\", p.{c['page_number']}) {((c['content'] or '')[:300]).strip()}")
-        answer = f"Answer (draft) to: {query}\n\n" + "\n\n".join(body)
-        if web_items:
-            answer += "\n\nFrom the web:\n" + "\n".join([f"- [{w['title']}]({w['url']}) — {w['snippet']}" for w in web_items])
-        log.info("synth_answer_fallback", answer=answer)
+        # Fallback to a simple draft if LLM fails (or times out against the deadline)
+        deadline.degrade("draft_answer")
+        answer = _draft_answer(query, used, web_items)
+        log.info("synth_answer_fallback", answer=payload(answer))
     return answer
 
-async def synthesize_answer_structured(query: str, used: List[Dict[str, Any]], web_items: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+def focus_excerpt(query: str, text: Optional[str], window: int = 400, max_len: int = 1400) -> str:
+    """Slice of `text` centered on the first query token hit (the head of the page when none hits)."""
+    import re
+    t = (text or "").strip()
+    if not t:
+        return ""
+    t_low = t.lower()
+    pos = -1
+    for token in re.findall(r"\w+", query.lower()):
+        if len(token) < 3:
+            continue
+        pos = t_low.find(token)
+        if pos != -1:
+            break
+    if pos == -1:
+        return t[:max_len]
+    start = max(0, pos - window)
+    end = min(len(t), pos + window)
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if end < len(t) else ""
+    return (prefix + t[start:end] + suffix)[:max_len]
+
+async def select_relevant_pages(query: str, pool: List[Dict[str, Any]], deadline: Deadline) -> Optional[Dict[str, Any]]:
+    """One call over short excerpts of the whole candidate pool (RAG_SELECTION_STRATEGY=select).
+    Returns {"pages": [pool indices], "web": bool}; None when the reply is unusable (caller falls back to batches).
+    """
+    excerpt_chars = settings.rag_select_excerpt_chars
+    lines = [
+        f"[{idx}] {c.get('title') or ''} (p.{c.get('page_number')}):\n{focus_excerpt(query, c.get('content'), window=excerpt_chars // 2, max_len=excerpt_chars)}"
+        for idx, c in enumerate(pool, start=1)
+    ]
+    sys = (
+        "Você seleciona trechos para responder a uma pergunta. Leia a pergunta e os trechos numerados. "
+        f"Retorne APENAS um JSON mínimo, sem markdown: {{\"pages\":[n,...],\"web\":false}} com os números dos trechos "
+        f"que contêm a resposta (no máximo {settings.rag_select_max_pages}, do mais útil ao menos útil), "
+        "ou {\"pages\":[],\"web\":true} se nenhum trecho responde e é preciso buscar na web."
+    )
+    user = (
+        f"Pergunta: {query}\n\n"
+        f"Trechos:\n" + "\n\n".join(lines) + "\n\n"
+        "Responda APENAS com um JSON em uma única linha, sem comentários, sem explicações."
+    )
+    try:
+        data = await chat_json(llm_client, "page_selection", 'gpt-5', [
+            {"role": "system", "content": sys},
+            {"role": "user", "content": user},
+        ], PAGE_SELECTION_SCHEMA, deadline)
+    except Exception as e:
+        log.warning("page_selection_error", error=str(e))
+        return None
+    if data is None:
+        return None
+    picked: List[int] = []
+    for n in data.get("pages") or []:
+        try:
+            i = int(n) - 1
+        except (TypeError, ValueError):
+            continue
+        if 0 <= i < len(pool) and i not in picked:
+            picked.append(i)
+    picked = picked[:settings.rag_select_max_pages]
+    return {"pages": picked, "web": bool(data.get("web")) and not picked}
+
+async def synthesize_answer_structured(query: str, used: List[Dict[str, Any]], web_items: Optional[List[Dict[str, Any]]] = None, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
     """Ask the LLM to return a strict JSON control object:
     {"code":1, "text":"..."} -> answer found using provided sources
     {"code":2} -> not found in these sources; try next batch
     {"code":3} -> not found in docs; consider web
     """
-    import re, json
+    deadline = deadline or Deadline()
     # Build numbered sources and concise excerpts (reuse logic similar to synthesize_answer)
-    def make_excerpt(text: str, window: int = 400, max_len: int = 1400) -> str:
-        t = (text or "").strip()
-        if not t:
-            return ""
-        # simple centered slice around first query token hit
-        t_low = t.lower()
-        pos = -1
-        for token in re.findall(r"\w+", query.lower()):
-            if len(token) < 3:
-                continue
-            pos = t_low.find(token)
-            if pos != -1:
-                break
-        if pos == -1:
-            return t[:max_len]
-        start = max(0, pos - window)
-        end = min(len(t), pos + window)
-        prefix = "…" if start > 0 else ""
-        suffix = "…" if end < len(t) else ""
-        return (prefix + t[start:end] + suffix)[:max_len]
-
     lines: List[str] = []
     for idx, c in enumerate(used, start=1):
         content = c.get("content") or ""
-        excerpt = make_excerpt(content)
+        excerpt = focus_excerpt(query, content)
         title = c.get("title") or ""
         page = c.get("page_number")
         lines.append(f"[{idx}] {title} (p.{page}):\n{excerpt}")
@@ -262,94 +379,275 @@ async def synthesize_answer_structured(query: str, used: List[Dict[str, Any]], w
         + "Responda APENAS com um JSON em uma única linha, sem comentários, sem explicações."
     )
     try:
-        answer = await llm_client.chat('gpt-5', [
+        data = await chat_json(llm_client, "batch_decision", 'gpt-5', [
             {"role": "system", "content": sys},
             {"role": "user", "content": user},
-        ], temperature=0.0)
-        log.info("synth_structured_answer_raw", answer=answer)
-        data = json.loads(answer)
-        # normalize
-        code = int(data.get("code", 2))
-        text = data.get("text") if code == 1 else None
-        return {"code": code, "text": text}
+        ], BATCH_DECISION_SCHEMA, deadline)
     except Exception as e:
-        log.warning("synth_structured_parse_fail", error=str(e))
+        log.warning("synth_structured_call_failed", error=str(e))
+        return {"code": 2}
+    if data is None:
         return {"code": 2}
+    # normalize
+    try:
+        code = int(data.get("code", 2))
+    except (TypeError, ValueError):
+        code = 2
+    text = data.get("text") if code == 1 else None
+    return {"code": code, "text": text}
 
-async def orchestrate_chat(db: AsyncSession, query: str, doc_ids: Optional[List[str]], force_web: bool) -> Tuple[List[str], Dict[str, Any]]:
-    # Returns token chunks and final envelope
-    routing = await route_decision(query, doc_ids, force_web)
+async def _search_web(query: str, deadline: Deadline) -> List[Dict[str, Any]]:
+    # Web results are an add-on: any provider failure degrades the answer instead of aborting the chat
+    from .web_search import get_provider
+    if not deadline.has(settings.chat_synthesis_reserve_s):
+        deadline.degrade("web_skipped")
+        return []
+    try:
+        with stage("web_search"):
+            provider = await get_provider()
+            return list(await asyncio.wait_for(provider.search(query), timeout=deadline.timeout(10.0)))
+    except asyncio.TimeoutError:
+        deadline.degrade("web_timeout")
+        log.warning("web_search_timeout", remaining=deadline.remaining())
+        return []
+    except Exception as e:
+        deadline.degrade("web_failed")
+        log.warning("web_search_failed", error=str(e))
+        return []
+
+def _should_prefetch_web(pool: List[Dict[str, Any]], code: int) -> bool:
+    # Early batches look weak: the model pointed at the web, or even the best candidate is a poor match
+    if not (settings.web_search_enabled and settings.web_search_speculative):
+        return False
+    best = max((c.get("similarity", 0.0) for c in pool), default=0.0)
+    return code == 3 or best < settings.web_search_speculative_similarity
+
+# Background tasks started by one chat pipeline (e.g. the speculative web search). They are cancelled when
+# the pipeline returns or is cancelled (client disconnect, see routes/chat.py), so no work outlives its request.
+_child_tasks: ContextVar[Optional[List[asyncio.Task]]] = ContextVar("chat_child_tasks", default=None)
+
+_T = TypeVar("_T")
+
+def _spawn(coro: Coroutine[Any, Any, _T]) -> "asyncio.Task[_T]":
+    task = asyncio.create_task(coro)
+    children = _child_tasks.get()
+    if children is not None:
+        children.append(task)
+    return task
+
+def _owns_child_tasks(fn: Callable[..., Awaitable[_T]]) -> Callable[..., Awaitable[_T]]:
+    @functools.wraps(fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> _T:
+        children: List[asyncio.Task] = []
+        token = _child_tasks.set(children)
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            _child_tasks.reset(token)
+            for task in children:
+                task.cancel()
+    return wrapper
+
+@_owns_child_tasks
+async def orchestrate_chat(
+    query: str,
+    doc_ids: Optional[List[str]],
+    force_web: bool,
+    deadline: Optional[Deadline] = None,
+    session_id: Optional[str] = None,
+    qvec: Optional[List[float]] = None,
+    include_context: bool = False,
+    filters: Optional[Dict[str, Any]] = None,
+) -> Tuple[List[str], Dict[str, Any]]:
+    # Returns token chunks and final envelope.
+    # Every stage checks `deadline`; shortcuts taken to stay within budget are reported in the envelope.
+    # DB sessions are opened only around SQL (session_scope), never across an LLM call.
+    # With a `session_id`, the previous turn's retrieval state is reused and this turn's is cached.
+    # A precomputed `qvec` (e.g. from one embeddings call for a whole batch) replaces the query embedding.
+    # `include_context` adds the full page texts / web snippets behind the answer (`contexts`), for evaluation.
+    # `filters` (schemas.RetrievalFilters.to_query()) narrow routing and page search in SQL.
+    deadline = deadline or Deadline()
+    if qvec is None and not doc_ids and not force_web and settings.corpus_search_enabled:
+        # Corpus-wide question: the query vector decides the route, and is reused for page search
+        try:
+            with stage("query_embedding"):
+                qvec = (await llm_client.embed([query], timeout=deadline.timeout(60.0)))[0]
+        except Exception:
+            qvec = None
+    with stage("routing"):
+        routing = await route_decision(query, doc_ids, force_web, qvec=qvec, filters=filters)
+    log.info("route_decision", reason=routing["reason"], use_docs=routing["use_docs"], docs=len(routing["doc_ids"]), best=routing.get("best_similarity"))
+    # Page search runs only within these: the selected documents, or the routed top documents
+    search_doc_ids = routing["doc_ids"] or None
     sources: List[Dict[str, Any]] = []
     web_items: List[Dict[str, Any]] = []
+    accepted_answer: Optional[str] = None
+    speculative_web: Optional[asyncio.Task] = None
+    selected = False  # pages picked by the selection call (RAG_SELECTION_STRATEGY=select)
 
     if routing["use_docs"]:
-        # Try embeddings route first; if empty or wrong dim, fallback to basic fetch
-        try:
-            qvec = (await llm_client.embed([query]))[0]
-            if isinstance(qvec, list) and len(qvec) == 3072:
-                candidates = await ann_search_pages(db, qvec, doc_ids=doc_ids, limit=20)
+        warm = get_retrieval_state(session_id)
+        if warm and warm["sources"] and warm["doc_ids"] == sorted(doc_ids or []) and warm.get("filters") == filters:
+            # Follow-up turn: the previous turn's accepted pages are the warm candidate pool
+            if deadline.has(settings.chat_synthesis_reserve_s + settings.chat_batch_min_s):
+                log.info("session_warm_try", session_id=session_id, size=len(warm["sources"]))
+                with stage("batch"):
+                    decision = await synthesize_answer_structured(query, warm["sources"], None, deadline=deadline)
+                if int(decision.get("code", 2)) == 1 and decision.get("text"):
+                    sources = warm["sources"]
+                    accepted_answer = str(decision["text"])
+                    log.info("session_warm_hit", session_id=session_id)
+                CACHE_LOOKUPS.inc(cache="session_warm", result="hit" if accepted_answer is not None else "miss")
+
+        if accepted_answer is None:
+            # Try embeddings route first; if empty or wrong dim, fallback to basic fetch
+            if qvec is not None:
+                pass  # embedded for routing, or passed in by the caller
+            elif warm and warm["query"] == query and warm["qvec"]:
+                qvec = warm["qvec"]
+                CACHE_LOOKUPS.inc(cache="query_vector", result="hit")
             else:
-                candidates = await fetch_pages_basic(db, doc_ids, limit=20)
-        except Exception:
-            candidates = await fetch_pages_basic(db, doc_ids, limit=20)
-
-        # Deduplicate by (document_id, page_number) and keep top by similarity then lower page number
-        seen = set()
-        deduped: List[Dict[str, Any]] = []
-        for c in candidates:
-            key = (c.get("document_id"), c.get("page_number"))
-            if key in seen:
-                continue
-            seen.add(key)
-            deduped.append(c)
-        deduped.sort(key=lambda x: (-(x.get("similarity", 0.0)), x.get("page_number", 0)))
-
-        # MODIFICATION: Pre-populate sources with the best candidates *before* the structured decision loop.
-        # This ensures that if the loop fails to get a code:1, we still have the top documents for final synthesis.
-        max_pages = 15
-        batch_size = 3
-        pool = deduped[:max_pages]
-        sources = pool  # Use the top candidates as the default source list
-
-        accepted_answer: Optional[str] = None
-        for i in range(0, len(pool), batch_size):
-            batch = pool[i:i+batch_size]
-            if not batch:
-                break
-            log.info("batch_try", index=i//batch_size, size=len(batch))
-            decision = await synthesize_answer_structured(query, batch, None)
-            log.info("batch_structured_decision", index=i//batch_size, decision=decision)
-            code = int(decision.get("code", 2))
-            if code == 1 and decision.get("text"):
-                # If LLM accepts a batch, override sources to be just that batch
-                sources = batch
-                accepted_answer = str(decision["text"])
-                break
-            if code == 3:
-                # Early exit to web, but `sources` still holds the top candidates
-                break
+                if session_id:
+                    CACHE_LOOKUPS.inc(cache="query_vector", result="miss")
+                try:
+                    with stage("query_embedding"):
+                        qvec = (await llm_client.embed([query], timeout=deadline.timeout(60.0)))[0]
+                except Exception:
+                    qvec = None
+            with stage("retrieval"):
+                async with session_scope() as db:
+                    try:
+                        if isinstance(qvec, list) and len(qvec) == 3072:
+                            model, version = current_embedding_model()
+                            candidates = await ann_search_pages(
+                                db, qvec, doc_ids=search_doc_ids, limit=20, embedding_model=model, embedding_version=version,
+                                filters=filters,
+                            )
+                            if len(candidates) < 20:
+                                # Mid-migration (or failed embeds): pages not yet in this model's space still compete
+                                candidates += await fetch_pages_basic(
+                                    db, search_doc_ids, limit=20 - len(candidates), stale_for=(model, version), filters=filters,
+                                )
+                        else:
+                            candidates = await fetch_pages_basic(db, search_doc_ids, limit=20, filters=filters)
+                    except Exception:
+                        await db.rollback()
+                        candidates = await fetch_pages_basic(db, search_doc_ids, limit=20, filters=filters)
+
+            # Deduplicate by (document_id, page_number) and keep top by similarity then lower page number
+            seen = set()
+            deduped: List[Dict[str, Any]] = []
+            for c in candidates:
+                key = (c.get("document_id"), c.get("page_number"))
+                if key in seen:
+                    continue
+                seen.add(key)
+                deduped.append(c)
+            deduped.sort(key=lambda x: (-(x.get("similarity", 0.0)), x.get("page_number", 0)))
+            if settings.near_dup_enabled:
+                # Boilerplate repeated across pages/documents would fill whole batches; keep the best-ranked copy
+                deduped = drop_near_duplicates(deduped)
+
+            # MODIFICATION: Pre-populate sources with the best candidates *before* the structured decision loop.
+            # This ensures that if the loop fails to get a code:1, we still have the top documents for final synthesis.
+            max_pages = 15
+            batch_size = 3
+            pool = deduped[:max_pages]
+            sources = pool  # Use the top candidates as the default source list
+
+            selection: Optional[Dict[str, Any]] = None
+            if settings.rag_selection_strategy == "select" and pool and deadline.has(settings.chat_synthesis_reserve_s + settings.chat_batch_min_s):
+                # One selection call over the whole pool, then one synthesis over the chosen pages
+                with stage("select"):
+                    selection = await select_relevant_pages(query, pool, deadline)
+                log.info("page_selection", selection=selection)
+                SELECT_OUTCOMES.inc(result="failed" if selection is None else "pages" if selection["pages"] else "web" if selection["web"] else "none")
+            if selection is not None:
+                if selection["pages"]:
+                    sources = [pool[i] for i in selection["pages"]]
+                    selected = True
+                elif selection["web"] and settings.web_search_enabled:
+                    # Same as code 3: the top candidates stay as sources, web results join them
+                    speculative_web = _spawn(_search_web(query, deadline))
+            else:
+                batches_run = 0
+                for i in range(0, len(pool), batch_size):
+                    batch = pool[i:i+batch_size]
+                    if not batch:
+                        break
+                    if not deadline.has(settings.chat_synthesis_reserve_s + settings.chat_batch_min_s):
+                        # Out of budget for another round: synthesize over the best pool we already have
+                        deadline.degrade("batches_skipped")
+                        log.info("batch_budget_exhausted", index=i//batch_size, remaining=deadline.remaining())
+                        break
+                    log.info("batch_try", index=i//batch_size, size=len(batch))
+                    with stage("batch"):
+                        decision = await synthesize_answer_structured(query, batch, None, deadline=deadline)
+                    batches_run += 1
+                    log.info("batch_structured_decision", index=i//batch_size, decision=decision)
+                    code = int(decision.get("code", 2))
+                    BATCH_OUTCOMES.inc(code=code)
+                    if code == 1 and decision.get("text"):
+                        # If LLM accepts a batch, override sources to be just that batch
+                        sources = batch
+                        accepted_answer = str(decision["text"])
+                        break
+                    if speculative_web is None and _should_prefetch_web(pool, code):
+                        # Overlap web search with the remaining batch rounds instead of starting it afterwards
+                        log.info("web_search_speculative_start", index=i//batch_size, code=code)
+                        speculative_web = _spawn(_search_web(query, deadline))
+                    if code == 3:
+                        # Early exit to web, but `sources` still holds the top candidates
+                        break
+                BATCHES_PER_REQUEST.observe(batches_run)
         if sources:
             log.info(
                 "retrieval_sources",
                 count=len(sources),
-                items=[{"doc_id": s.get("document_id"), "title": s.get("title"), "page": s.get("page_number"), "similarity": s.get("similarity")} for s in sources],
+                items=payload(lambda: [{"doc_id": s.get("document_id"), "title": s.get("title"), "page": s.get("page_number"), "similarity": s.get("similarity")} for s in sources]),
             )
 
     if routing.get("use_web"):
-        from .web_search import get_provider
-        provider = await get_provider()
-        web_items = await provider.search(query)
+        web_items = await _search_web(query, deadline)
+    elif speculative_web is not None:
+        if accepted_answer is None:
+            # Docs did not settle it: use the prefetched web results alongside the best pages
+            try:
+                web_items = await speculative_web
+            except Exception as e:
+                # _search_web degrades on its own; this only guards what escapes it in the background task
+                deadline.degrade("web_failed")
+                log.warning("web_search_speculative_failed", error=str(e))
+                web_items = []
+            log.info("web_search_speculative_used", count=len(web_items))
+        else:
+            speculative_web.cancel()
+            log.info("web_search_speculative_discarded")
 
     # Synthesis
     if routing["use_docs"] and sources:
         # If we already accepted a batch answer during the doc loop, reuse it
-        answer_text = accepted_answer if 'accepted_answer' in locals() and accepted_answer is not None else await synthesize_answer(query, sources, None)
+        if accepted_answer is not None:
+            answer_text = accepted_answer
+        else:
+            with stage("final_synthesis"):
+                answer_text = await synthesize_answer(query, sources, web_items or None, deadline=deadline)
     elif routing.get("use_web") and not sources:
         # Use web-only synthesis when no doc batch succeeded
-        answer_text = await synthesize_answer(query, [], web_items if web_items else None)
+        with stage("final_synthesis"):
+            answer_text = await synthesize_answer(query, [], web_items if web_items else None, deadline=deadline)
     else:
         answer_text = "Não encontrei trechos relevantes para responder com base nos documentos fornecidos."
     tokens = answer_text.split()
+    if routing["use_docs"]:
+        # Only an accepted answer (or an explicit page selection) pins pages worth reusing on the next turn
+        set_retrieval_state(session_id, {
+            "query": query,
+            "qvec": qvec if isinstance(qvec, list) else None,
+            "doc_ids": sorted(doc_ids or []),
+            "filters": filters,
+            "sources": sources if accepted_answer is not None or selected else [],
+        })
     # Final envelope
     citations = []
     for s in sources:
@@ -378,6 +676,11 @@ async def orchestrate_chat(db: AsyncSession, query: str, doc_ids: Optional[List[
                     "snippet": (s.get("content") or "")[:200]
                 } for s in sources
             ] if sources else web_items
-        }
+        },
+        "degradations": list(deadline.degradations),
     }
+    if include_context:
+        final_env["contexts"] = [s.get("content") or "" for s in sources] + [w.get("snippet") or "" for w in web_items]
+    if deadline.degradations:
+        log.info("chat_degraded", degradations=deadline.degradations, elapsed=round(deadline.elapsed(), 3))
     return tokens, final_env
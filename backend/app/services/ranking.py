@@ -1,11 +1,52 @@
 from __future__ import annotations
 from typing import Any, Dict, List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
 import structlog
+from .embeddings import vector_literal
+from ..logging_setup import payload
 
 log = structlog.get_logger(__name__)
 
+def _like_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def filter_clause(filters: Optional[Dict[str, Any]], params: Dict[str, Any], pages: bool = True) -> str:
+    """`AND ...` conditions for a chat's metadata filters (schemas.RetrievalFilters), binds added to `params`.
+
+    Expects `documents d` (and, with `pages`, `document_pages dp`) in the query. Every filter is a plain
+    column condition so the planner can use the indexes from migration 0010 instead of post-filtering.
+    """
+    if not filters:
+        return ""
+    where = ""
+    if filters.get("tags"):
+        # GIN idx_documents_tags: documents carrying every listed tag
+        where += " AND d.tags @> CAST(:f_tags AS text[])"
+        params["f_tags"] = list(filters["tags"])
+    if filters.get("uploaded_after") is not None:
+        where += " AND d.created_at >= :f_uploaded_after"
+        params["f_uploaded_after"] = filters["uploaded_after"]
+    if filters.get("uploaded_before") is not None:
+        where += " AND d.created_at < :f_uploaded_before"
+        params["f_uploaded_before"] = filters["uploaded_before"]
+    if filters.get("title_contains"):
+        # Trigram GIN idx_documents_title_trgm serves ILIKE '%...%'
+        where += " AND d.title ILIKE :f_title"
+        params["f_title"] = f"%{_like_escape(filters['title_contains'])}%"
+    if not pages:
+        return where
+    if filters.get("page_from") is not None:
+        where += " AND dp.page_number >= :f_page_from"
+        params["f_page_from"] = int(filters["page_from"])
+    if filters.get("page_to") is not None:
+        where += " AND dp.page_number <= :f_page_to"
+        params["f_page_to"] = int(filters["page_to"])
+    if filters.get("has_images") is not None:
+        # Literal predicate (not a bind) so the partial idx_document_pages_with_images matches
+        where += " AND dp.has_images" if filters["has_images"] else " AND NOT dp.has_images"
+    return where
+
 # Helper: run ANN search using pgvector cosine distance (<=>)
 
 async def ann_search_pages(
@@ -13,18 +54,27 @@ async def ann_search_pages(
     query_embedding: List[float],
     doc_ids: Optional[List[str]] = None,
     limit: int = 12,
+    embedding_model: Optional[str] = None,
+    embedding_version: Optional[int] = None,
+    filters: Optional[Dict[str, Any]] = None,
 ) -> List[Dict[str, Any]]:
-    vec_str = "[" + ",".join(str(float(x)) for x in query_embedding) + "]"
-    params: Dict[str, Any] = {"limit": limit, "qvec": vec_str}
+    params: Dict[str, Any] = {"limit": limit, "qvec": vector_literal(query_embedding)}
     where = "dp.embedding IS NOT NULL"
+    if embedding_model is not None:
+        # Only compare against vectors from the same model/version as the query (mid-migration safety)
+        where += " AND dp.embedding_model = :emb_model AND dp.embedding_version = :emb_version"
+        params["emb_model"] = embedding_model
+        params["emb_version"] = embedding_version
     if doc_ids:
-        where += " AND dp.document_id = ANY(:doc_ids)"
-        params["doc_ids"] = doc_ids
-    log.info("ann_search_params", limit=limit, has_doc_filter=bool(doc_ids))
+        # Expanded to IN ($1, $2, ...): unlike one array parameter, separate values prune partitions
+        where += " AND dp.document_id IN :doc_ids"
+        params["doc_ids"] = list(doc_ids)
+    where += filter_clause(filters, params)
+    log.info("ann_search_params", limit=limit, has_doc_filter=bool(doc_ids), filters=sorted(filters or {}))
     sql = text(
         f"""
         SELECT dp.id, dp.document_id, dp.page_number, coalesce(dp.content,'') AS content,
-               d.title,
+               d.title, dp.minhash,
                (dp.embedding <=> CAST(:qvec AS vector)) AS distance
         FROM document_pages dp
         JOIN documents d ON d.id = dp.document_id
@@ -33,13 +83,15 @@ async def ann_search_pages(
         LIMIT :limit
     """
     )
+    if doc_ids:
+        sql = sql.bindparams(bindparam("doc_ids", expanding=True))
     res = await db.execute(sql, params)
     rows = res.mappings().all()
     out: List[Dict[str, Any]] = []
     log.info("ann_search_pages", count=len(rows))
     for r in rows:
-        # WARNING: logs entire content as requested by user
-        log.info("ann_row", doc_id=str(r["document_id"]), page=int(r["page_number"]), title=r["title"], content=r["content"])
+        # Page text is a payload field: truncated/sampled/dropped per LOG_PAYLOADS (full only when set to "full")
+        log.info("ann_row", doc_id=str(r["document_id"]), page=int(r["page_number"]), title=r["title"], content=payload(r["content"]))
         out.append({
             "id": str(r["id"]),
             "document_id": str(r["document_id"]),
@@ -47,5 +99,48 @@ async def ann_search_pages(
             "content": r["content"],
             "title": r["title"],
             "similarity": 1.0 - float(r["distance"]) if r["distance"] is not None else 0.0,
+            "minhash": r["minhash"],
         })
     return out
+
+async def ann_search_documents(
+    db: AsyncSession,
+    query_embedding: List[float],
+    limit: int = 5,
+    embedding_model: Optional[str] = None,
+    embedding_version: Optional[int] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    # First level of corpus-wide search: nearest document summaries (see services/summaries.py).
+    # Same halfvec expression as idx_document_summaries_embedding, so the HNSW index is used.
+    params: Dict[str, Any] = {"limit": limit, "qvec": vector_literal(query_embedding)}
+    where = "1=1"
+    if embedding_model is not None:
+        where = "s.embedding_model = :emb_model AND s.embedding_version = :emb_version"
+        params["emb_model"] = embedding_model
+        params["emb_version"] = embedding_version
+    # Document-level filters (tags, upload date, title) also narrow routing; page filters apply later
+    where += filter_clause(filters, params, pages=False)
+    sql = text(
+        f"""
+        SELECT s.document_id, d.title, s.pages,
+               (s.embedding::halfvec(3072) <=> CAST(:qvec AS halfvec(3072))) AS distance
+        FROM document_summaries s
+        JOIN documents d ON d.id = s.document_id
+        WHERE {where}
+        ORDER BY s.embedding::halfvec(3072) <=> CAST(:qvec AS halfvec(3072))
+        LIMIT :limit
+    """
+    )
+    res = await db.execute(sql, params)
+    out = [
+        {
+            "document_id": str(r["document_id"]),
+            "title": r["title"],
+            "pages": int(r["pages"]),
+            "similarity": 1.0 - float(r["distance"]) if r["distance"] is not None else 0.0,
+        }
+        for r in res.mappings().all()
+    ]
+    log.info("ann_search_documents", count=len(out), best=out[0]["similarity"] if out else None)
+    return out
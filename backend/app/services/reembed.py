@@ -0,0 +1,149 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+import argparse
+import asyncio
+import structlog
+from sqlalchemy import text
+from ..config import settings
+from ..db import session_scope
+from .embeddings import current_embedding_model, fit_dimension, vector_literal
+from .llm import llm_client
+from . import summaries
+
+log = structlog.get_logger(__name__)
+
+# Incremental re-embedding. Walks document_pages in id order and re-embeds only pages whose vector
+# is missing or was produced by another model/version, in throttled batches. Progress is
+# checkpointed per (model, version) in embedding_backfill_jobs, so a killed run resumes where it
+# stopped. Search keeps working meanwhile: ANN only compares same-model vectors and the
+# orchestrator tops up with not-yet-migrated pages (see orchestrator.fetch_pages_basic).
+#
+#   python -m app.services.reembed [--batch-size 32] [--throttle 0.5] [--max-batches N]
+
+_ZERO_UUID = "00000000-0000-0000-0000-000000000000"
+
+_STALE = (
+    "(dp.embedding IS NULL OR dp.embedding_model IS DISTINCT FROM :model "
+    "OR dp.embedding_version IS DISTINCT FROM :version)"
+)
+
+async def _start_job(job_id: str, model: str, version: int) -> Dict[str, Any]:
+    async with session_scope() as db:
+        res = await db.execute(text(
+            """
+            INSERT INTO embedding_backfill_jobs (id, embedding_model, embedding_version)
+            VALUES (:id, :model, :version)
+            ON CONFLICT (id) DO UPDATE SET
+                -- a finished run starts over to pick up pages ingested or failed since
+                last_page_id = CASE WHEN embedding_backfill_jobs.status = 'done' THEN NULL ELSE embedding_backfill_jobs.last_page_id END,
+                processed = CASE WHEN embedding_backfill_jobs.status = 'done' THEN 0 ELSE embedding_backfill_jobs.processed END,
+                failed = CASE WHEN embedding_backfill_jobs.status = 'done' THEN 0 ELSE embedding_backfill_jobs.failed END,
+                status = 'running',
+                updated_at = NOW()
+            RETURNING last_page_id, processed, failed
+            """
+        ), {"id": job_id, "model": model, "version": version})
+        row = res.mappings().one()
+        await db.commit()
+    return dict(row)
+
+async def _embed_with_retry(texts: List[str]) -> Optional[List[List[float]]]:
+    for attempt in range(settings.reembed_max_retries):
+        try:
+            return await llm_client.embed(texts)
+        except Exception as e:
+            log.warning("reembed_batch_error", attempt=attempt + 1, size=len(texts), error=str(e))
+            await asyncio.sleep(min(30.0, 2 ** attempt))
+    return None
+
+async def backfill_embeddings(
+    batch_size: Optional[int] = None,
+    throttle_s: Optional[float] = None,
+    max_batches: Optional[int] = None,
+) -> Dict[str, Any]:
+    batch_size = batch_size or settings.embed_batch_size
+    throttle_s = settings.reembed_throttle_s if throttle_s is None else throttle_s
+    model, version = current_embedding_model()
+    job_id = f"{model}:{version}"
+    job = await _start_job(job_id, model, version)
+    after = str(job["last_page_id"] or _ZERO_UUID)
+    processed, failed = int(job["processed"]), int(job["failed"])
+    log.info("reembed_start", job=job_id, resume_after=after, processed=processed)
+
+    batches = 0
+    status = "running"
+    while max_batches is None or batches < max_batches:
+        # Short sessions: no connection is held while the embedding call is in flight
+        async with session_scope() as db:
+            res = await db.execute(text(
+                f"""
+                SELECT dp.id, dp.document_id, dp.content FROM document_pages dp
+                WHERE dp.id > CAST(:after AS uuid) AND btrim(coalesce(dp.content, '')) <> '' AND {_STALE}
+                ORDER BY dp.id
+                LIMIT :limit
+                """
+            ), {"after": after, "model": model, "version": version, "limit": batch_size})
+            rows = res.mappings().all()
+        if not rows:
+            status = "done"
+            break
+
+        vecs = await _embed_with_retry([r["content"][:6000] for r in rows])
+        if vecs is None:
+            # API outage: keep the checkpoint on this batch so a resume retries it
+            log.warning("reembed_paused_on_errors", job=job_id, resume_after=after)
+            break
+        updates: List[Dict[str, Any]] = []
+        for r, vec in zip(rows, vecs):
+            vec = fit_dimension(vec, str(r["id"]))
+            if vec is not None:
+                updates.append({"pid": r["id"], "doc_id": r["document_id"], "vec": vector_literal(vec), "model": model, "version": version})
+        failed += len(rows) - len(updates)
+        processed += len(updates)
+        after = str(rows[-1]["id"])
+
+        async with session_scope() as db:
+            if updates:
+                await db.execute(text(
+                    """
+                    UPDATE document_pages
+                    SET embedding = CAST(:vec AS vector), embedding_model = :model, embedding_version = :version, embedded_at = NOW()
+                    WHERE id = :pid AND document_id = :doc_id
+                    """
+                ), updates)
+                # Routing vectors of the touched documents follow their pages into the new model's space
+                await summaries.refresh(db, list({r["document_id"] for r in rows}), model, version)
+            await db.execute(text(
+                """
+                UPDATE embedding_backfill_jobs
+                SET last_page_id = CAST(:after AS uuid), processed = :processed, failed = :failed, updated_at = NOW()
+                WHERE id = :id
+                """
+            ), {"id": job_id, "after": after, "processed": processed, "failed": failed})
+            await db.commit()
+        batches += 1
+        log.info("reembed_batch", job=job_id, batch=batches, updated=len(updates), processed=processed, failed=failed)
+        if throttle_s > 0:
+            await asyncio.sleep(throttle_s)
+
+    async with session_scope() as db:
+        await db.execute(text(
+            "UPDATE embedding_backfill_jobs SET status = :status, updated_at = NOW() WHERE id = :id"
+        ), {"id": job_id, "status": "done" if status == "done" else "paused"})
+        await db.commit()
+    summary = {"job": job_id, "status": status if status == "done" else "paused", "processed": processed, "failed": failed, "batches": batches}
+    log.info("reembed_finished", **summary)
+    return summary
+
+def main() -> None:
+    from ..logging_setup import setup_logging
+    parser = argparse.ArgumentParser(description="Re-embed pages that are missing, stale or from an old model.")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--throttle", type=float, default=None, help="seconds to sleep between batches")
+    parser.add_argument("--max-batches", type=int, default=None, help="stop (resumable) after N batches")
+    args = parser.parse_args()
+    setup_logging(settings.log_level)
+    asyncio.run(backfill_embeddings(args.batch_size, args.throttle, args.max_batches))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, TypedDict
+import uuid
+import structlog
+from sqlalchemy import bindparam, text
+from sqlalchemy.dialects.postgresql import JSONB
+from ..config import settings
+from ..db import session_scope
+from ..schemas import ChatMessage
+from .cache import TTLCache
+
+log = structlog.get_logger(__name__)
+
+# Server-side chat sessions. History lives in `chat_entries` (durable, shared by all workers);
+# the last turn's retrieval state is cached per process so a follow-up on the same pages can
+# skip the ANN round and the batch loop.
+
+class RetrievalState(TypedDict):
+    query: str
+    qvec: Optional[List[float]]
+    doc_ids: List[str]
+    filters: Optional[Dict[str, Any]]
+    sources: List[Dict[str, Any]]
+
+_retrieval_cache: TTLCache[RetrievalState] = TTLCache(settings.chat_session_ttl_s, settings.chat_session_cache_size)
+
+def new_session_id() -> str:
+    return str(uuid.uuid4())
+
+async def load_history(session_id: str, limit: Optional[int] = None) -> List[ChatMessage]:
+    limit = limit or settings.chat_session_history_messages
+    async with session_scope() as db:
+        res = await db.execute(text(
+            """
+            SELECT role, content FROM (
+                SELECT role, content, created_at FROM chat_entries
+                WHERE session_id = :sid
+                ORDER BY created_at DESC
+                LIMIT :limit
+            ) recent ORDER BY created_at ASC
+            """
+        ), {"sid": session_id, "limit": limit})
+        rows = list(res.mappings().all())
+    # The LIMIT may cut a turn in half: never start the history with an orphaned reply
+    while rows and rows[0]["role"] == "assistant":
+        rows.pop(0)
+    return [ChatMessage(role=r["role"], content=r["content"]) for r in rows]
+
+async def append_entries(session_id: str, entries: List[Dict[str, Any]]) -> None:
+    # entries: [{"role": ..., "content": ..., "meta": {...} | None}]
+    if not entries:
+        return
+    async with session_scope() as db:
+        # One transaction shares one NOW(): offset each row so created_at keeps the turn's order
+        await db.execute(text(
+            """
+            INSERT INTO chat_entries (session_id, role, content, meta, created_at)
+            VALUES (:sid, :role, :content, :meta, NOW() + :seq * interval '1 microsecond')
+            """
+        ).bindparams(bindparam("meta", type_=JSONB)), [
+            {"sid": session_id, "role": e["role"], "content": e["content"], "meta": e.get("meta"), "seq": i}
+            for i, e in enumerate(entries)
+        ])
+        await db.commit()
+
+def get_retrieval_state(session_id: Optional[str]) -> Optional[RetrievalState]:
+    if not session_id:
+        return None
+    return _retrieval_cache.get(session_id)
+
+def set_retrieval_state(session_id: Optional[str], state: Optional[RetrievalState]) -> None:
+    if not session_id:
+        return
+    if state is None:
+        _retrieval_cache.pop(session_id)
+    else:
+        _retrieval_cache.set(session_id, state)
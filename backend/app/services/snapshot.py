@@ -0,0 +1,421 @@
+from __future__ import annotations
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Set, Tuple
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+import structlog
+from ..config import settings
+from .embeddings import EMBEDDING_DIM
+from . import summaries
+
+if TYPE_CHECKING:
+    import asyncpg
+
+log = structlog.get_logger(__name__)
+
+# Corpus snapshots: documents, page text, image metadata and page embeddings, without re-parsing PDFs
+# or calling the embeddings API. A snapshot is a directory:
+#
+#   manifest.json                written last; a directory without it is incomplete
+#   documents/part-00000.parquet
+#   pages/part-00000.parquet     page rows (no vector), zstd
+#   pages/part-00000.npy         the chunk's embeddings, float16 by default (rows x 3072; zero rows = no vector)
+#   images/part-00000.parquet    image metadata only: copy MEDIA_ROOT separately for the files
+#
+# Export streams each table through a server-side cursor in SNAPSHOT_CHUNK_ROWS chunks, inside one
+# REPEATABLE READ transaction (a consistent cut). Import needs an empty corpus (or --replace), and runs in
+# one transaction: it drops the page/image keys and indexes, COPYs every chunk in binary, then builds
+# the keys and indexes once over the loaded rows. Document summaries are rebuilt afterwards.
+#
+#   python -m app.services.snapshot export /snapshots/prod-2026-10 [--dtype float32]
+#   python -m app.services.snapshot import /snapshots/prod-2026-10 [--replace]
+
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+_SAFE_NAME_RE = re.compile(r"[^A-Za-z0-9_.-]+")
+
+_DOC_COLUMNS = [
+    "id", "title", "page_count", "status", "pages_ingested", "content_sha256", "error", "created_at", "updated_at", "tags",
+]
+_PAGE_COLUMNS = [
+    "id", "document_id", "page_number", "content", "embedding_model", "embedding_version", "embedded_at", "created_at",
+    "minhash", "minhash_bands", "has_images",
+]
+_IMAGE_COLUMNS = [
+    "id", "document_id", "document_page_id", "position", "file_url", "dimensions",
+    "thumbnail_url", "thumbnail_dimensions", "created_at",
+]
+_UUID_COLUMNS = {"id", "document_id", "document_page_id"}
+_ARRAY_COLUMNS = {"minhash_bands", "tags"}
+# Values for NOT NULL columns missing from snapshots taken before they existed
+_MISSING_DEFAULTS: Dict[str, Any] = {"tags": [], "has_images": False}
+
+# Keys and secondary indexes of the partitioned tables (migration 0008); dropped before the load and
+# built once afterwards, which is much faster than maintaining them row by row during COPY.
+_DROP_KEYS = [
+    "ALTER TABLE document_page_images DROP CONSTRAINT IF EXISTS document_page_images_document_page_id_fkey",
+    "ALTER TABLE document_pages DROP CONSTRAINT IF EXISTS document_pages_document_id_fkey",
+    "DROP INDEX IF EXISTS idx_document_page_images_page",
+    "DROP INDEX IF EXISTS idx_document_pages_embedding_model",
+    "DROP INDEX IF EXISTS idx_document_pages_minhash_bands",
+    "DROP INDEX IF EXISTS idx_document_pages_with_images",
+    "DROP INDEX IF EXISTS idx_document_pages_ann_scope",
+    "ALTER TABLE document_page_images DROP CONSTRAINT IF EXISTS document_page_images_pkey",
+    "ALTER TABLE document_pages DROP CONSTRAINT IF EXISTS uq_document_pages_document_page",
+    "ALTER TABLE document_pages DROP CONSTRAINT IF EXISTS document_pages_pkey",
+]
+_BUILD_KEYS = [
+    "ALTER TABLE document_pages ADD CONSTRAINT document_pages_pkey PRIMARY KEY (id, document_id)",
+    "ALTER TABLE document_pages ADD CONSTRAINT uq_document_pages_document_page UNIQUE (document_id, page_number)",
+    "CREATE INDEX idx_document_pages_embedding_model ON document_pages (document_id, embedding_model, embedding_version)",
+    "CREATE INDEX idx_document_pages_minhash_bands ON document_pages USING gin (minhash_bands)",
+    # Partial indexes from migration 0010: same predicates as there
+    "CREATE INDEX idx_document_pages_with_images ON document_pages (document_id, page_number) WHERE has_images",
+    "CREATE INDEX idx_document_pages_ann_scope ON document_pages "
+    "(document_id, embedding_model, embedding_version, page_number) WHERE embedding IS NOT NULL",
+    "ALTER TABLE document_page_images ADD CONSTRAINT document_page_images_pkey PRIMARY KEY (id, document_id)",
+    "CREATE INDEX idx_document_page_images_page ON document_page_images (document_id, document_page_id, created_at)",
+    "ALTER TABLE document_pages ADD CONSTRAINT document_pages_document_id_fkey "
+    "FOREIGN KEY (document_id) REFERENCES documents(id) ON DELETE CASCADE",
+    "ALTER TABLE document_page_images ADD CONSTRAINT document_page_images_document_page_id_fkey "
+    "FOREIGN KEY (document_page_id, document_id) REFERENCES document_pages(id, document_id) ON DELETE CASCADE",
+]
+
+
+class SnapshotError(RuntimeError):
+    pass
+
+
+def _arrow() -> Tuple[Any, Any]:
+    # Only snapshot commands need pyarrow; keep it (and numpy) out of app startup
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise SnapshotError("snapshots need pyarrow (pip install pyarrow)") from e
+    return pa, pq
+
+
+def _schemas(pa: Any) -> Dict[str, Any]:
+    uid = pa.binary(16)
+    ts = pa.timestamp("us", tz="UTC")
+    return {
+        "documents": pa.schema([
+            ("id", uid), ("title", pa.string()), ("page_count", pa.int32()), ("status", pa.string()),
+            ("pages_ingested", pa.int32()), ("content_sha256", pa.string()), ("error", pa.string()),
+            ("created_at", ts), ("updated_at", ts), ("tags", pa.list_(pa.string())),
+        ]),
+        "pages": pa.schema([
+            ("id", uid), ("document_id", uid), ("page_number", pa.int32()), ("content", pa.string()),
+            ("embedding_model", pa.string()), ("embedding_version", pa.int32()), ("embedded_at", ts), ("created_at", ts),
+            ("minhash", pa.binary()), ("minhash_bands", pa.list_(pa.int64())), ("has_images", pa.bool_()),
+            ("has_embedding", pa.bool_()),
+        ]),
+        "images": pa.schema([
+            ("id", uid), ("document_id", uid), ("document_page_id", uid), ("position", pa.string()), ("file_url", pa.string()),
+            ("dimensions", pa.string()), ("thumbnail_url", pa.string()), ("thumbnail_dimensions", pa.string()), ("created_at", ts),
+        ]),
+    }
+
+
+def _to_arrow(value: Any, column: str) -> Any:
+    if value is None:
+        return None
+    if column in _UUID_COLUMNS:
+        return value.bytes if isinstance(value, uuid.UUID) else uuid.UUID(str(value)).bytes
+    if isinstance(value, (dict, list)) and column not in _ARRAY_COLUMNS:
+        return json.dumps(value)
+    return value
+
+
+def _from_arrow(value: Any, column: str) -> Any:
+    if value is not None and column in _UUID_COLUMNS:
+        return uuid.UUID(bytes=value)
+    return value
+
+
+def embedding_matrix(vectors: Sequence[Any], dtype: str = "float16", dim: int = EMBEDDING_DIM) -> Tuple[Any, List[bool]]:
+    """Stack page vectors into one (rows x dim) array; missing vectors become zero rows, flagged False."""
+    import numpy as np
+
+    out = np.zeros((len(vectors), dim), dtype=dtype)
+    present = []
+    for i, v in enumerate(vectors):
+        if v is None:
+            present.append(False)
+            continue
+        arr = np.asarray(v, dtype=np.float32)
+        out[i, :min(dim, arr.shape[0])] = arr[:dim]
+        present.append(True)
+    return out, present
+
+
+def safe_name(name: str) -> str:
+    cleaned = _SAFE_NAME_RE.sub("_", name).strip("._")
+    if not cleaned:
+        raise SnapshotError("invalid snapshot name")
+    return cleaned
+
+
+async def _connect() -> "asyncpg.Connection":
+    # A dedicated connection, not the app pool: it gets the pgvector binary codec and runs long transactions
+    import asyncpg
+    from pgvector.asyncpg import register_vector
+
+    conn = await asyncpg.connect(settings.database_url.replace("postgresql+asyncpg://", "postgresql://"))
+    await register_vector(conn)
+    return conn
+
+
+async def _chunks(conn: "asyncpg.Connection", sql: str, chunk_rows: int) -> AsyncIterator[List[Any]]:
+    rows: List[Any] = []
+    async for rec in conn.cursor(sql, prefetch=min(chunk_rows, 5000)):
+        rows.append(rec)
+        if len(rows) >= chunk_rows:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+
+def _write_chunk(rows: List[Any], out_dir: str, part: str, name: str, columns: List[str], dtype: str) -> None:
+    # Conversion, the embedding matrix and Parquet encoding are all CPU-bound: runs in a worker thread
+    pa, pq = _arrow()
+    import numpy as np
+
+    data: Dict[str, List[Any]] = {c: [_to_arrow(r[c], c) for r in rows] for c in columns}
+    if name == "pages":
+        matrix, data["has_embedding"] = embedding_matrix([r["embedding"] for r in rows], dtype)
+        np.save(os.path.join(out_dir, part + ".npy"), matrix)
+    table = pa.table(data, schema=_schemas(pa)[name])
+    pq.write_table(table, os.path.join(out_dir, part + ".parquet"), compression="zstd")
+
+
+async def _export_table(conn: "asyncpg.Connection", out_dir: str, name: str, sql: str, columns: List[str],
+                        chunk_rows: int, dtype: str) -> Dict[str, Any]:
+    _arrow()  # fail before the first chunk when pyarrow is missing
+    os.makedirs(os.path.join(out_dir, name), exist_ok=True)
+    files: List[str] = []
+    total = 0
+    async for rows in _chunks(conn, sql, chunk_rows):
+        part = os.path.join(name, f"part-{len(files):05d}")
+        await asyncio.to_thread(_write_chunk, rows, out_dir, part, name, columns, dtype)
+        files.append(part)
+        total += len(rows)
+        log.info("snapshot_export_chunk", table=name, rows=len(rows), total=total)
+    return {"rows": total, "parts": files}
+
+
+async def export_snapshot(out_dir: str, chunk_rows: Optional[int] = None, dtype: str = "float16",
+                          connect: Callable[[], Any] = _connect) -> Dict[str, Any]:
+    if dtype not in ("float16", "float32"):
+        raise SnapshotError("dtype must be float16 or float32")
+    if os.path.exists(os.path.join(out_dir, MANIFEST)):
+        raise SnapshotError(f"{out_dir} already holds a snapshot")
+    chunk_rows = chunk_rows or settings.snapshot_chunk_rows
+    os.makedirs(out_dir, exist_ok=True)
+    started = time.perf_counter()
+    conn = await connect()
+    try:
+        # One consistent cut of all three tables
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            tables = {
+                "documents": await _export_table(
+                    conn, out_dir, "documents", f"SELECT {', '.join(_DOC_COLUMNS)} FROM documents ORDER BY id",
+                    _DOC_COLUMNS, chunk_rows, dtype,
+                ),
+                "pages": await _export_table(
+                    conn, out_dir, "pages",
+                    f"SELECT {', '.join(_PAGE_COLUMNS)}, embedding FROM document_pages ORDER BY document_id, page_number",
+                    _PAGE_COLUMNS, chunk_rows, dtype,
+                ),
+                "images": await _export_table(
+                    conn, out_dir, "images", f"SELECT {', '.join(_IMAGE_COLUMNS)} FROM document_page_images ORDER BY document_id",
+                    _IMAGE_COLUMNS, chunk_rows, dtype,
+                ),
+            }
+            models = await conn.fetch(
+                "SELECT embedding_model, embedding_version, count(*) AS pages FROM document_pages "
+                "WHERE embedding IS NOT NULL GROUP BY 1, 2 ORDER BY 3 DESC"
+            )
+    finally:
+        await conn.close()
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "embedding_dim": EMBEDDING_DIM,
+        "embedding_dtype": dtype,
+        "embedding_models": [dict(m) for m in models],
+        "tables": tables,
+        "export_s": round(time.perf_counter() - started, 1),
+    }
+    with open(os.path.join(out_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    log.info("snapshot_exported", path=out_dir, documents=tables["documents"]["rows"], pages=tables["pages"]["rows"],
+             images=tables["images"]["rows"], seconds=manifest["export_s"])
+    return manifest
+
+
+def read_manifest(src_dir: str) -> Dict[str, Any]:
+    try:
+        with open(os.path.join(src_dir, MANIFEST)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise SnapshotError(f"{src_dir} has no {MANIFEST} (missing or incomplete snapshot)") from None
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise SnapshotError(f"unsupported snapshot format {manifest.get('format_version')}")
+    if manifest.get("embedding_dim") != EMBEDDING_DIM:
+        raise SnapshotError(f"snapshot vectors are {manifest.get('embedding_dim')}-d, the schema is {EMBEDDING_DIM}-d")
+    return manifest
+
+
+def _read_chunk(src_dir: str, part: str, name: str, columns: List[str]) -> Tuple[List[Tuple[Any, ...]], List[str]]:
+    # Parquet decoding, .npy loading and row assembly are CPU-bound: runs in a worker thread
+    _pa, pq = _arrow()
+    import numpy as np
+
+    data = pq.read_table(os.path.join(src_dir, part + ".parquet")).to_pydict()
+    rows = len(next(iter(data.values()), []))
+    # Columns added after a snapshot was taken (e.g. minhash, migration 0009) load as NULL or their default
+    cols = [[_from_arrow(v, c) for v in data.get(c, [_MISSING_DEFAULTS.get(c)] * rows)] for c in columns]
+    copy_columns = columns
+    if name == "pages":
+        matrix = np.load(os.path.join(src_dir, part + ".npy"))
+        # pgvector's binary codec takes float32 arrays; pages exported without a vector stay NULL
+        cols.append([matrix[i].astype(np.float32) if has else None for i, has in enumerate(data["has_embedding"])])
+        copy_columns = columns + ["embedding"]
+    return list(zip(*cols)), copy_columns
+
+
+async def _load_table(conn: "asyncpg.Connection", src_dir: str, name: str, table: str, columns: List[str],
+                      parts: List[str]) -> int:
+    _arrow()  # fail before the first chunk when pyarrow is missing
+    total = 0
+    for part in parts:
+        records, copy_columns = await asyncio.to_thread(_read_chunk, src_dir, part, name, columns)
+        await conn.copy_records_to_table(table, records=records, columns=copy_columns)
+        total += len(records)
+        log.info("snapshot_import_chunk", table=table, rows=len(records), total=total)
+    return total
+
+
+async def import_snapshot(src_dir: str, replace: bool = False, connect: Callable[[], Any] = _connect,
+                          rebuild_summaries: Callable[[], Any] = summaries.rebuild_all) -> Dict[str, Any]:
+    manifest = read_manifest(src_dir)
+    tables = manifest["tables"]
+    started = time.perf_counter()
+    conn = await connect()
+    try:
+        async with conn.transaction():
+            if await conn.fetchval("SELECT count(*) FROM documents") > 0:
+                if not replace:
+                    raise SnapshotError("the target corpus is not empty (use replace to wipe it first)")
+                # Pages, images and summaries go with their documents
+                await conn.execute("TRUNCATE documents CASCADE")
+            await conn.execute(f"SET LOCAL maintenance_work_mem = '{settings.snapshot_maintenance_work_mem}'")
+            for stmt in _DROP_KEYS:
+                await conn.execute(stmt)
+            counts = {
+                "documents": await _load_table(conn, src_dir, "documents", "documents", _DOC_COLUMNS, tables["documents"]["parts"]),
+                "pages": await _load_table(conn, src_dir, "pages", "document_pages", _PAGE_COLUMNS, tables["pages"]["parts"]),
+                "images": await _load_table(conn, src_dir, "images", "document_page_images", _IMAGE_COLUMNS, tables["images"]["parts"]),
+            }
+            # Snapshots from before migration 0010 carry no has_images; derive it (a no-op for newer ones)
+            await conn.execute(
+                "UPDATE document_pages dp SET has_images = true WHERE NOT dp.has_images AND EXISTS ("
+                "SELECT 1 FROM document_page_images i WHERE i.document_id = dp.document_id AND i.document_page_id = dp.id)"
+            )
+            loaded_s = time.perf_counter() - started
+            for stmt in _BUILD_KEYS:
+                await conn.execute(stmt)
+        indexed_s = time.perf_counter() - started - loaded_s
+        for table in ("documents", "document_pages", "document_page_images"):
+            await conn.execute(f"ANALYZE {table}")
+    finally:
+        await conn.close()
+    # Routing vectors are derived data: recomputed from the loaded pages, not shipped
+    await rebuild_summaries()
+    result = {
+        "rows": counts,
+        "load_s": round(loaded_s, 1),
+        "index_s": round(indexed_s, 1),
+        "total_s": round(time.perf_counter() - started, 1),
+    }
+    log.info("snapshot_imported", path=src_dir, **result)
+    return result
+
+
+def list_snapshots(root: str) -> List[Dict[str, Any]]:
+    items = []
+    if not os.path.isdir(root):
+        return items
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name)
+        if not os.path.isdir(path):
+            continue
+        item: Dict[str, Any] = {"name": name, "complete": False}
+        try:
+            manifest = read_manifest(path)
+            item.update(complete=True, created_at=manifest["created_at"], rows={t: v["rows"] for t, v in manifest["tables"].items()})
+        except SnapshotError:
+            pass
+        items.append(item)
+    return items
+
+
+# Admin endpoint jobs (one at a time per worker); the CLI runs in the foreground instead
+jobs: Dict[str, Dict[str, Any]] = {}
+_tasks: Set["asyncio.Task[Any]"] = set()
+
+
+def running_job() -> Optional[str]:
+    return next((key for key, job in jobs.items() if job["status"] == "running"), None)
+
+
+def start_job(kind: str, name: str, work: Callable[[], Any]) -> Dict[str, Any]:
+    key = f"{kind}:{name}"
+    job: Dict[str, Any] = {"kind": kind, "name": name, "status": "running", "started_at": datetime.now(timezone.utc).isoformat()}
+    jobs[key] = job
+
+    async def run() -> None:
+        try:
+            job["result"] = await work()
+            job["status"] = "done"
+        except Exception as e:
+            log.exception("snapshot_job_failed", kind=kind, name=name)
+            job.update(status="failed", error=str(e))
+        job["finished_at"] = datetime.now(timezone.utc).isoformat()
+
+    task = asyncio.create_task(run())
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return job
+
+
+def main() -> None:
+    from ..logging_setup import setup_logging
+    parser = argparse.ArgumentParser(description="Export/import corpus snapshots (documents, pages, images, embeddings).")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    exp = sub.add_parser("export", help="write a snapshot directory")
+    exp.add_argument("path")
+    exp.add_argument("--chunk-rows", type=int, default=None, help="rows per part file (default SNAPSHOT_CHUNK_ROWS)")
+    exp.add_argument("--dtype", choices=["float16", "float32"], default="float16", help="stored embedding precision")
+    imp = sub.add_parser("import", help="bulk-load a snapshot into an empty corpus")
+    imp.add_argument("path")
+    imp.add_argument("--replace", action="store_true", help="delete every existing document first")
+    args = parser.parse_args()
+    setup_logging(settings.log_level)
+    if args.cmd == "export":
+        result = asyncio.run(export_snapshot(args.path, args.chunk_rows, args.dtype))
+    else:
+        result = asyncio.run(import_snapshot(args.path, replace=args.replace))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
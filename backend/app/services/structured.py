@@ -0,0 +1,171 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+import json
+import re
+import structlog
+from ..config import settings
+from ..logging_setup import payload
+from ..metrics import STRUCTURED_PARSE
+
+if TYPE_CHECKING:
+    from .deadline import Deadline
+    from .llm import LLMClient
+
+log = structlog.get_logger(__name__)
+
+# Structured (JSON) replies from the LLM. Every control call in the chat pipeline goes through chat_json:
+# 1. the provider is asked for JSON output (response_format, see LLMClient.chat and LLM_JSON_MODE)
+# 2. parse_json_object accepts the reply even when wrapped in markdown fences or surrounded by prose
+# 3. if that still fails, one small repair call (gpt-5-mini, no sources) re-emits the reply as JSON,
+#    instead of treating it as "not found" and paying for another full batch round
+# Outcomes are counted in llm_structured_parse_total{call, result}.
+
+BATCH_DECISION_SCHEMA: Dict[str, Any] = {
+    "name": "batch_decision",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "code": {"type": "integer", "enum": [1, 2, 3]},
+            "text": {"type": ["string", "null"]},
+        },
+        "required": ["code", "text"],
+        "additionalProperties": False,
+    },
+}
+
+CANDIDATE_DECISION_SCHEMA: Dict[str, Any] = {
+    "name": "candidate_decision",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "answerable": {"type": "boolean"},
+            "rationale": {"type": "string"},
+            "key_spans": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {"doc_title": {"type": "string"}, "page": {"type": "integer"}, "quote": {"type": "string"}},
+                    "required": ["doc_title", "page", "quote"],
+                    "additionalProperties": False,
+                },
+            },
+            "missing_info": {"type": "string"},
+        },
+        "required": ["answerable", "rationale", "key_spans", "missing_info"],
+        "additionalProperties": False,
+    },
+}
+
+PAGE_SELECTION_SCHEMA: Dict[str, Any] = {
+    "name": "page_selection",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "pages": {"type": "array", "items": {"type": "integer"}},
+            "web": {"type": "boolean"},
+        },
+        "required": ["pages", "web"],
+        "additionalProperties": False,
+    },
+}
+
+_FENCE_RE = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.S)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_PY_LITERAL_RE = re.compile(r"\b(True|False|None)\b")
+
+
+def _first_object(text: str) -> Optional[str]:
+    """The first balanced {...} in `text` (string-aware), or None."""
+    start = text.find("{")
+    while start != -1:
+        depth, in_str, escaped = 0, False, False
+        for i in range(start, len(text)):
+            ch = text[i]
+            if in_str:
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == '"':
+                    in_str = False
+            elif ch == '"':
+                in_str = True
+            elif ch == "{":
+                depth += 1
+            elif ch == "}":
+                depth -= 1
+                if depth == 0:
+                    return text[start:i + 1]
+        start = text.find("{", start + 1)
+    return None
+
+
+def _loads_object(text: str) -> Optional[Dict[str, Any]]:
+    try:
+        data = json.loads(text)
+    except (ValueError, TypeError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def parse_json_object(raw: Optional[str]) -> Tuple[Optional[Dict[str, Any]], str]:
+    """Parse an LLM reply into a JSON object. Returns (data, how) with how in ok | extracted | fixed | failed."""
+    if not raw:
+        return None, "failed"
+    text = raw.strip()
+    data = _loads_object(text)
+    if data is not None:
+        return data, "ok"
+    fenced = _FENCE_RE.search(text)
+    candidate = _first_object(fenced.group(1) if fenced else text) or _first_object(text)
+    if candidate is None:
+        return None, "failed"
+    data = _loads_object(candidate)
+    if data is not None:
+        return data, "extracted"
+    # Common near-misses: trailing commas, Python literals
+    fixed = _TRAILING_COMMA_RE.sub(r"\1", candidate)
+    fixed = _PY_LITERAL_RE.sub(lambda m: _PY_LITERALS[m.group(1)], fixed)
+    data = _loads_object(fixed)
+    return (data, "fixed") if data is not None else (None, "failed")
+
+
+async def chat_json(
+    client: "LLMClient",
+    call: str,
+    model: str,
+    messages: List[Dict[str, str]],
+    schema: Dict[str, Any],
+    deadline: "Deadline",
+    timeout: float = 30.0,
+) -> Optional[Dict[str, Any]]:
+    """One structured LLM call; None when the reply can't be turned into a JSON object. LLM errors propagate."""
+    raw = await client.chat(model, messages, temperature=0.0, timeout=deadline.timeout(timeout), json_schema=schema)
+    log.info("structured_reply_raw", call=call, raw=payload(raw))
+    data, how = parse_json_object(raw)
+    if data is not None:
+        STRUCTURED_PARSE.inc(call=call, result=how)
+        return data
+    if not settings.llm_json_repair or not deadline.has(settings.llm_min_timeout_s):
+        STRUCTURED_PARSE.inc(call=call, result="failed")
+        log.warning("structured_parse_failed", call=call, raw=payload(raw))
+        return None
+    # One cheap repair: only the reply itself (no sources), small model, JSON mode
+    fields = ", ".join(schema["schema"]["properties"])
+    try:
+        repaired = await client.chat("gpt-5-mini", [
+            {"role": "system", "content": f"Converta o texto a seguir em um único objeto JSON com os campos: {fields}. Retorne somente o JSON."},
+            {"role": "user", "content": (raw or "")[:4000]},
+        ], temperature=0.0, timeout=deadline.timeout(10.0), json_schema=schema)
+        data, _ = parse_json_object(repaired)
+    except Exception as e:
+        log.warning("structured_repair_error", call=call, error=str(e))
+        data = None
+    STRUCTURED_PARSE.inc(call=call, result="repaired" if data is not None else "failed")
+    if data is None:
+        log.warning("structured_parse_failed", call=call, raw=payload(raw), repaired=True)
+    return data
@@ -0,0 +1,85 @@
+from __future__ import annotations
+from typing import Any, List, Optional
+import argparse
+import asyncio
+from sqlalchemy import bindparam, text
+from sqlalchemy.ext.asyncio import AsyncSession
+import structlog
+from ..config import settings
+from ..db import session_scope
+from .embeddings import current_embedding_model
+
+log = structlog.get_logger(__name__)
+
+# Document-level routing vectors (document_summaries). Each row holds the sum of a document's page
+# embeddings for one (model, version): the centroid's direction, which is all cosine distance sees.
+# - ingestion adds every committed chunk in the same transaction (add_pages)
+# - re-embedding rebuilds the documents it touched (refresh)
+# - `python -m app.services.summaries rebuild` recomputes all of them (e.g. after a manual fix-up)
+
+async def add_pages(db: AsyncSession, doc_id: Any, first_page: int, last_page: int, model: str, version: int) -> None:
+    """Fold pages [first_page, last_page] of a document into its summary. Caller commits."""
+    await db.execute(text("""
+        INSERT INTO document_summaries AS s (document_id, embedding, embedding_model, embedding_version, pages, updated_at)
+        SELECT :doc_id, sum(dp.embedding), :model, :version, count(*), NOW()
+        FROM document_pages dp
+        WHERE dp.document_id = :doc_id AND dp.page_number BETWEEN :first AND :last
+          AND dp.embedding IS NOT NULL AND dp.embedding_model = :model AND dp.embedding_version = :version
+        HAVING count(*) > 0
+        ON CONFLICT (document_id) DO UPDATE SET
+            embedding = CASE WHEN s.embedding_model = EXCLUDED.embedding_model AND s.embedding_version = EXCLUDED.embedding_version
+                             THEN s.embedding + EXCLUDED.embedding ELSE EXCLUDED.embedding END,
+            pages = CASE WHEN s.embedding_model = EXCLUDED.embedding_model AND s.embedding_version = EXCLUDED.embedding_version
+                         THEN s.pages + EXCLUDED.pages ELSE EXCLUDED.pages END,
+            embedding_model = EXCLUDED.embedding_model,
+            embedding_version = EXCLUDED.embedding_version,
+            updated_at = NOW()
+    """), {"doc_id": doc_id, "first": first_page, "last": last_page, "model": model, "version": version})
+
+async def refresh(db: AsyncSession, doc_ids: Optional[List[Any]], model: str, version: int) -> int:
+    """Recompute summaries from scratch for `doc_ids` (all documents when None). Caller commits."""
+    params: dict = {"model": model, "version": version}
+    where = "dp.embedding IS NOT NULL AND dp.embedding_model = :model AND dp.embedding_version = :version"
+    if doc_ids is not None:
+        if not doc_ids:
+            return 0
+        where += " AND dp.document_id IN :doc_ids"
+        params["doc_ids"] = list(doc_ids)
+    sql = text(f"""
+        INSERT INTO document_summaries (document_id, embedding, embedding_model, embedding_version, pages, updated_at)
+        SELECT dp.document_id, sum(dp.embedding), :model, :version, count(*), NOW()
+        FROM document_pages dp
+        WHERE {where}
+        GROUP BY dp.document_id
+        ON CONFLICT (document_id) DO UPDATE SET
+            embedding = EXCLUDED.embedding,
+            embedding_model = EXCLUDED.embedding_model,
+            embedding_version = EXCLUDED.embedding_version,
+            pages = EXCLUDED.pages,
+            updated_at = NOW()
+    """)
+    if doc_ids is not None:
+        sql = sql.bindparams(bindparam("doc_ids", expanding=True))
+    res = await db.execute(sql, params)
+    return res.rowcount or 0
+
+async def rebuild_all() -> int:
+    model, version = current_embedding_model()
+    async with session_scope() as db:
+        count = await refresh(db, None, model, version)
+        await db.commit()
+    log.info("document_summaries_rebuilt", documents=count, model=model, version=version)
+    return count
+
+def main() -> None:
+    from ..logging_setup import setup_logging
+    parser = argparse.ArgumentParser(description="Document routing vectors (document_summaries).")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("rebuild", help="recompute every document's summary for the current embedding model")
+    args = parser.parse_args()
+    setup_logging(settings.log_level)
+    if args.cmd == "rebuild":
+        asyncio.run(rebuild_all())
+
+if __name__ == "__main__":
+    main()
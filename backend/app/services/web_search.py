@@ -1,16 +1,91 @@
 from __future__ import annotations
-from typing import List, TypedDict
+from html.parser import HTMLParser
+from typing import Callable, Dict, List, Optional, Type, TypedDict
+import asyncio
+import re
+import httpx
+import structlog
 from ..config import settings
+from .cache import TTLCache
+from ..metrics import CACHE_LOOKUPS
 
-class WebResult(TypedDict):
+log = structlog.get_logger(__name__)
+
+class _WebResultBase(TypedDict):
     title: str
     url: str
     snippet: str
 
+class WebResult(_WebResultBase, total=False):
+    content: str  # extracted page text, when the result page was fetched
+
 class WebSearchProvider:
     async def search(self, query: str) -> List[WebResult]:
         raise NotImplementedError
 
+# Provider registry, keyed by WEB_SEARCH_PROVIDER
+_PROVIDERS: Dict[str, Type[WebSearchProvider]] = {}
+
+def register_provider(name: str) -> Callable[[Type[WebSearchProvider]], Type[WebSearchProvider]]:
+    def deco(cls: Type[WebSearchProvider]) -> Type[WebSearchProvider]:
+        _PROVIDERS[name] = cls
+        return cls
+    return deco
+
+# One pooled HTTP client for all providers and result-page fetches
+_http_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.web_search_fetch_timeout_s),
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+            follow_redirects=True,
+            headers={"User-Agent": "rag-agent/0.1"},
+        )
+    return _http_client
+
+async def aclose_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+class _TextExtractor(HTMLParser):
+    # Minimal HTML -> text: drops script/style/nav content, keeps visible text
+    _skip_tags = {"script", "style", "noscript", "nav", "header", "footer", "svg"}
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.parts: List[str] = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._skip_tags:
+            self._skip += 1
+
+    def handle_endtag(self, tag):
+        if tag in self._skip_tags and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data):
+        if not self._skip and data.strip():
+            self.parts.append(data.strip())
+
+def extract_text(html: str, max_chars: int) -> str:
+    parser = _TextExtractor()
+    try:
+        parser.feed(html)
+    except (AssertionError, ValueError) as e:
+        # html.parser's failures on malformed markup (e.g. bad marked sections): keep the text read so far
+        log.debug("web_page_parse_error", error=str(e), chars=len(html))
+    return re.sub(r"\s+", " ", " ".join(parser.parts))[:max_chars]
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+@register_provider("dummy")
 class DummySearchProvider(WebSearchProvider):
     async def search(self, query: str) -> List[WebResult]:
         if not settings.web_search_enabled:
@@ -19,6 +94,101 @@ class DummySearchProvider(WebSearchProvider):
             {"title": "Example Result", "url": "https://example.com", "snippet": f"No real search. Your query: {query}"}
         ]
 
+class HttpSearchProvider(WebSearchProvider):
+    """Base for HTTP search APIs: cached by normalized query, top result pages fetched concurrently."""
+
+    def __init__(self) -> None:
+        self.cache: TTLCache[List[WebResult]] = TTLCache(settings.web_search_cache_ttl_s, settings.web_search_cache_size)
+
+    async def fetch_results(self, client: httpx.AsyncClient, query: str) -> List[WebResult]:
+        raise NotImplementedError
+
+    async def search(self, query: str) -> List[WebResult]:
+        if not settings.web_search_enabled:
+            return []
+        key = normalize_query(query)
+        cached = self.cache.get(key)
+        if cached is not None:
+            CACHE_LOOKUPS.inc(cache="web_search", result="hit")
+            log.info("web_search_cache_hit", query=key)
+            return cached
+        CACHE_LOOKUPS.inc(cache="web_search", result="miss")
+        client = get_http_client()
+        try:
+            results = (await self.fetch_results(client, query))[: settings.web_search_max_results]
+        except Exception as e:
+            log.warning("web_search_failed", error=str(e))
+            return []
+        results = await self._fetch_pages(client, results)
+        self.cache.set(key, results)
+        log.info("web_search_results", query=key, count=len(results))
+        return results
+
+    async def _fetch_page(self, client: httpx.AsyncClient, item: WebResult) -> WebResult:
+        # Streamed: at most WEB_SEARCH_MAX_PAGE_BYTES of a page is held in memory, however large it is
+        async with client.stream("GET", item["url"]) as r:
+            r.raise_for_status()
+            if "html" not in r.headers.get("content-type", "html"):
+                return item
+            body = bytearray()
+            async for chunk in r.aiter_bytes():
+                body += chunk
+                if len(body) >= settings.web_search_max_page_bytes:
+                    del body[settings.web_search_max_page_bytes:]
+                    break
+            html = bytes(body).decode(r.encoding or "utf-8", errors="replace")
+        return {**item, "content": extract_text(html, settings.web_search_page_chars)}
+
+    async def _fetch_pages(self, client: httpx.AsyncClient, results: List[WebResult]) -> List[WebResult]:
+        # Fetch and extract the top result pages concurrently; anything not done by the timeout keeps its snippet
+        top = results[: settings.web_search_fetch_top_n]
+        if not top:
+            return results
+        tasks = [asyncio.create_task(self._fetch_page(client, item)) for item in top]
+        try:
+            done, pending = await asyncio.wait(tasks, timeout=settings.web_search_fetch_timeout_s)
+        finally:
+            # Also when the search itself is cancelled (client gone): no fetch outlives it
+            for t in tasks:
+                t.cancel()
+        out: List[WebResult] = []
+        for item, t in zip(top, tasks):
+            if t in done and not t.cancelled() and t.exception() is None:
+                out.append(t.result())
+            else:
+                log.info("web_page_fetch_skipped", url=item["url"], timed_out=t in pending)
+                out.append(item)
+        return out + results[len(top):]
+
+@register_provider("searxng")
+class SearxngSearchProvider(HttpSearchProvider):
+    # SearXNG-compatible JSON API: GET {WEB_SEARCH_URL}/search?q=...&format=json
+    async def fetch_results(self, client: httpx.AsyncClient, query: str) -> List[WebResult]:
+        headers = {"Authorization": f"Bearer {settings.web_search_api_key}"} if settings.web_search_api_key else {}
+        r = await client.get(
+            f"{settings.web_search_url.rstrip('/')}/search",
+            params={"q": query, "format": "json"},
+            headers=headers,
+        )
+        r.raise_for_status()
+        data = r.json()
+        return [
+            {"title": item.get("title") or item.get("url", ""), "url": item.get("url", ""), "snippet": item.get("content") or ""}
+            for item in data.get("results", [])
+            if item.get("url")
+        ]
+
+_provider: Optional[WebSearchProvider] = None
+_provider_name: Optional[str] = None
+
 async def get_provider() -> WebSearchProvider:
-    # Future: switch on settings.web_search_provider
-    return DummySearchProvider()
+    # Provider instances are shared so their caches survive across requests
+    global _provider, _provider_name
+    name = (settings.web_search_provider or "dummy").lower()
+    if _provider is None or _provider_name != name:
+        cls = _PROVIDERS.get(name)
+        if cls is None:
+            log.warning("web_search_provider_unknown", provider=name)
+            cls = DummySearchProvider
+        _provider, _provider_name = cls(), name
+    return _provider
@@ -0,0 +1,203 @@
+"""Offline stand-in for the OpenAI endpoints the backend uses (`/v1/chat/completions`, `/v1/embeddings`).
+
+Point the backend at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 and any OPENAI_API_KEY.
+
+- Embeddings are deterministic 3072-d unit vectors built from hashed word features, so pages that
+  share words with the question really are nearer in ANN search.
+- Chat requests that ask for the structured JSON control object get `{"code":1,"text":...}` with
+  probability `accept_rate` and `{"code":2}` otherwise; page selection requests (`{"pages":...}`) get
+  `[1]` with the same probability and `{"web":true}` otherwise; other prompts get a short
+  grounded-looking answer.
+- With `answer_marker` set, both decisions are made by looking for that string in the sources instead:
+  a batch is accepted only if one of its pages contains it, and selection returns exactly those pages.
+- Every call sleeps `latency_s` (+ `jitter_s` uniform, + `latency_per_kchar_s` per 1000 prompt
+  characters) to mimic provider latency.
+
+    python -m evaluation.fake_openai --port 9100 --latency 0.3
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+EMBEDDING_DIM = 3072
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def fake_embedding(text: str, dim: int = EMBEDDING_DIM) -> List[float]:
+    vec = [0.0] * dim
+    for word in _WORD_RE.findall(text.lower()):
+        if len(word) < 3:
+            continue
+        h = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "big")
+        vec[h % dim] += 1.0 if (h >> 32) & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+class FakeOpenAIConfig:
+    def __init__(self, latency_s: float = 0.2, jitter_s: float = 0.0, accept_rate: float = 0.7, seed: Optional[int] = 0,
+                 answer_marker: Optional[str] = None, latency_per_kchar_s: float = 0.0) -> None:
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.accept_rate = accept_rate
+        self.answer_marker = answer_marker
+        self.latency_per_kchar_s = latency_per_kchar_s
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls: Dict[str, int] = {"chat": 0, "embeddings": 0}
+
+    def sleep(self, prompt_chars: int = 0) -> None:
+        with self.lock:
+            extra = self.rng.uniform(0, self.jitter_s) if self.jitter_s else 0.0
+        time.sleep(self.latency_s + extra + self.latency_per_kchar_s * prompt_chars / 1000.0)
+
+    def accept(self) -> bool:
+        with self.lock:
+            return self.rng.random() < self.accept_rate
+
+
+_NUMBERED_RE = re.compile(r"^\[(\d+)\] ", re.M)
+
+
+def _numbered_sources(user: str) -> Dict[int, str]:
+    """`[n] title (p.x):\nexcerpt` blocks of a prompt, keyed by n."""
+    parts = _NUMBERED_RE.split(user)
+    return {int(parts[i]): parts[i + 1] for i in range(1, len(parts) - 1, 2)}
+
+
+def _chat_reply(cfg: FakeOpenAIConfig, messages: List[Dict[str, str]]) -> str:
+    system = " ".join(m.get("content", "") for m in messages if m.get("role") == "system")
+    user = " ".join(m.get("content", "") for m in messages if m.get("role") == "user")
+    if '"pages"' in system:
+        if cfg.answer_marker is not None:
+            pages = [n for n, body in _numbered_sources(user).items() if cfg.answer_marker in body]
+        else:
+            pages = [1] if cfg.accept() else []
+        return json.dumps({"pages": pages, "web": not pages})
+    if '"code"' in system:
+        if cfg.answer_marker is not None:
+            found = cfg.answer_marker in user
+        else:
+            found = cfg.accept()
+        if found:
+            return json.dumps({"code": 1, "text": "Resposta sintética com base nas fontes [1]."}, ensure_ascii=False)
+        return json.dumps({"code": 2})
+    if "Fontes" in user:
+        return "Resposta sintética com base nas fontes fornecidas [1]."
+    # Query rewrite: return the last user turn from the formatted history unchanged
+    turns = [line[len("user:"):].strip() for line in user.splitlines() if line.startswith("user:")]
+    return (turns[-1] if turns else user.strip())[:200]
+
+
+def _handler(cfg: FakeOpenAIConfig) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+        def _send(self, status: int, body: Dict[str, Any]) -> None:
+            raw = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def do_GET(self) -> None:
+            # Only /models, which clients use to open a connection at startup
+            if self.path.endswith("/models"):
+                self._send(200, {"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model"}]})
+            else:
+                self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+
+        def do_POST(self) -> None:
+            length = int(self.headers.get("Content-Length") or 0)
+            req = json.loads(self.rfile.read(length) or b"{}")
+            cfg.sleep(sum(len(m.get("content") or "") for m in req.get("messages") or []))
+            if self.path.endswith("/embeddings"):
+                inputs = req.get("input") or []
+                inputs = [inputs] if isinstance(inputs, str) else inputs
+                with cfg.lock:
+                    cfg.calls["embeddings"] += 1
+                tokens = sum(len(t.split()) for t in inputs)
+                self._send(200, {
+                    "object": "list",
+                    "model": req.get("model"),
+                    "data": [{"object": "embedding", "index": i, "embedding": fake_embedding(t)} for i, t in enumerate(inputs)],
+                    "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+                })
+            elif self.path.endswith("/chat/completions"):
+                messages = req.get("messages") or []
+                with cfg.lock:
+                    cfg.calls["chat"] += 1
+                content = _chat_reply(cfg, messages)
+                prompt_tokens = sum(len(m.get("content", "").split()) for m in messages)
+                self._send(200, {
+                    "object": "chat.completion",
+                    "model": req.get("model"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content.split())},
+                })
+            else:
+                self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+
+    return Handler
+
+
+class FakeOpenAIServer:
+    """Threaded HTTP server; use as a context manager or call start()/stop()."""
+
+    def __init__(self, config: Optional[FakeOpenAIConfig] = None, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.config = config or FakeOpenAIConfig()
+        self.httpd = ThreadingHTTPServer((host, port), _handler(self.config))
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible server for offline benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra uniform random seconds per call")
+    parser.add_argument("--accept-rate", type=float, default=0.7, help="share of structured batches answered with code 1")
+    args = parser.parse_args()
+    server = FakeOpenAIServer(FakeOpenAIConfig(args.latency, args.jitter, args.accept_rate), args.host, args.port)
+    print(f"fake OpenAI listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""Offline end-to-end load benchmark.
+
+Starts the fake OpenAI server (evaluation/fake_openai.py), starts the API against it with uvicorn
+(or targets `--api-url`, which must already use the fake server via OPENAI_BASE_URL). It uploads
+generated PDFs of several sizes and then drives concurrent /api/chat SSE clients.
+Postgres is still required (DATABASE_URL, migrated); nothing leaves the machine.
+
+Reports ingestion pages/sec, chat latency p50/p95/p99, time to first token and requests/sec, and
+writes them to JSON. Pass `--compare <old.json>` to print the change against an earlier run.
+
+    python -m evaluation.load_benchmark --pages 5,25,100 --chats 200 --concurrency 20 --llm-latency 0.3
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+import fitz  # PyMuPDF
+import httpx
+from .fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_TOPICS = ["investimento", "forno", "aluguel", "salários", "margem", "equilíbrio", "fornecedor", "marketing", "estoque", "receita"]
+_QUESTIONS = [
+    "Qual é o investimento inicial disponível?",
+    "Qual o custo estimado do forno?",
+    "Quanto custa o aluguel mensal?",
+    "Qual é a margem de lucro desejada?",
+    "Qual a receita necessária para o ponto de equilíbrio?",
+    "Quem são os fornecedores principais?",
+]
+
+
+def make_pdf(pages: int, seed: int = 0) -> bytes:
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for pno in range(pages):
+        page = doc.new_page()
+        lines = [f"Seção {pno + 1}"]
+        for _ in range(30):
+            topic = rng.choice(_TOPICS)
+            lines.append(f"O item {topic} tem valor estimado de R$ {rng.randint(100, 50000):,} por mês.".replace(",", "."))
+        page.insert_text((50, 60), "\n".join(lines), fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def percentiles(values: Sequence[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+    s = sorted(values)
+
+    def pct(p: float) -> float:
+        return round(s[min(len(s) - 1, int(round(p / 100.0 * (len(s) - 1))))], 4)
+
+    return {"p50": pct(50), "p95": pct(95), "p99": pct(99), "mean": round(sum(s) / len(s), 4)}
+
+
+async def ingest(client: httpx.AsyncClient, api: str, sizes: Sequence[int]) -> List[Dict[str, Any]]:
+    out: List[Dict[str, Any]] = []
+    for i, pages in enumerate(sizes):
+        pdf = make_pdf(pages, seed=i)
+        started = time.perf_counter()
+        r = await client.post(f"{api}/api/documents", files={"files": (f"bench_{pages}p.pdf", pdf, "application/pdf")}, timeout=600)
+        r.raise_for_status()
+        elapsed = time.perf_counter() - started
+        doc = r.json()["documents"][0]
+        out.append({"doc_id": doc["id"], "pages": pages, "seconds": round(elapsed, 4), "pages_per_s": round(pages / elapsed, 2)})
+        print(f"ingested {pages:>4} pages in {elapsed:6.2f}s ({pages / elapsed:.1f} pages/s)")
+    return out
+
+
+async def chat_once(client: httpx.AsyncClient, api: str, question: str, doc_ids: List[str]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    ttft: Optional[float] = None
+    envelope: Dict[str, Any] = {}
+    try:
+        async with client.stream(
+            "POST", f"{api}/api/chat",
+            json={"messages": [{"role": "user", "content": question}], "document_ids": doc_ids, "include_timings": True},
+            timeout=180,
+        ) as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+                body = line[len("data:"):].strip()
+                if body.startswith("{"):
+                    try:
+                        envelope = json.loads(body)
+                    except json.JSONDecodeError:
+                        pass
+    except Exception as e:
+        return {"ok": False, "error": str(e), "seconds": time.perf_counter() - started}
+    return {
+        "ok": True,
+        "seconds": time.perf_counter() - started,
+        "ttft": ttft,
+        "degradations": envelope.get("degradations", []),
+        "timings_ms": envelope.get("timings_ms", {}),
+    }
+
+
+async def run_chats(api: str, doc_ids: List[str], total: int, concurrency: int) -> Dict[str, Any]:
+    sem = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits) as client:
+        async def one(i: int) -> Dict[str, Any]:
+            async with sem:
+                return await chat_once(client, api, _QUESTIONS[i % len(_QUESTIONS)], doc_ids)
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*[one(i) for i in range(total)])
+        wall = time.perf_counter() - started
+
+    ok = [r for r in results if r["ok"]]
+    stages: Dict[str, List[float]] = {}
+    for r in ok:
+        for k, v in (r.get("timings_ms") or {}).items():
+            stages.setdefault(k, []).append(v / 1000.0)
+    degraded = sum(1 for r in ok if r["degradations"])
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": total - len(ok),
+        "degraded": degraded,
+        "wall_s": round(wall, 4),
+        "requests_per_s": round(len(ok) / wall, 3) if wall > 0 else None,
+        "latency_s": percentiles([r["seconds"] for r in ok]),
+        "ttft_s": percentiles([r["ttft"] for r in ok if r["ttft"] is not None]),
+        "stages_s": {k: percentiles(v) for k, v in sorted(stages.items())},
+    }
+
+
+def _spawn_api(port: int, openai_base_url: str) -> subprocess.Popen:
+    env = {**os.environ, "OPENAI_BASE_URL": openai_base_url, "OPENAI_API_KEY": "sk-fake", "LOG_LEVEL": "WARNING"}
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=_BACKEND_DIR, env=env,
+    )
+
+
+async def _wait_ready(api: str, timeout_s: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout_s
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{api}/api/healthz", timeout=2)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"API at {api} did not become healthy within {timeout_s}s")
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    rows = []
+    keys = [
+        ("ingest pages/s", lambda d: d["ingest"]["pages_per_s"]),
+        ("chat req/s", lambda d: d["chat"]["requests_per_s"]),
+        ("chat p50 s", lambda d: d["chat"]["latency_s"]["p50"]),
+        ("chat p95 s", lambda d: d["chat"]["latency_s"]["p95"]),
+        ("chat p99 s", lambda d: d["chat"]["latency_s"]["p99"]),
+        ("ttft p50 s", lambda d: d["chat"]["ttft_s"]["p50"]),
+        ("ttft p95 s", lambda d: d["chat"]["ttft_s"]["p95"]),
+    ]
+    for label, get in keys:
+        try:
+            new, old = get(current), get(baseline)
+        except (KeyError, TypeError):
+            continue
+        if new is None or old in (None, 0):
+            continue
+        rows.append(f"{label:<16} {old:>10.3f} -> {new:>10.3f} ({(new - old) / old * 100.0:+.1f}%)")
+    return rows
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    sizes = [int(x) for x in args.pages.split(",") if x.strip()]
+    fake = FakeOpenAIServer(FakeOpenAIConfig(args.llm_latency, args.llm_jitter, args.accept_rate)).start()
+    proc: Optional[subprocess.Popen] = None
+    api = args.api_url
+    try:
+        if api is None:
+            api = f"http://127.0.0.1:{args.port}"
+            proc = _spawn_api(args.port, fake.base_url)
+        else:
+            print(f"using running API {api}; it must have OPENAI_BASE_URL={fake.base_url}")
+        await _wait_ready(api)
+
+        async with httpx.AsyncClient() as client:
+            docs = await ingest(client, api, sizes)
+        total_pages = sum(d["pages"] for d in docs)
+        total_ingest_s = sum(d["seconds"] for d in docs)
+        chat = await run_chats(api, [d["doc_id"] for d in docs], args.chats, args.concurrency)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+        fake.stop()
+
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "pages": sizes, "chats": args.chats, "concurrency": args.concurrency,
+            "llm_latency_s": args.llm_latency, "llm_jitter_s": args.llm_jitter, "accept_rate": args.accept_rate,
+        },
+        "ingest": {
+            "documents": docs,
+            "pages": total_pages,
+            "seconds": round(total_ingest_s, 4),
+            "pages_per_s": round(total_pages / total_ingest_s, 2) if total_ingest_s > 0 else None,
+        },
+        "chat": chat,
+        "llm_calls": dict(fake.config.calls),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline load benchmark (fake OpenAI server, real API + Postgres).")
+    parser.add_argument("--pages", default="5,25,100", help="comma-separated page counts of the generated PDFs")
+    parser.add_argument("--chats", type=int, default=100, help="total chat requests")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--llm-jitter", type=float, default=0.05)
+    parser.add_argument("--accept-rate", type=float, default=0.7)
+    parser.add_argument("--api-url", default=None, help="benchmark an already running API instead of spawning one")
+    parser.add_argument("--port", type=int, default=8765, help="port for the spawned API")
+    parser.add_argument("--out", default=None, help="results JSON (default evaluation/results/load_<timestamp>.json)")
+    parser.add_argument("--compare", default=None, help="previous results JSON to diff against")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    out = args.out or os.path.join(_BACKEND_DIR, "evaluation", "results", f"load_{datetime.now(timezone.utc):%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+
+    chat = result["chat"]
+    print(f"\ningest: {result['ingest']['pages_per_s']} pages/s")
+    print(f"chat:   {chat['requests_per_s']} req/s, errors {chat['errors']}, degraded {chat['degraded']}")
+    print(f"        latency {chat['latency_s']}")
+    print(f"        ttft    {chat['ttft_s']}")
+    print(f"results written to {out}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\ncompared with {args.compare}:")
+        print("\n".join(compare(result, baseline)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""Golden-set evaluation through POST /api/chat/batch.
+
+Reads a golden set (JSONL: `id`, `input`, `expected_output`, optional `document_ids`), sends the
+questions to the batch endpoint in chunks, and scores the answers. Answers are cached on disk, keyed by
+question, document set and `--tag`: a re-run only asks the API for new or changed questions. Bump
+`--tag` (e.g. to the git revision) or pass `--refresh` after changing the pipeline.
+
+Scores:
+    figures   share of the numbers in `expected_output` (R$ amounts, percentages...) found in the answer;
+              offline and free, a rough check for a finance-heavy golden set
+    deepeval  with `--deepeval`: AnswerRelevancy and Faithfulness (needs `deepeval` and OPENAI_API_KEY);
+              scores are cached with the answer they were computed for
+
+Writes the per-question rows and a summary to evaluation/results/eval_<timestamp>.json.
+
+    python -m evaluation.run --api-url http://localhost:8080 --document-ids <uuid>
+    python -m evaluation.run --golden my_golden.jsonl --tag $(git rev-parse --short HEAD) --deepeval
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import httpx
+
+from .load_benchmark import percentiles
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_EVAL_DIR = os.path.join(_BACKEND_DIR, "evaluation")
+DEFAULT_GOLDEN = os.path.join(_EVAL_DIR, "golden.jsonl")
+DEFAULT_CACHE = os.path.join(_EVAL_DIR, "results", "answer_cache.json")
+
+_NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)*")
+
+
+def load_golden(path: str) -> List[Dict[str, Any]]:
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            item.setdefault("id", f"q{n}")
+            items.append(item)
+    return items
+
+
+def cache_key(question: str, document_ids: Sequence[str], tag: str) -> str:
+    raw = json.dumps({"q": question.strip(), "docs": sorted(document_ids), "tag": tag}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def load_cache(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_cache(path: str, cache: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def figure_recall(expected: str, answer: str) -> Optional[float]:
+    """Share of the numbers in `expected` that also appear in `answer`; None when `expected` has none."""
+    def norm(text: str) -> set:
+        return {m.replace(".", "").replace(",", "") for m in _NUMBER_RE.findall(text)}
+
+    wanted = norm(expected)
+    if not wanted:
+        return None
+    return len(wanted & norm(answer)) / len(wanted)
+
+
+def plan(items: List[Dict[str, Any]], default_docs: Sequence[str], tag: str, cache: Dict[str, Any],
+         refresh: bool) -> Tuple[List[Tuple[Dict[str, Any], str]], Dict[Tuple[str, ...], List[Tuple[Dict[str, Any], str]]]]:
+    """All (item, key) pairs, and the cache misses grouped by document set (one batch endpoint call covers one set)."""
+    keyed = []
+    misses: Dict[Tuple[str, ...], List[Tuple[Dict[str, Any], str]]] = {}
+    for item in items:
+        docs = tuple(sorted(item.get("document_ids") or default_docs))
+        key = cache_key(item["input"], docs, tag)
+        keyed.append((item, key))
+        if refresh or key not in cache:
+            misses.setdefault(docs, []).append((item, key))
+    return keyed, misses
+
+
+async def fetch_answers(client: httpx.AsyncClient, api: str, docs: Sequence[str], pending: List[Tuple[Dict[str, Any], str]],
+                        cache: Dict[str, Any], batch_size: int, cache_path: str) -> None:
+    for start in range(0, len(pending), batch_size):
+        chunk = pending[start:start + batch_size]
+        r = await client.post(f"{api}/api/chat/batch", json={
+            "questions": [item["input"] for item, _ in chunk],
+            "document_ids": list(docs) or None,
+            "include_context": True,
+        })
+        r.raise_for_status()
+        body = r.json()
+        for (item, key), res in zip(chunk, body["results"]):
+            if "error" in res:
+                # Not cached: retried on the next run
+                print(f"  {item['id']}: error {res['error']}")
+                continue
+            cache[key] = {
+                "question": item["input"],
+                "answer": res.get("answer", ""),
+                "contexts": res.get("contexts", []),
+                "citations": res.get("citations", []),
+                "degradations": res.get("degradations", []),
+                "elapsed_ms": res.get("elapsed_ms"),
+                "timings_ms": res.get("timings_ms", {}),
+                "scores": {},
+            }
+        save_cache(cache_path, cache)
+        print(f"  fetched {min(start + batch_size, len(pending))}/{len(pending)} ({body.get('elapsed_ms')} ms for {len(chunk)})")
+
+
+def deepeval_scores(item: Dict[str, Any], entry: Dict[str, Any]) -> Dict[str, float]:
+    from deepeval.metrics import AnswerRelevancyMetric, FaithfulnessMetric
+    from deepeval.test_case import LLMTestCase
+
+    case = LLMTestCase(
+        input=item["input"], actual_output=entry["answer"], expected_output=item.get("expected_output"),
+        retrieval_context=entry.get("contexts") or [""],
+    )
+    scores = {}
+    for metric in (AnswerRelevancyMetric(threshold=0.7), FaithfulnessMetric(threshold=0.7)):
+        metric.measure(case)
+        scores[type(metric).__name__] = float(metric.score)
+    return scores
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    items = load_golden(args.golden)
+    default_docs = [d for d in (args.document_ids or os.getenv("EVAL_DOCUMENT_ID", "")).split(",") if d.strip()]
+    cache = load_cache(args.cache)
+    keyed, misses = plan(items, default_docs, args.tag, cache, args.refresh)
+    fetched = sum(len(v) for v in misses.values())
+    print(f"{len(items)} questions, {len(items) - fetched} cached, {fetched} to ask")
+
+    api = args.api_url.rstrip("/")
+    async with httpx.AsyncClient(timeout=args.timeout) as client:
+        for docs, pending in misses.items():
+            await fetch_answers(client, api, docs, pending, cache, args.batch_size, args.cache)
+
+    rows = []
+    for item, key in keyed:
+        entry = cache.get(key)
+        if entry is None:
+            rows.append({"id": item["id"], "question": item["input"], "error": "no answer"})
+            continue
+        if args.deepeval:
+            # Scores belong to one (answer, expected) pair; recomputed only when either changes
+            score_key = hashlib.sha256((entry["answer"] + "\0" + item.get("expected_output", "")).encode()).hexdigest()[:16]
+            if entry["scores"].get("key") != score_key:
+                entry["scores"] = {"key": score_key, **await asyncio.to_thread(deepeval_scores, item, entry)}
+        rows.append({
+            "id": item["id"],
+            "question": item["input"],
+            "answer": entry["answer"],
+            "figures": figure_recall(item.get("expected_output", ""), entry["answer"]),
+            "scores": {k: v for k, v in entry["scores"].items() if k != "key"},
+            "elapsed_ms": entry.get("elapsed_ms"),
+            "degradations": entry.get("degradations", []),
+        })
+    if args.deepeval:
+        save_cache(args.cache, cache)
+
+    figures = [r["figures"] for r in rows if r.get("figures") is not None]
+    lat = percentiles([r["elapsed_ms"] for r in rows if r.get("elapsed_ms") is not None])
+    summary: Dict[str, Any] = {
+        "questions": len(items),
+        "asked": fetched,
+        "cached": len(items) - fetched,
+        "failed": sum(1 for r in rows if "error" in r),
+        "figures_mean": round(sum(figures) / len(figures), 3) if figures else None,
+        "latency_ms": lat,
+    }
+    metric_names = sorted({k for r in rows for k in r.get("scores", {})})
+    for name in metric_names:
+        vals = [r["scores"][name] for r in rows if name in r.get("scores", {})]
+        summary[f"{name}_mean"] = round(sum(vals) / len(vals), 3)
+    return {"summary": summary, "rows": rows}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Evaluate a golden set through /api/chat/batch, with answer caching.")
+    parser.add_argument("--api-url", default=os.getenv("EVAL_API_URL", "http://localhost:8080"))
+    parser.add_argument("--golden", default=DEFAULT_GOLDEN)
+    parser.add_argument("--document-ids", default=None, help="comma-separated; default EVAL_DOCUMENT_ID")
+    parser.add_argument("--tag", default=os.getenv("EVAL_TAG", ""), help="part of the cache key, e.g. a git revision")
+    parser.add_argument("--cache", default=DEFAULT_CACHE)
+    parser.add_argument("--refresh", action="store_true", help="ask every question again")
+    parser.add_argument("--batch-size", type=int, default=50, help="questions per /api/chat/batch call")
+    parser.add_argument("--timeout", type=float, default=900.0, help="seconds per batch call")
+    parser.add_argument("--deepeval", action="store_true", help="also score with deepeval (LLM calls, cached)")
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print(json.dumps(result["summary"], indent=2))
+    result.update({"created_at": datetime.now(timezone.utc).isoformat(), "config": vars(args)})
+    out = args.out or os.path.join(_EVAL_DIR, "results", f"eval_{datetime.now(timezone.utc):%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    print(f"\nresults written to {out}")
+
+
+if __name__ == "__main__":
+    main()
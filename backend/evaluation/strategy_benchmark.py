@@ -0,0 +1,155 @@
+"""Candidate selection strategies: sequential 3-page batches vs one selection call.
+
+Runs orchestrate_chat in-process for the same questions under RAG_SELECTION_STRATEGY=batches and
+RAG_SELECTION_STRATEGY=select, against the fake OpenAI server (evaluation/fake_openai.py). Page search
+is replaced by a synthetic pool of 15 candidates per question; the page that answers carries a marker
+the fake server looks for, so its decisions are "correct" and only the call pattern differs:
+
+    batches   up to 5 structured calls over 3 pages each; the accepting call's text is the answer
+    select    one call over short excerpts of all 15 pages, then one synthesis over the chosen ones
+
+The answer page is placed at every pool position (and left out once, which forces the
+"not in the documents" path). Reports LLM chat calls per question, latency p50/p95 and how many
+pages end up cited. Latency per call is `--llm-latency` plus `--latency-per-kchar` per 1000 prompt
+characters, since the selection prompt is several times longer than a batch prompt.
+No database and no network needed.
+
+    python -m evaluation.strategy_benchmark --llm-latency 0.8 --latency-per-kchar 0.02 --rounds 3
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+from unittest.mock import patch
+
+from .fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+from .load_benchmark import percentiles
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MARKER = "RESPOSTA-VERIFICADA"
+POOL_SIZE = 15
+STRATEGIES = ("batches", "select")
+_FILLER = (
+    "O plano de negócios descreve o investimento inicial, o aluguel mensal, os fornecedores e a "
+    "margem de lucro esperada para a padaria no primeiro ano de operação."
+)
+
+
+def make_pool(answer_at: Optional[int], size: int = POOL_SIZE) -> List[Dict[str, Any]]:
+    """`size` candidate pages by descending similarity; page `answer_at` (0-based) contains MARKER."""
+    pool = []
+    for i in range(size):
+        content = f"Página {i + 1}. {_FILLER}"
+        if i == answer_at:
+            content += f" O custo do forno é R$ 18.000 ({MARKER})."
+        pool.append({
+            "id": f"p{i + 1}", "document_id": "bench-doc", "page_number": i + 1, "title": "Plano de negócios",
+            "content": content, "similarity": round(0.9 - 0.01 * i, 3), "image_urls": [],
+        })
+    return pool
+
+
+@asynccontextmanager
+async def _no_db():
+    yield None
+
+
+def _fake_ann(pool: List[Dict[str, Any]]) -> Any:
+    async def ann(*_args: Any, **_kwargs: Any) -> List[Dict[str, Any]]:
+        return [dict(p) for p in pool]
+    return ann
+
+
+async def _no_stale(*_args: Any, **_kwargs: Any) -> List[Dict[str, Any]]:
+    return []
+
+
+async def run_strategy(strategy: str, server: FakeOpenAIServer, positions: Sequence[Optional[int]], rounds: int) -> Dict[str, Any]:
+    from app.config import settings
+    from app.services import orchestrator
+    from app.services.deadline import Deadline
+    from app.services.llm import LLMClient
+
+    client = LLMClient()
+    client.api_key = "sk-fake"
+    client.base_url = server.base_url
+    latencies: List[float] = []
+    calls: List[int] = []
+    cited: List[int] = []
+    answered = 0
+    try:
+        for _ in range(rounds):
+            for pos in positions:
+                before = server.config.calls["chat"]
+                with patch.object(settings, "rag_selection_strategy", strategy), \
+                     patch.object(settings, "web_search_enabled", False), \
+                     patch.object(orchestrator, "llm_client", client), \
+                     patch.object(orchestrator, "session_scope", _no_db), \
+                     patch.object(orchestrator, "ann_search_pages", _fake_ann(make_pool(pos))), \
+                     patch.object(orchestrator, "fetch_pages_basic", _no_stale):
+                    started = time.perf_counter()
+                    _tokens, env = await orchestrator.orchestrate_chat(
+                        "Qual é o custo do forno?", doc_ids=["bench-doc"], force_web=False, deadline=Deadline(budget_s=120),
+                    )
+                    latencies.append(time.perf_counter() - started)
+                calls.append(server.config.calls["chat"] - before)
+                pages = [c["page"] for c in env["citations"] if c["kind"] == "doc"]
+                cited.append(len(pages))
+                if pos is not None and pos + 1 in pages:
+                    answered += 1
+    finally:
+        await client.aclose()
+    lat = percentiles(latencies)
+    answerable = sum(1 for p in positions if p is not None) * rounds
+    return {
+        "strategy": strategy,
+        "questions": len(latencies),
+        "chat_calls_mean": round(sum(calls) / len(calls), 2),
+        "chat_calls_max": max(calls),
+        "latency_p50_s": round(lat["p50"], 3),
+        "latency_p95_s": round(lat["p95"], 3),
+        "pages_cited_mean": round(sum(cited) / len(cited), 2),
+        "answer_page_cited": f"{answered}/{answerable}",
+    }
+
+
+async def run(llm_latency: float, latency_per_kchar: float, rounds: int) -> Dict[str, Any]:
+    positions: List[Optional[int]] = list(range(POOL_SIZE)) + [None]
+    cfg = FakeOpenAIConfig(latency_s=llm_latency, answer_marker=MARKER, latency_per_kchar_s=latency_per_kchar)
+    results = []
+    with FakeOpenAIServer(cfg) as server:
+        for strategy in STRATEGIES:
+            row = await run_strategy(strategy, server, positions, rounds)
+            results.append(row)
+            print(f"  {row}")
+    return {"strategies": results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="LLM calls and latency per question: batches vs single selection call.")
+    parser.add_argument("--llm-latency", type=float, default=0.8, help="seconds per chat call")
+    parser.add_argument("--latency-per-kchar", type=float, default=0.02, help="extra seconds per 1000 prompt characters")
+    parser.add_argument("--rounds", type=int, default=1, help="passes over the answer positions")
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    from app.logging_setup import setup_logging
+    setup_logging("WARNING")
+    print(f"llm_latency={args.llm_latency}s latency_per_kchar={args.latency_per_kchar}s pool={POOL_SIZE}")
+    result = asyncio.run(run(args.llm_latency, args.latency_per_kchar, args.rounds))
+    result.update({"created_at": datetime.now(timezone.utc).isoformat(), "config": vars(args)})
+    out = args.out or os.path.join(_BACKEND_DIR, "evaluation", "results", f"strategies_{datetime.now(timezone.utc):%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nresults written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0002_pagination_indexes'
+down_revision = '0001_init'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Keyset pagination over documents (created_at DESC, id DESC)
+    op.create_index('idx_documents_created_at_id', 'documents', ['created_at', 'id'], unique=False)
+    # Image lookups/aggregation by page; the FK alone does not create an index in Postgres.
+    # Page listings by (document_id, page_number) are served by uq_document_pages_document_page.
+    op.create_index('idx_document_page_images_page', 'document_page_images', ['document_page_id', 'created_at'], unique=False)
+
+def downgrade():
+    op.drop_index('idx_document_page_images_page', table_name='document_page_images')
+    op.drop_index('idx_documents_created_at_id', table_name='documents')
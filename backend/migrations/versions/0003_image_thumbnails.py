@@ -0,0 +1,17 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0003_image_thumbnails'
+down_revision = '0002_pagination_indexes'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Images ingested before this revision keep NULL thumbnails; clients fall back to file_url.
+    op.add_column('document_page_images', sa.Column('thumbnail_url', sa.Text(), nullable=True))
+    op.add_column('document_page_images', sa.Column('thumbnail_dimensions', sa.dialects.postgresql.JSONB(), nullable=True))
+
+def downgrade():
+    op.drop_column('document_page_images', 'thumbnail_dimensions')
+    op.drop_column('document_page_images', 'thumbnail_url')
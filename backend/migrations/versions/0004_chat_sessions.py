@@ -0,0 +1,19 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0004_chat_sessions'
+down_revision = '0003_image_thumbnails'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('chat_entries', sa.Column('session_id', sa.dialects.postgresql.UUID(as_uuid=True), nullable=True))
+    op.add_column('chat_entries', sa.Column('meta', sa.dialects.postgresql.JSONB(), nullable=True))
+    # History loads read the latest N entries of one session
+    op.create_index('idx_chat_entries_session_created', 'chat_entries', ['session_id', 'created_at'], unique=False)
+
+def downgrade():
+    op.drop_index('idx_chat_entries_session_created', table_name='chat_entries')
+    op.drop_column('chat_entries', 'meta')
+    op.drop_column('chat_entries', 'session_id')
@@ -0,0 +1,42 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0005_embedding_model_tracking'
+down_revision = '0004_chat_sessions'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('document_pages', sa.Column('embedding_model', sa.Text(), nullable=True))
+    op.add_column('document_pages', sa.Column('embedding_version', sa.Integer(), nullable=True))
+    op.add_column('document_pages', sa.Column('embedded_at', sa.DateTime(timezone=True), nullable=True))
+    # Vectors written before this revision came from the only model the API client used.
+    # Stub (no API key) vectors can't be told apart here; re-run the backfill if any were stored.
+    op.execute(
+        "UPDATE document_pages SET embedding_model = 'text-embedding-3-large', embedding_version = 1, embedded_at = created_at "
+        "WHERE embedding IS NOT NULL"
+    )
+    # Backfill scans pages by id in batches; ANN filters by (model, version) within a document
+    op.create_index('idx_document_pages_embedding_model', 'document_pages', ['document_id', 'embedding_model', 'embedding_version'], unique=False)
+
+    # One checkpoint row per (model, version) backfill run
+    op.create_table(
+        'embedding_backfill_jobs',
+        sa.Column('id', sa.Text(), primary_key=True),
+        sa.Column('embedding_model', sa.Text(), nullable=False),
+        sa.Column('embedding_version', sa.Integer(), nullable=False),
+        sa.Column('last_page_id', sa.dialects.postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('processed', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('failed', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('status', sa.Text(), nullable=False, server_default='running'),
+        sa.Column('started_at', sa.DateTime(timezone=True), server_default=sa.text('NOW()'), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('NOW()'), nullable=False),
+    )
+
+def downgrade():
+    op.drop_table('embedding_backfill_jobs')
+    op.drop_index('idx_document_pages_embedding_model', table_name='document_pages')
+    op.drop_column('document_pages', 'embedded_at')
+    op.drop_column('document_pages', 'embedding_version')
+    op.drop_column('document_pages', 'embedding_model')
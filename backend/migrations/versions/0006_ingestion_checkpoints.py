@@ -0,0 +1,35 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0006_ingestion_checkpoints'
+down_revision = '0005_embedding_model_tracking'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Existing documents were ingested in one transaction, so they are complete
+    op.add_column('documents', sa.Column('status', sa.Text(), nullable=False, server_default='ready'))
+    op.add_column('documents', sa.Column('pages_ingested', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('documents', sa.Column('content_sha256', sa.Text(), nullable=True))
+    op.add_column('documents', sa.Column('error', sa.Text(), nullable=True))
+    op.add_column('documents', sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('now()')))
+    op.execute("UPDATE documents SET pages_ingested = page_count")
+    op.create_check_constraint('ck_documents_status', 'documents', "status IN ('ingesting', 'ready', 'failed')")
+    # Resume lookups: same file, not finished
+    op.create_index(
+        'idx_documents_sha_unfinished', 'documents', ['content_sha256'], unique=False,
+        postgresql_where=sa.text("status <> 'ready'"),
+    )
+    # Resume deletes/reads pages of one document past the checkpoint
+    op.create_index('idx_document_pages_doc_page', 'document_pages', ['document_id', 'page_number'], unique=False)
+
+def downgrade():
+    op.drop_index('idx_document_pages_doc_page', table_name='document_pages')
+    op.drop_index('idx_documents_sha_unfinished', table_name='documents')
+    op.drop_constraint('ck_documents_status', 'documents', type_='check')
+    op.drop_column('documents', 'updated_at')
+    op.drop_column('documents', 'error')
+    op.drop_column('documents', 'content_sha256')
+    op.drop_column('documents', 'pages_ingested')
+    op.drop_column('documents', 'status')
@@ -0,0 +1,39 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0007_document_summaries'
+down_revision = '0006_ingestion_checkpoints'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # One routing vector per document: the sum of its page vectors for one (model, version).
+    # Same direction as the centroid and cosine ignores scale, so chunks can be added incrementally.
+    op.create_table(
+        'document_summaries',
+        sa.Column('document_id', sa.dialects.postgresql.UUID(as_uuid=True), sa.ForeignKey('documents.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('embedding_model', sa.Text(), nullable=False),
+        sa.Column('embedding_version', sa.Integer(), nullable=False),
+        sa.Column('pages', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('NOW()'), nullable=False),
+    )
+    op.execute('ALTER TABLE document_summaries ADD COLUMN embedding vector(3072) NOT NULL')
+    # HNSW can't index vector(3072) directly; halfvec supports up to 4000 dims (pgvector >= 0.7)
+    op.execute(
+        'CREATE INDEX idx_document_summaries_embedding ON document_summaries '
+        'USING hnsw ((embedding::halfvec(3072)) halfvec_cosine_ops)'
+    )
+    # Backfill from pages already stored, using each document's dominant (model, version)
+    op.execute("""
+        INSERT INTO document_summaries (document_id, embedding, embedding_model, embedding_version, pages)
+        SELECT DISTINCT ON (document_id) document_id, sum(embedding), embedding_model, embedding_version, count(*)
+        FROM document_pages
+        WHERE embedding IS NOT NULL AND embedding_model IS NOT NULL
+        GROUP BY document_id, embedding_model, embedding_version
+        ORDER BY document_id, count(*) DESC
+    """)
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS idx_document_summaries_embedding')
+    op.drop_table('document_summaries')
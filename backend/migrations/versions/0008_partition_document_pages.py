@@ -0,0 +1,136 @@
+from alembic import op
+import os
+from app.partitioning import DEFAULT_PARTITIONS, concurrent_constraint, concurrent_index, create_partitioned_table
+
+# revision identifiers, used by Alembic.
+revision = '0008_partition_document_pages'
+down_revision = '0007_document_summaries'
+branch_labels = None
+depends_on = None
+
+# Hash-partition pages and images by document_id (see app/partitioning.py). The partition count is
+# fixed at migration time; choose it for the expected corpus (e.g. ~100k-1M pages per partition).
+PARTITIONS = int(os.getenv("DOCUMENT_PAGES_PARTITIONS", str(DEFAULT_PARTITIONS)))
+
+_PAGE_COLUMNS = """
+    id uuid NOT NULL DEFAULT uuid_generate_v4(),
+    document_id uuid NOT NULL,
+    page_number integer NOT NULL,
+    content text,
+    embedding vector(3072),
+    created_at timestamptz NOT NULL DEFAULT now(),
+    embedding_model text,
+    embedding_version integer,
+    embedded_at timestamptz
+"""
+_PAGE_COPY = "id, document_id, page_number, content, embedding, created_at, embedding_model, embedding_version, embedded_at"
+
+# Images carry document_id so they are partitioned (and pruned) with their pages
+_IMAGE_COLUMNS = """
+    id uuid NOT NULL DEFAULT uuid_generate_v4(),
+    document_id uuid NOT NULL,
+    document_page_id uuid NOT NULL,
+    position jsonb,
+    file_url text NOT NULL,
+    dimensions jsonb,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    thumbnail_url text,
+    thumbnail_dimensions jsonb
+"""
+_IMAGE_COPY = "id, document_page_id, position, file_url, dimensions, created_at, thumbnail_url, thumbnail_dimensions"
+
+
+def _run(stmts):
+    for stmt in stmts:
+        op.execute(stmt)
+
+
+def upgrade():
+    # 1. Swap in the partitioned tables (one transaction; run with the API stopped)
+    op.execute('ALTER TABLE document_page_images RENAME TO document_page_images_unpartitioned')
+    op.execute('ALTER TABLE document_pages RENAME TO document_pages_unpartitioned')
+    _run(create_partitioned_table('document_pages', _PAGE_COLUMNS, 'document_id', PARTITIONS))
+    _run(create_partitioned_table('document_page_images', _IMAGE_COLUMNS, 'document_id', PARTITIONS))
+    op.execute(f'INSERT INTO document_pages ({_PAGE_COPY}) SELECT {_PAGE_COPY} FROM document_pages_unpartitioned')
+    op.execute(f"""
+        INSERT INTO document_page_images (document_id, {_IMAGE_COPY})
+        SELECT p.document_id, {', '.join('i.' + c.strip() for c in _IMAGE_COPY.split(','))}
+        FROM document_page_images_unpartitioned i
+        JOIN document_pages_unpartitioned p ON p.id = i.document_page_id
+    """)
+    op.execute('DROP TABLE document_page_images_unpartitioned')
+    op.execute('DROP TABLE document_pages_unpartitioned')
+    op.execute(
+        'ALTER TABLE document_pages ADD CONSTRAINT document_pages_document_id_fkey '
+        'FOREIGN KEY (document_id) REFERENCES documents(id) ON DELETE CASCADE'
+    )
+
+    # 2. Keys and indexes, built per partition with CONCURRENTLY (reads keep working meanwhile).
+    #    Primary keys must include the partition key.
+    with op.get_context().autocommit_block():
+        _run(concurrent_constraint('document_pages', 'document_pages_pkey', 'PRIMARY KEY', 'id, document_id', PARTITIONS))
+        _run(concurrent_constraint(
+            'document_pages', 'uq_document_pages_document_page', 'UNIQUE', 'document_id, page_number', PARTITIONS,
+        ))
+        _run(concurrent_index(
+            'document_pages', 'idx_document_pages_embedding_model', 'document_id, embedding_model, embedding_version', PARTITIONS,
+        ))
+        _run(concurrent_constraint('document_page_images', 'document_page_images_pkey', 'PRIMARY KEY', 'id, document_id', PARTITIONS))
+        _run(concurrent_index(
+            'document_page_images', 'idx_document_page_images_page', 'document_id, document_page_id, created_at', PARTITIONS,
+        ))
+
+    op.execute(
+        'ALTER TABLE document_page_images ADD CONSTRAINT document_page_images_document_page_id_fkey '
+        'FOREIGN KEY (document_page_id, document_id) REFERENCES document_pages(id, document_id) ON DELETE CASCADE'
+    )
+
+
+def downgrade():
+    op.execute("""
+        CREATE TABLE document_pages_unpartitioned (
+            id uuid PRIMARY KEY DEFAULT uuid_generate_v4(),
+            document_id uuid NOT NULL,
+            page_number integer NOT NULL,
+            content text,
+            embedding vector(3072),
+            created_at timestamptz NOT NULL DEFAULT now(),
+            embedding_model text,
+            embedding_version integer,
+            embedded_at timestamptz
+        )
+    """)
+    op.execute("""
+        CREATE TABLE document_page_images_unpartitioned (
+            id uuid PRIMARY KEY DEFAULT uuid_generate_v4(),
+            document_page_id uuid NOT NULL,
+            position jsonb,
+            file_url text NOT NULL,
+            dimensions jsonb,
+            created_at timestamptz NOT NULL DEFAULT now(),
+            thumbnail_url text,
+            thumbnail_dimensions jsonb
+        )
+    """)
+    op.execute(f'INSERT INTO document_pages_unpartitioned ({_PAGE_COPY}) SELECT {_PAGE_COPY} FROM document_pages')
+    op.execute(f'INSERT INTO document_page_images_unpartitioned ({_IMAGE_COPY}) SELECT {_IMAGE_COPY} FROM document_page_images')
+    op.execute('DROP TABLE document_page_images')
+    op.execute('DROP TABLE document_pages')
+    # Constraint/index names are free again; restore them as 0001-0006 created them
+    op.execute('ALTER TABLE document_pages_unpartitioned RENAME TO document_pages')
+    op.execute('ALTER INDEX document_pages_unpartitioned_pkey RENAME TO document_pages_pkey')
+    op.execute('ALTER TABLE document_page_images_unpartitioned RENAME TO document_page_images')
+    op.execute('ALTER INDEX document_page_images_unpartitioned_pkey RENAME TO document_page_images_pkey')
+    op.execute(
+        'ALTER TABLE document_pages ADD CONSTRAINT document_pages_document_id_fkey '
+        'FOREIGN KEY (document_id) REFERENCES documents(id) ON DELETE CASCADE'
+    )
+    op.execute('ALTER TABLE document_pages ADD CONSTRAINT uq_document_pages_document_page UNIQUE (document_id, page_number)')
+    op.execute(
+        'ALTER TABLE document_page_images ADD CONSTRAINT document_page_images_document_page_id_fkey '
+        'FOREIGN KEY (document_page_id) REFERENCES document_pages(id) ON DELETE CASCADE'
+    )
+    op.create_index('idx_document_pages_doc', 'document_pages', ['document_id'], unique=False)
+    op.create_index('idx_document_pages_embedding_model', 'document_pages', ['document_id', 'embedding_model', 'embedding_version'], unique=False)
+    op.create_index('idx_document_pages_doc_page', 'document_pages', ['document_id', 'page_number'], unique=False)
+    op.create_index('idx_document_page_images_page', 'document_page_images', ['document_page_id', 'created_at'], unique=False)
@@ -0,0 +1,41 @@
+from alembic import op
+import sqlalchemy as sa
+from app.partitioning import concurrent_index, partition_name
+
+# revision identifiers, used by Alembic.
+revision = '0009_page_minhash'
+down_revision = '0008_partition_document_pages'
+branch_labels = None
+depends_on = None
+
+# MinHash signatures for near-duplicate detection (app/services/near_dup.py). minhash_bands holds one
+# hash per LSH band; the GIN index serves `minhash_bands && :bands` candidate lookups at ingest.
+# Existing pages are signed by `python -m app.services.near_dup backfill`.
+
+
+def _run(stmts):
+    for stmt in stmts:
+        op.execute(stmt)
+
+
+def _partitions() -> int:
+    # Whatever 0008 created (DOCUMENT_PAGES_PARTITIONS may have changed since)
+    return op.get_bind().execute(sa.text(
+        "SELECT count(*) FROM pg_inherits WHERE inhparent = 'document_pages'::regclass"
+    )).scalar_one()
+
+
+def upgrade():
+    op.execute('ALTER TABLE document_pages ADD COLUMN minhash bytea')
+    op.execute('ALTER TABLE document_pages ADD COLUMN minhash_bands bigint[]')
+    partitions = _partitions()
+    with op.get_context().autocommit_block():
+        _run(concurrent_index('document_pages', 'idx_document_pages_minhash_bands', 'minhash_bands', partitions, using='gin'))
+
+
+def downgrade():
+    partitions = _partitions()
+    op.execute('DROP INDEX IF EXISTS idx_document_pages_minhash_bands')
+    _run([f'DROP INDEX IF EXISTS {partition_name("idx_document_pages_minhash_bands", r)}' for r in range(partitions)])
+    op.execute('ALTER TABLE document_pages DROP COLUMN minhash_bands')
+    op.execute('ALTER TABLE document_pages DROP COLUMN minhash')
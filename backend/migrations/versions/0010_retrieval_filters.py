@@ -0,0 +1,58 @@
+from alembic import op
+import sqlalchemy as sa
+from app.partitioning import concurrent_index, partition_name
+
+# revision identifiers, used by Alembic.
+revision = '0010_retrieval_filters'
+down_revision = '0009_page_minhash'
+branch_labels = None
+depends_on = None
+
+# Filterable metadata for scoped retrieval (ChatRequest.filters, see ranking.filter_clause):
+# documents.tags (GIN), documents.title (trigram GIN for ILIKE), document_pages.has_images.
+# Upload date ranges use idx_documents_created_at_id (0002), page ranges uq_document_pages_document_page.
+
+
+def _run(stmts):
+    for stmt in stmts:
+        op.execute(stmt)
+
+
+def _partitions() -> int:
+    return op.get_bind().execute(sa.text(
+        "SELECT count(*) FROM pg_inherits WHERE inhparent = 'document_pages'::regclass"
+    )).scalar_one()
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute("ALTER TABLE documents ADD COLUMN tags text[] NOT NULL DEFAULT '{}'")
+    op.execute('ALTER TABLE document_pages ADD COLUMN has_images boolean NOT NULL DEFAULT false')
+    op.execute("""
+        UPDATE document_pages dp SET has_images = true
+        WHERE EXISTS (SELECT 1 FROM document_page_images i WHERE i.document_id = dp.document_id AND i.document_page_id = dp.id)
+    """)
+    partitions = _partitions()
+    with op.get_context().autocommit_block():
+        op.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_documents_tags ON documents USING gin (tags)')
+        op.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_documents_title_trgm ON documents USING gin (title gin_trgm_ops)')
+        # Partial: "pages with images" is the selective side; the rest is served by the page-range key
+        _run(concurrent_index(
+            'document_pages', 'idx_document_pages_with_images', 'document_id, page_number', partitions, where='has_images',
+        ))
+        # Exact-distance ANN scans only embedded, current-model pages of the scoped documents, often within a page range
+        _run(concurrent_index(
+            'document_pages', 'idx_document_pages_ann_scope', 'document_id, embedding_model, embedding_version, page_number',
+            partitions, where='embedding IS NOT NULL',
+        ))
+
+
+def downgrade():
+    partitions = _partitions()
+    for name in ('idx_document_pages_ann_scope', 'idx_document_pages_with_images'):
+        op.execute(f'DROP INDEX IF EXISTS {name}')
+        _run([f'DROP INDEX IF EXISTS {partition_name(name, r)}' for r in range(partitions)])
+    op.execute('DROP INDEX IF EXISTS idx_documents_title_trgm')
+    op.execute('DROP INDEX IF EXISTS idx_documents_tags')
+    op.execute('ALTER TABLE document_pages DROP COLUMN has_images')
+    op.execute('ALTER TABLE documents DROP COLUMN tags')
@@ -0,0 +1,110 @@
+from __future__ import annotations
+import asyncio
+import time
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from app.admission import AdmissionMiddleware, TokenBucket
+
+
+def _app(delay: float = 0.0, **kwargs) -> Starlette:
+    async def chat(_request):
+        await asyncio.sleep(delay)
+        return JSONResponse({"ok": True})
+
+    app = Starlette(routes=[
+        Route("/api/chat", chat, methods=["POST"]),
+        Route("/api/chat/batch", chat, methods=["POST"]),
+        Route("/api/healthz", chat),
+    ])
+    app.add_middleware(AdmissionMiddleware, **kwargs)
+    return app
+
+
+def _client(app: Starlette, ip: str = "10.0.0.1") -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app, client=(ip, 1234)), base_url="http://test")
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_limits_per_client():
+    app = _app(rate_per_5min=300, burst=3, max_concurrent=0)
+    async with _client(app) as a, _client(app, "10.0.0.2") as b:
+        codes = [(await a.post("/api/chat")).status_code for _ in range(4)]
+        assert codes == [200, 200, 200, 429]
+        r = await a.post("/api/chat")
+        assert r.status_code == 429 and int(r.headers["retry-after"]) >= 1
+        # Another client has its own bucket; other paths aren't limited
+        assert (await b.post("/api/chat")).status_code == 200
+        assert (await a.get("/api/healthz")).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_api_key_is_the_client_identity():
+    app = _app(rate_per_5min=300, burst=1, max_concurrent=0, api_keys="k1, k2")
+    async with _client(app, "10.0.0.1") as a, _client(app, "10.0.0.2") as b:
+        assert (await a.post("/api/chat", headers={"X-API-Key": "k1"})).status_code == 200
+        assert (await b.post("/api/chat", headers={"X-API-Key": "k1"})).status_code == 429
+        assert (await b.post("/api/chat", headers={"Authorization": "Bearer k2"})).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_unknown_credentials_do_not_get_a_fresh_bucket():
+    app = _app(rate_per_5min=300, burst=1, max_concurrent=0, api_keys="k1")
+    async with _client(app) as c:
+        assert (await c.post("/api/chat", headers={"X-API-Key": "random-1"})).status_code == 200
+        # A new made-up key per request still lands in the same per-IP bucket
+        assert (await c.post("/api/chat", headers={"X-API-Key": "random-2"})).status_code == 429
+        assert (await c.post("/api/chat", headers={"Authorization": "Bearer random-3"})).status_code == 429
+
+
+@pytest.mark.asyncio
+async def test_batch_is_charged_its_concurrency():
+    app = _app(rate_per_5min=300, burst=5, max_concurrent=0, batch_cost=4)
+    async with _client(app) as c:
+        assert (await c.post("/api/chat/batch")).status_code == 200
+        # 1 token left: a single chat fits, another batch does not
+        assert (await c.post("/api/chat/batch")).status_code == 429
+        assert (await c.post("/api/chat")).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_batch_holds_several_pipeline_slots():
+    app = _app(delay=0.3, rate_per_5min=0, max_concurrent=4, queue_size=0, queue_timeout_s=1.0, batch_cost=3)
+    async with _client(app) as c:
+        batch = asyncio.create_task(c.post("/api/chat/batch"))
+        await asyncio.sleep(0.1)
+        # 3 of 4 slots are taken: one chat runs, the next finds no slot and no queue
+        results = await asyncio.gather(c.post("/api/chat"), c.post("/api/chat"))
+        assert sorted(r.status_code for r in results) == [200, 503]
+        assert (await batch).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_concurrency_cap_queues_then_sheds_load():
+    app = _app(delay=0.2, rate_per_5min=0, max_concurrent=2, queue_size=2, queue_timeout_s=1.0)
+    async with _client(app) as c:
+        results = await asyncio.gather(*[c.post("/api/chat") for _ in range(6)])
+    codes = sorted(r.status_code for r in results)
+    # 2 run, 2 wait for a slot and then run, 2 find the queue full
+    assert codes == [200, 200, 200, 200, 503, 503]
+    assert all("retry-after" in r.headers for r in results if r.status_code == 503)
+
+
+@pytest.mark.asyncio
+async def test_queue_wait_times_out():
+    app = _app(delay=0.5, rate_per_5min=0, max_concurrent=1, queue_size=5, queue_timeout_s=0.1)
+    async with _client(app) as c:
+        results = await asyncio.gather(*[c.post("/api/chat") for _ in range(2)])
+    assert sorted(r.status_code for r in results) == [200, 503]
+
+
+def test_bucket_refills_over_time():
+    bucket = TokenBucket(rate_per_s=1000.0, burst=1)
+    assert bucket.take("k") == 0.0
+    assert TokenBucket(rate_per_s=1.0, burst=2).take("k", cost=5) == 0.0  # capped at the burst
+    assert bucket.take("k") > 0.0
+    time.sleep(0.01)
+    assert bucket.take("k") == 0.0
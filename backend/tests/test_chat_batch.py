@@ -0,0 +1,87 @@
+from __future__ import annotations
+import asyncio
+import json
+from unittest.mock import AsyncMock, patch
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.config import settings
+from app.routes import chat
+from evaluation.run import cache_key, fetch_answers, figure_recall, plan
+
+
+def _client() -> httpx.AsyncClient:
+    app = FastAPI()
+    app.include_router(chat.router)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+@pytest.mark.asyncio
+async def test_batch_embeds_once_and_bounds_concurrency(monkeypatch):
+    monkeypatch.setattr(settings, "chat_batch_concurrency", 2)
+    running, peak = 0, 0
+
+    async def fake_orchestrate(query, doc_ids, force_web, deadline=None, session_id=None, qvec=None, include_context=False, filters=None):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+        if query == "q3":
+            raise RuntimeError("boom")
+        return [f"resposta-{query}", f"v{qvec[0]}"], {"citations": [], "sources": {"type": "doc", "items": []}, "degradations": []}
+
+    embed = AsyncMock(return_value=[[float(i)] for i in range(5)])
+    with patch.object(chat.llm_client, "embed", new=embed), patch.object(chat, "orchestrate_chat", new=fake_orchestrate):
+        async with _client() as client:
+            r = await client.post("/api/chat/batch", json={"questions": ["q0", "q1", "q2", "q3", "q4"], "document_ids": ["d1"]})
+
+    assert r.status_code == 200
+    results = r.json()["results"]
+    # One embeddings request for the whole batch; each pipeline got its own query vector
+    assert embed.await_count == 1 and embed.await_args.args[0] == ["q0", "q1", "q2", "q3", "q4"]
+    assert [res["answer"] for res in results if "answer" in res] == ["resposta-q0 v0.0", "resposta-q1 v1.0", "resposta-q2 v2.0", "resposta-q4 v4.0"]
+    # A failing question is reported in place; the others still answer
+    assert results[3]["error"] == "boom" and results[3]["index"] == 3
+    assert all("elapsed_ms" in res for res in results)
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_batch_rejects_oversized_or_empty(monkeypatch):
+    monkeypatch.setattr(settings, "chat_batch_max_questions", 2)
+    async with _client() as client:
+        too_many = await client.post("/api/chat/batch", json={"questions": ["a", "b", "c"]})
+        blank = await client.post("/api/chat/batch", json={"questions": ["a", "  "]})
+    assert too_many.status_code == 400 and blank.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_runner_only_asks_uncached_questions(tmp_path):
+    items = [{"id": "a", "input": "Qual o capital?", "expected_output": "R$ 15.000"},
+             {"id": "b", "input": "Qual a margem?", "expected_output": "30%"}]
+    cache = {cache_key("Qual o capital?", ["d1"], "v1"): {"answer": "R$ 15.000 [1]", "scores": {}}}
+    keyed, misses = plan(items, ["d1"], "v1", cache, refresh=False)
+    assert len(keyed) == 2 and [item["id"] for item, _ in misses[("d1",)]] == ["b"]
+    # A new tag invalidates everything
+    assert sum(len(v) for v in plan(items, ["d1"], "v2", cache, refresh=False)[1].values()) == 2
+
+    sent = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        sent.append(body)
+        return httpx.Response(200, json={"results": [{"index": 0, "question": q, "answer": "A margem é de 30%."} for q in body["questions"]]})
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        await fetch_answers(client, "http://api", ("d1",), misses[("d1",)], cache, 50, str(tmp_path / "cache.json"))
+    assert sent == [{"questions": ["Qual a margem?"], "document_ids": ["d1"], "include_context": True}]
+    assert cache[misses[("d1",)][0][1]]["answer"] == "A margem é de 30%."
+    assert json.loads((tmp_path / "cache.json").read_text()) == cache
+
+
+def test_figure_recall():
+    assert figure_recall("R$ 800 de aluguel e R$ 3.000 de salários", "aluguel R$ 800, salários R$ 3000") == 1.0
+    assert figure_recall("R$ 5.428,57", "cerca de R$ 5.000") == 0.0
+    assert figure_recall("Sem números.", "x") is None
@@ -0,0 +1,120 @@
+from __future__ import annotations
+import asyncio
+import json
+from unittest.mock import AsyncMock, patch
+import pytest
+from fastapi import FastAPI
+
+from app.config import settings
+from app.metrics import CHAT_DISCONNECT_BUDGET_SAVED, CHAT_DISCONNECTS
+from app.routes import chat
+from app.services import orchestrator
+
+pytestmark = pytest.mark.asyncio
+
+
+class Client:
+    """Drives the ASGI app like a server would: sends the body, then reports http.disconnect once `drop()` is called."""
+
+    def __init__(self, body: dict) -> None:
+        self.body = json.dumps(body).encode()
+        self.sent_body = False
+        self.gone = asyncio.Event()
+        self.messages: list = []
+
+    def drop(self) -> None:
+        self.gone.set()
+
+    async def receive(self) -> dict:
+        if not self.sent_body:
+            self.sent_body = True
+            return {"type": "http.request", "body": self.body, "more_body": False}
+        await self.gone.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(self, message: dict) -> None:
+        self.messages.append(message)
+
+    def events(self) -> list:
+        return [m["body"] for m in self.messages if m["type"] == "http.response.body" and m.get("body")]
+
+
+def _scope() -> dict:
+    return {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.3"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": "/api/chat", "raw_path": b"/api/chat", "query_string": b"", "root_path": "",
+        "headers": [(b"content-type", b"application/json")], "client": ("10.0.0.1", 5000), "server": ("test", 80),
+    }
+
+
+def _app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(chat.router)
+    return app
+
+
+@pytest.mark.parametrize("phase", ["rewrite", "pipeline"])
+async def test_disconnect_mid_request_cancels_the_pipeline(phase, monkeypatch):
+    monkeypatch.setattr(settings, "chat_budget_s", 45.0)
+    running = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def stuck(*_args, **_kwargs):
+        # Stands in for an LLM call in flight
+        running.set()
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    rewrite = stuck if phase == "rewrite" else AsyncMock(return_value="q")
+    orchestrate = stuck if phase == "pipeline" else AsyncMock(side_effect=AssertionError("must not start"))
+    client = Client({"messages": [{"role": "user", "content": "q"}]})
+    before, saved = CHAT_DISCONNECTS.value(phase=phase), CHAT_DISCONNECT_BUDGET_SAVED.value()
+    with patch.object(chat, "rewrite_query_with_history", new=rewrite), \
+         patch.object(chat, "orchestrate_chat", new=orchestrate), \
+         patch.object(chat, "append_entries", new=AsyncMock()) as persist:
+        request = asyncio.create_task(_app()(_scope(), client.receive, client.send))
+        await asyncio.wait_for(running.wait(), 2)
+        client.drop()
+        # The response ends promptly instead of after the 30s "LLM call"
+        await asyncio.wait_for(request, 2)
+
+    assert cancelled.is_set()
+    assert CHAT_DISCONNECTS.value(phase=phase) == before + 1
+    assert 40.0 < CHAT_DISCONNECT_BUDGET_SAVED.value() - saved <= 45.0
+    # Nothing was streamed or persisted for the abandoned request
+    assert not any(b.startswith(b"data:") for b in client.events())
+    persist.assert_not_awaited()
+
+
+async def test_connected_client_still_gets_the_answer():
+    client = Client({"messages": [{"role": "user", "content": "q"}]})
+    env = {"citations": [], "sources": {"type": "doc", "items": []}, "degradations": []}
+    before = CHAT_DISCONNECTS.value(phase="pipeline")
+    with patch.object(chat, "rewrite_query_with_history", new=AsyncMock(return_value="q")), \
+         patch.object(chat, "orchestrate_chat", new=AsyncMock(return_value=(["Resposta", "final"], env))), \
+         patch.object(chat, "append_entries", new=AsyncMock()):
+        await asyncio.wait_for(_app()(_scope(), client.receive, client.send), 2)
+
+    assert client.events()[:2] == [b"data: Resposta \n\n", b"data: final \n\n"]
+    assert CHAT_DISCONNECTS.value(phase="pipeline") == before
+
+
+async def test_cancelled_pipeline_cancels_its_background_tasks():
+    children = []
+
+    @orchestrator._owns_child_tasks
+    async def pipeline():
+        # e.g. the speculative web search started next to the batch rounds
+        children.append(orchestrator._spawn(asyncio.sleep(30)))
+        await asyncio.sleep(30)
+
+    task = asyncio.create_task(pipeline())
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    await asyncio.sleep(0)
+    assert children[0].cancelled()
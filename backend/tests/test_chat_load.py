@@ -0,0 +1,98 @@
+from __future__ import annotations
+import asyncio
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, patch
+import pytest
+
+from app.config import settings
+from app.services.orchestrator import orchestrate_chat
+
+pytestmark = pytest.mark.asyncio
+
+LLM_LATENCY_S = 0.2
+SQL_LATENCY_S = 0.01
+
+
+class FakePool:
+    """Stands in for the SQLAlchemy QueuePool: `size` connections, waiters time out like pool_timeout."""
+
+    def __init__(self, size: int, timeout: float) -> None:
+        self.sem = asyncio.Semaphore(size)
+        self.timeout = timeout
+        self.in_use = 0
+        self.peak = 0
+        self.holders: set = set()
+
+    @asynccontextmanager
+    async def session_scope(self):
+        await asyncio.wait_for(self.sem.acquire(), timeout=self.timeout)
+        self.in_use += 1
+        self.peak = max(self.peak, self.in_use)
+        self.holders.add(asyncio.current_task())
+        try:
+            yield object()
+        finally:
+            self.holders.discard(asyncio.current_task())
+            self.in_use -= 1
+            self.sem.release()
+
+
+class FakeLLM:
+    """Counts overlapping LLM waits, and how many of them started while their chat held a connection."""
+
+    def __init__(self, pool: FakePool) -> None:
+        self.pool = pool
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.pinned_waits = 0
+
+    async def _wait(self) -> None:
+        if asyncio.current_task() in self.pool.holders:
+            self.pinned_waits += 1
+        self.waiting += 1
+        self.peak_waiting = max(self.peak_waiting, self.waiting)
+        try:
+            await asyncio.sleep(LLM_LATENCY_S)
+        finally:
+            self.waiting -= 1
+
+    async def chat(self, *_args, **_kwargs):
+        await self._wait()
+        return '{"code":1,"text":"ok"}'
+
+    async def embed(self, texts, **_kwargs):
+        await self._wait()
+        return [[0.1] * 3072 for _ in texts]
+
+
+async def _slow_ann(*_args, **_kwargs):
+    await asyncio.sleep(SQL_LATENCY_S)
+    return [
+        {"id": f"p{i}", "document_id": "d1", "page_number": i, "content": "x", "title": "Doc", "similarity": 0.9}
+        for i in range(1, 4)
+    ]
+
+
+async def test_default_pool_sustains_many_concurrent_chats():
+    # Default pool is DB_POOL_SIZE + DB_MAX_OVERFLOW connections (5 + 10). Because connections are
+    # only held around SQL, 10x that many chats can be in their LLM phase at the same time.
+    pool_capacity = settings.db_pool_size + settings.db_max_overflow
+    concurrent_chats = pool_capacity * 10
+    pool = FakePool(pool_capacity, timeout=settings.db_pool_timeout_s)
+    llm = FakeLLM(pool)
+
+    with patch("app.services.orchestrator.session_scope", pool.session_scope), \
+         patch("app.services.orchestrator.ann_search_pages", new=_slow_ann), \
+         patch("app.services.orchestrator.fetch_pages_basic", new=AsyncMock(return_value=[])), \
+         patch("app.services.orchestrator.llm_client", new=llm):
+        results = await asyncio.gather(*[
+            orchestrate_chat(query=f"q{i}", doc_ids=["d1"], force_web=False) for i in range(concurrent_chats)
+        ])
+
+    assert len(results) == concurrent_chats
+    assert all(tokens == ["ok"] for tokens, _env in results)
+    assert pool.peak <= pool_capacity
+    # No chat waits on the LLM while holding a connection, so far more chats than connections wait at once
+    # (with a pinned session at most pool_capacity could)
+    assert llm.pinned_waits == 0
+    assert llm.peak_waiting > pool_capacity
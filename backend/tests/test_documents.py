@@ -0,0 +1,121 @@
+from __future__ import annotations
+import uuid
+from datetime import datetime, timedelta, timezone
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.db import get_db
+from app.routes import documents
+from app.routes.documents import _decode_cursor, _encode_cursor
+
+T0 = datetime(2026, 10, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class _Rows:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def mappings(self):
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class FakeDB:
+    """Evaluates the listing queries over in-memory rows: the keyset predicate, ordering and LIMIT the SQL asks for."""
+
+    def __init__(self, docs=(), pages=()):
+        self.docs = list(docs)
+        self.pages = list(pages)
+        self.sql = []
+
+    async def execute(self, stmt, params):
+        sql = " ".join(str(stmt).split())
+        self.sql.append(sql)
+        if "FROM documents" in sql:
+            # ORDER BY created_at DESC, id DESC; (created_at, id) < (cursor) is a row comparison
+            rows = sorted(self.docs, key=lambda d: (d["created_at"], d["id"]), reverse=True)
+            if "c_created_at" in params:
+                key = (params["c_created_at"], uuid.UUID(params["c_id"]))
+                rows = [d for d in rows if (d["created_at"], d["id"]) < key]
+            return _Rows(rows[:params["limit"]])
+        rows = sorted((p for p in self.pages if p["page_number"] > params["after_page"]), key=lambda p: p["page_number"])
+        return _Rows(rows[:params["limit"]])
+
+
+def _client(db: FakeDB) -> TestClient:
+    app = FastAPI()
+    app.include_router(documents.router)
+
+    async def override():
+        yield db
+
+    app.dependency_overrides[get_db] = override
+    return TestClient(app)
+
+
+def _doc(created_at, n):
+    return {"id": uuid.UUID(int=n), "title": f"Doc {n}", "page_count": 1, "status": "ready", "pages_ingested": 1,
+            "tags": None, "created_at": created_at}
+
+
+def test_cursor_round_trip():
+    doc_id = uuid.uuid4()
+    cursor = _encode_cursor(T0, doc_id)
+    assert "=" not in cursor
+    assert _decode_cursor(cursor) == (T0, str(doc_id))
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "e30", "W10"])
+def test_malformed_cursor_is_a_400(cursor):
+    r = _client(FakeDB()).get("/api/documents", params={"cursor": cursor})
+    assert r.status_code == 400 and r.json()["detail"] == "Invalid cursor"
+
+
+def test_keyset_paging_breaks_created_at_ties_by_id():
+    # Five documents uploaded in the same transaction share created_at; two are older
+    docs = [_doc(T0, n) for n in range(1, 6)] + [_doc(T0 - timedelta(hours=1), n) for n in range(6, 8)]
+    db = FakeDB(docs)
+    client = _client(db)
+    seen, cursor = [], None
+    while True:
+        body = client.get("/api/documents", params={"limit": 2, **({"cursor": cursor} if cursor else {})}).json()
+        seen += [d["id"] for d in body["items"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+
+    # Every document exactly once, newest first, ties in id order (descending)
+    assert seen == [str(uuid.UUID(int=n)) for n in (5, 4, 3, 2, 1, 7, 6)]
+    assert "(created_at, id) < (:c_created_at, CAST(:c_id AS uuid))" in db.sql[1]
+    assert "ORDER BY created_at DESC, id DESC" in db.sql[0]
+    assert body["items"][0]["tags"] == []
+
+
+def test_pages_are_listed_after_page_with_their_images():
+    doc_id = str(uuid.uuid4())
+    images = [
+        {"id": "i1", "file_url": "/media/a.jpg", "position": None, "dimensions": {"width": 10, "height": 5},
+         "thumbnail_url": "/media/a_thumb.jpg", "thumbnail_dimensions": {"width": 10, "height": 5}},
+        {"id": "i2", "file_url": "/media/b.jpg", "position": None, "dimensions": None,
+         "thumbnail_url": None, "thumbnail_dimensions": None},
+    ]
+    pages = [{"id": uuid.uuid4(), "page_number": n, "content": f"página {n}", "images": images if n == 3 else []}
+             for n in range(1, 6)]
+    db = FakeDB(pages=pages)
+    client = _client(db)
+
+    first = client.get(f"/api/documents/{doc_id}/pages", params={"limit": 2}).json()
+    assert [p["page_number"] for p in first["items"]] == [1, 2] and first["next_after_page"] == 2
+    second = client.get(f"/api/documents/{doc_id}/pages", params={"limit": 2, "after_page": 2}).json()
+    assert [p["page_number"] for p in second["items"]] == [3, 4] and second["next_after_page"] == 4
+    last = client.get(f"/api/documents/{doc_id}/pages", params={"limit": 2, "after_page": 4}).json()
+    assert [p["page_number"] for p in last["items"]] == [5] and last["next_after_page"] is None
+
+    assert second["items"][0]["images"] == images and second["items"][1]["images"] == []
+    assert all(p["document_id"] == doc_id for p in first["items"] + second["items"])
+    # One query per listing: images are aggregated per page, in insertion order
+    assert len(db.sql) == 3
+    assert "LEFT JOIN LATERAL" in db.sql[0] and "jsonb_agg" in db.sql[0] and "ORDER BY i.created_at ASC" in db.sql[0]
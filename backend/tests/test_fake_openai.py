@@ -0,0 +1,55 @@
+from __future__ import annotations
+import json
+from unittest.mock import patch
+import fitz
+import pytest
+
+from app.services.llm import LLMClient
+from evaluation.fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+from evaluation.load_benchmark import make_pdf, percentiles
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+def fake_llm():
+    with FakeOpenAIServer(FakeOpenAIConfig(latency_s=0.0, accept_rate=1.0)) as server:
+        with patch.dict("os.environ", {"OPENAI_BASE_URL": server.base_url}):
+            client = LLMClient()
+            client.api_key = "sk-fake"
+            yield server, client
+
+
+async def test_backend_client_speaks_to_fake_server(fake_llm):
+    server, client = fake_llm
+    vecs = await client.embed(["investimento inicial", "forno de convecção"])
+    assert [len(v) for v in vecs] == [3072, 3072]
+
+    raw = await client.chat("gpt-5", [
+        {"role": "system", "content": 'Retorne {"code":1,"text":"..."} ou {"code":2}'},
+        {"role": "user", "content": "Pergunta: x"},
+    ])
+    assert json.loads(raw)["code"] == 1
+    assert server.config.calls == {"chat": 1, "embeddings": 1}
+
+
+async def test_benchmark_helpers():
+    doc = fitz.open(stream=make_pdf(3), filetype="pdf")
+    assert doc.page_count == 3
+    assert "R$" in doc.load_page(0).get_text("text")
+    assert percentiles([1.0, 2.0, 3.0, 4.0])["p50"] in (2.0, 3.0)
+    assert percentiles([])["p99"] is None
+
+
+async def test_answer_marker_drives_selection_and_batch_decisions():
+    from evaluation.fake_openai import _chat_reply
+    from evaluation.strategy_benchmark import MARKER, make_pool
+
+    pool = make_pool(answer_at=4)
+    assert [MARKER in p["content"] for p in pool].index(True) == 4
+    cfg = FakeOpenAIConfig(answer_marker=MARKER)
+    user = "Trechos:\n" + "\n\n".join(f"[{i}] Doc (p.{i}):\n{p['content']}" for i, p in enumerate(pool, start=1))
+    assert json.loads(_chat_reply(cfg, [{"role": "system", "content": '{"pages":[n],"web":false}'}, {"role": "user", "content": user}])) == {"pages": [5], "web": False}
+    batch = {"role": "system", "content": '{"code":1,"text":"..."} ou {"code":2}'}
+    assert json.loads(_chat_reply(cfg, [batch, {"role": "user", "content": pool[0]["content"]}]))["code"] == 2
+    assert json.loads(_chat_reply(cfg, [batch, {"role": "user", "content": pool[4]["content"]}]))["code"] == 1
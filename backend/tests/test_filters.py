@@ -0,0 +1,71 @@
+from __future__ import annotations
+from datetime import datetime, timezone
+import pytest
+from pydantic import ValidationError
+from sqlalchemy.dialects import postgresql
+
+from app.schemas import ChatRequest, RetrievalFilters
+from app.services import orchestrator, ranking
+
+
+class _CaptureDB:
+    def __init__(self):
+        self.sql = []
+        self.params = []
+
+    async def execute(self, stmt, params):
+        compiled = stmt.bindparams(**params).compile(
+            dialect=postgresql.asyncpg.dialect(), compile_kwargs={"render_postcompile": True},
+        )
+        self.sql.append(" ".join(str(compiled).split()))
+        self.params.append(params)
+
+        class _Res:
+            def mappings(self):
+                return self
+
+            def all(self):
+                return []
+
+        return _Res()
+
+
+FILTERS = RetrievalFilters(
+    tags=[" Relatórios", "2024"], uploaded_after=datetime(2024, 1, 1, tzinfo=timezone.utc), title_contains="50%_off",
+    page_from=40, page_to=80, has_images=True,
+).to_query()
+
+
+def test_filters_are_validated_and_normalized():
+    req = ChatRequest(messages=[{"role": "user", "content": "oi"}], filters={"tags": ["A", "a "], "title_contains": "  "})
+    assert req.filters.to_query() == {"tags": ["a"]}
+    assert RetrievalFilters().to_query() is None
+    with pytest.raises(ValidationError):
+        RetrievalFilters(page_from=80, page_to=40)
+    with pytest.raises(ValidationError):
+        RetrievalFilters(page_from=0)
+
+
+@pytest.mark.asyncio
+async def test_filters_are_pushed_into_page_search_sql():
+    db = _CaptureDB()
+    await ranking.ann_search_pages(db, [0.1] * 3072, doc_ids=["d1"], embedding_model="m", embedding_version=1, filters=FILTERS)
+    await orchestrator.fetch_pages_basic(db, None, limit=5, filters=FILTERS)
+    for sql, params in zip(db.sql, db.params):
+        assert "d.tags @> CAST(" in sql and params["f_tags"] == ["relatórios", "2024"]
+        assert "d.created_at >= $" in sql and "d.title ILIKE $" in sql and params["f_title"] == "%50\\%\\_off%"
+        assert "dp.page_number >= $" in sql and "dp.page_number <= $" in sql
+        # Literal, so the partial index predicate matches
+        assert "AND dp.has_images " in sql
+    assert "ORDER BY dp.embedding <=>" in db.sql[0]
+
+
+@pytest.mark.asyncio
+async def test_routing_applies_only_document_filters():
+    db = _CaptureDB()
+    await ranking.ann_search_documents(db, [0.1] * 3072, filters=FILTERS)
+    assert "d.tags @> CAST(" in db.sql[0] and "d.title ILIKE" in db.sql[0]
+    assert "dp." not in db.sql[0]
+    db = _CaptureDB()
+    await ranking.ann_search_pages(db, [0.1] * 3072, filters={"has_images": False})
+    assert "AND NOT dp.has_images" in db.sql[0] and "d.tags" not in db.sql[0]
@@ -0,0 +1,244 @@
+from __future__ import annotations
+import asyncio
+import io
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+from unittest.mock import patch
+import pytest
+from fastapi import UploadFile
+
+from app.config import settings
+from app.services import ingestion
+from evaluation.load_benchmark import make_pdf
+
+pytestmark = pytest.mark.asyncio
+
+
+class _Result:
+    def __init__(self, row: Optional[Dict[str, Any]] = None) -> None:
+        self.row = row
+
+    def scalar_one(self):
+        return uuid.uuid4()
+
+    def mappings(self):
+        return self
+
+    def first(self):
+        return self.row
+
+    def all(self):
+        return []
+
+
+class FakeDB:
+    """Records SQL per transaction; `resume_row` is what the resume lookup finds."""
+
+    def __init__(self, resume_row: Optional[Dict[str, Any]] = None, fail_on_checkpoint: Optional[int] = None) -> None:
+        self.resume_row = resume_row
+        self.fail_on_checkpoint = fail_on_checkpoint
+        self.committed: List[List[tuple]] = []
+
+    @asynccontextmanager
+    async def session_scope(self):
+        tx: List[tuple] = []
+        db = self
+
+        class Session:
+            async def execute(self, stmt, params=None):
+                sql = " ".join(str(stmt).split())
+                if "pages_ingested = :done" in sql and params["done"] == db.fail_on_checkpoint:
+                    raise RuntimeError("db went away")
+                tx.append((sql, params))
+                return _Result(db.resume_row if sql.startswith("SELECT id, pages_ingested") else None)
+
+            async def commit(self):
+                db.committed.append(list(tx))
+                tx.clear()
+
+        yield Session()
+
+    def statements(self, prefix: str) -> List[tuple]:
+        return [(sql, p) for tx in self.committed for sql, p in tx if sql.startswith(prefix)]
+
+
+async def _embed(texts, **_kwargs):
+    await asyncio.sleep(0.01)
+    return [[0.5] * 3072 for _ in texts]
+
+
+@pytest.fixture(autouse=True)
+def _media(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "media_root", str(tmp_path))
+    monkeypatch.setattr(settings, "ingest_chunk_pages", 8)
+
+
+def _upload(pages: int) -> UploadFile:
+    return UploadFile(file=io.BytesIO(make_pdf(pages)), filename=f"doc{pages}.pdf")
+
+
+async def test_pages_are_committed_in_checkpointed_chunks():
+    db = FakeDB()
+    with patch.object(ingestion, "session_scope", db.session_scope), \
+         patch.object(ingestion.llm_client, "embed", side_effect=_embed):
+        meta = await ingestion.ingest_pdf(_upload(20))
+
+    assert meta["page_count"] == 20 and meta["status"] == "ready"
+    assert [p["done"] for _, p in db.statements("UPDATE documents SET pages_ingested")] == [8, 16, 20]
+    pages = db.statements("INSERT INTO document_pages")
+    assert [p["page_number"] for _, p in pages] == list(range(1, 21))
+    assert all(p["has_vec"] and p["vec"].startswith("[0.5,") for _, p in pages)
+    # Each chunk folds its pages into the document's routing vector in the same transaction
+    assert [(p["first"], p["last"]) for _, p in db.statements("INSERT INTO document_summaries")] == [(1, 8), (9, 16), (17, 20)]
+    # The document is created as 'ingesting' (committed on its own) and flipped to 'ready' at the end
+    assert "'ingesting'" in db.committed[0][-1][0]
+    assert db.committed[-1][-1][1]["status"] == "ready"
+
+
+async def test_failure_keeps_committed_chunks_and_marks_failed():
+    db = FakeDB(fail_on_checkpoint=16)
+    with patch.object(ingestion, "session_scope", db.session_scope), \
+         patch.object(ingestion.llm_client, "embed", side_effect=_embed):
+        with pytest.raises(RuntimeError, match="db went away"):
+            await ingestion.ingest_pdf(_upload(20))
+
+    assert [p["done"] for _, p in db.statements("UPDATE documents SET pages_ingested")] == [8]
+    assert db.committed[-1][-1][1]["status"] == "failed"
+
+
+async def test_reupload_resumes_after_checkpoint():
+    doc_id = uuid.uuid4()
+    db = FakeDB(resume_row={"id": doc_id, "pages_ingested": 16})
+    with patch.object(ingestion, "session_scope", db.session_scope), \
+         patch.object(ingestion.llm_client, "embed", side_effect=_embed):
+        meta = await ingestion.ingest_pdf(_upload(20))
+
+    assert meta["id"] == str(doc_id)
+    assert db.statements("DELETE FROM document_pages")[0][1] == {"id": doc_id, "done": 16}
+    assert [p["page_number"] for _, p in db.statements("INSERT INTO document_pages")] == [17, 18, 19, 20]
+
+
+async def test_embedding_failure_still_writes_pages():
+    db = FakeDB()
+
+    async def broken(texts, **_kwargs):
+        raise RuntimeError("rate limited")
+
+    with patch.object(ingestion, "session_scope", db.session_scope), \
+         patch.object(ingestion.llm_client, "embed", side_effect=broken):
+        await ingestion.ingest_pdf(_upload(10))
+
+    pages = db.statements("INSERT INTO document_pages")
+    assert len(pages) == 10 and not any(p["has_vec"] for _, p in pages)
+
+
+async def test_stages_overlap_with_bounded_queues():
+    # Embedding (slow) must start before parsing finishes, and parsing may only run a bounded distance ahead
+    db = FakeDB()
+    events: List[str] = []
+    real_parse = ingestion._parse_page
+
+    def parse(doc, pno):
+        events.append(f"parse{pno + 1}")
+        return real_parse(doc, pno)
+
+    async def embed(texts, **_kwargs):
+        events.append("embed")
+        await asyncio.sleep(0.05)
+        return [[0.1] * 3072 for _ in texts]
+
+    with patch.object(ingestion, "session_scope", db.session_scope), \
+         patch.object(ingestion, "_parse_page", side_effect=parse), \
+         patch.object(ingestion.llm_client, "embed", side_effect=embed):
+        await ingestion.ingest_pdf(_upload(60))
+
+    assert events.index("embed") < events.index("parse60")
+    # Parse never runs further ahead of embedding than the queue (2 chunks) + the chunk being filled
+    parsed = embedded = 0
+    for e in events:
+        if e == "embed":
+            embedded += 8
+        else:
+            parsed += 1
+            assert parsed - embedded <= 8 * 3 + 1
+
+
+async def test_failed_embed_stage_waits_for_the_parse_thread_before_closing_the_pdf():
+    db = FakeDB()
+    errors: List[Exception] = []
+    real_parse = ingestion._parse_page
+
+    def parse(doc, pno):
+        if pno >= 8:
+            time.sleep(0.1)  # still parsing when the embed stage fails and the TaskGroup cancels parsing
+        try:
+            return real_parse(doc, pno)
+        except Exception as e:
+            errors.append(e)
+            raise
+
+    async def broken_chunk(_chunk):
+        raise RuntimeError("embed stage crashed")
+
+    with patch.object(ingestion, "session_scope", db.session_scope), \
+         patch.object(ingestion, "_parse_page", side_effect=parse), \
+         patch.object(ingestion, "_embed_chunk", side_effect=broken_chunk):
+        with pytest.raises(RuntimeError, match="embed stage crashed"):
+            await ingestion.ingest_pdf(_upload(20))
+        await asyncio.sleep(0.2)  # without the wait, the in-flight parse would now hit the closed document
+
+    assert errors == []
+    assert db.committed[-1][-1][1]["status"] == "failed"
+
+
+async def test_near_duplicate_pages_reuse_vectors():
+    # Pages 2-4 are the same terms-and-conditions template with a different footer; only one is embedded
+    import fitz
+
+    terms = " ".join(f"Cláusula {n}: o contratante declara estar ciente das condições gerais do serviço." for n in range(1, 25))
+    doc = fitz.open()
+    for text in ["Plano de negócios: mercado, concorrência e projeções de receita para o primeiro ano."] + [
+        f"{terms} Página {n} de 4." for n in range(2, 5)
+    ]:
+        doc.new_page().insert_textbox(fitz.Rect(40, 40, 560, 800), text, fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+
+    db = FakeDB()
+    sent: List[str] = []
+
+    async def embed(texts, **_kwargs):
+        sent.extend(texts)
+        return [[float(i + 1)] * 3072 for i in range(len(texts))]
+
+    with patch.object(ingestion, "session_scope", db.session_scope), \
+         patch.object(ingestion.llm_client, "embed", side_effect=embed):
+        await ingestion.ingest_pdf(UploadFile(file=io.BytesIO(data), filename="terms.pdf"))
+
+    assert len(sent) == 2
+    pages = db.statements("INSERT INTO document_pages")
+    assert [p["vec"] for _, p in pages[1:]] == [pages[1][1]["vec"]] * 3
+    assert all(p["minhash"] and len(p["bands"]) == 8 for _, p in pages)
+
+
+async def test_concurrent_writes_of_the_same_image_never_expose_a_partial_file(tmp_path):
+    data = bytes(range(256)) * 4096
+    real_replace = ingestion.os.replace
+    temps = []
+
+    def replace(src, dst):
+        temps.append(src)
+        # Every writer's temp file is complete when it is published
+        with open(src, "rb") as f:
+            assert f.read() == data
+        real_replace(src, dst)
+
+    with patch.object(ingestion.os, "replace", side_effect=replace), \
+         patch.object(ingestion.os.path, "exists", return_value=False):
+        await asyncio.gather(*[asyncio.to_thread(ingestion._write_once, "logo.jpg", data) for _ in range(4)])
+
+    assert len(set(temps)) == 4
+    assert (tmp_path / "logo.jpg").read_bytes() == data
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["logo.jpg"]
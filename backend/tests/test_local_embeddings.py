@@ -0,0 +1,84 @@
+from __future__ import annotations
+import numpy as np
+import pytest
+
+from app.config import settings
+from app.services import local_embeddings
+from app.services.llm import LLMClient
+from app.services.local_embeddings import LocalEmbedder
+
+CORPUS = [
+    "O forno de convecção custa entre R$ 3.000 e R$ 8.000 e assa pães rapidamente.",
+    "O aluguel mensal do ponto comercial é de R$ 800, pago ao proprietário do imóvel.",
+    "A margem de lucro desejada é de 30% sobre o preço de venda dos produtos.",
+    "Os salários de duas pessoas somam R$ 3.000 por mês, incluindo encargos.",
+    "O capital inicial disponível para investimento no negócio é de R$ 15.000.",
+    "Farinha, fermento e açúcar são comprados semanalmente de fornecedores locais.",
+]
+
+
+def _nearest(embedder: LocalEmbedder, query: str) -> int:
+    docs = np.array(embedder.embed(CORPUS))
+    q = np.array(embedder.embed([query])[0])
+    return int(np.argmax(docs @ q))
+
+
+@pytest.mark.parametrize("fitted", [False, True])
+def test_local_embedder_ranks_relevant_page_first(fitted):
+    embedder = LocalEmbedder.fit(CORPUS * 3, dim=16) if fitted else LocalEmbedder()
+    assert _nearest(embedder, "quanto custa o forno de convecção?") == 0
+    assert _nearest(embedder, "qual o valor do aluguel mensal?") == 1
+    vecs = embedder.embed(["a", "", "forno"])
+    assert all(len(v) == 3072 for v in vecs)
+    assert np.isclose(np.linalg.norm(vecs[2]), 1.0)
+
+
+def test_fitted_model_persists_and_backs_llm_client(tmp_path, monkeypatch):
+    path = str(tmp_path / "embedder.joblib")
+    fitted = LocalEmbedder.fit(CORPUS, dim=4)
+    fitted.save(path)
+    monkeypatch.setattr(settings, "embedding_backend", "local")
+    monkeypatch.setattr(settings, "local_embedding_path", path)
+    local_embeddings.reset_local_embedder()
+    try:
+        client = LLMClient()
+        assert client.embedding_model == fitted.model_id
+        assert np.allclose(local_embeddings.get_local_embedder().embed(CORPUS[:1]), fitted.embed(CORPUS[:1]))
+    finally:
+        local_embeddings.reset_local_embedder()
+
+
+def test_running_worker_picks_up_a_refit(tmp_path, monkeypatch):
+    import os
+    path = str(tmp_path / "embedder.joblib")
+    monkeypatch.setattr(settings, "embedding_backend", "local")
+    monkeypatch.setattr(settings, "local_embedding_path", path)
+    local_embeddings.reset_local_embedder()
+    try:
+        client = LLMClient()
+        assert client.embedding_model == "local-hashing"
+        first = LocalEmbedder.fit(CORPUS, dim=4)
+        first.save(path)
+        assert client.embedding_model == first.model_id
+        # A refit by another process (the `fit` CLI) replaces the file: no restart needed
+        second = LocalEmbedder.fit(CORPUS * 2, dim=3)
+        second.save(path)
+        os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 1_000_000))
+        assert client.embedding_model == second.model_id != first.model_id
+    finally:
+        local_embeddings.reset_local_embedder()
+
+
+@pytest.mark.asyncio
+async def test_llm_client_embeds_locally_without_network(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "embedding_backend", "local")
+    monkeypatch.setattr(settings, "local_embedding_path", str(tmp_path / "missing.joblib"))
+    local_embeddings.reset_local_embedder()
+    try:
+        client = LLMClient()
+        client.base_url = "http://127.0.0.1:9/unreachable"
+        vecs = await client.embed(CORPUS)
+        assert len(vecs) == len(CORPUS) and len(vecs[0]) == 3072
+        assert client.embedding_model == "local-hashing"
+    finally:
+        local_embeddings.reset_local_embedder()
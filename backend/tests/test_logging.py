@@ -0,0 +1,85 @@
+from __future__ import annotations
+import json
+import logging
+import pytest
+import structlog
+
+from app import logging_setup
+from app.config import settings
+from app.logging_setup import _redact_embeddings, _render_payloads, payload
+
+
+def test_redactor_only_copies_when_needed():
+    nested = {"a": [1, 2, 3], "b": {"title": "x"}}
+    event = {"event": "e", "nested": nested, "vec": [0.1] * 100, "page_embedding": "anything"}
+    out = _redact_embeddings(None, "info", event)
+    assert out["nested"] is nested
+    assert out["vec"] == "(embedding_filtered)"
+    assert out["page_embedding"] == "(embedding_filtered)"
+
+    deep = {"rows": [{"id": 1, "embedding": [0.2] * 3072}]}
+    out = _redact_embeddings(None, "info", {"event": "e", "deep": deep})
+    assert out["deep"]["rows"][0]["embedding"] == "(embedding_filtered)"
+    assert deep["rows"][0]["embedding"] != "(embedding_filtered)"  # caller's data untouched
+
+
+@pytest.mark.parametrize("mode, expected", [("off", None), ("truncated", "xxxxx…(+5 chars)"), ("full", "x" * 10)])
+def test_payload_tiers(monkeypatch, mode, expected):
+    monkeypatch.setattr(logging_setup, "_payload_mode", mode)
+    monkeypatch.setattr(logging_setup, "_payload_max_chars", 5)
+    calls = []
+
+    def build():
+        calls.append(1)
+        return "x" * 10
+
+    out = _render_payloads(None, "info", {"event": "e", "prompt": payload(build)})
+    assert out.get("prompt") == expected
+    # Lazy fields are never built when the tier drops them
+    assert len(calls) == (0 if mode == "off" else 1)
+
+
+def test_queued_json_output(monkeypatch, capsys):
+    monkeypatch.setattr(settings, "log_payloads", "truncated")
+    monkeypatch.setattr(settings, "log_payload_max_chars", 3)
+    monkeypatch.setattr(settings, "log_async", True)
+    logging_setup.setup_logging("INFO")
+    try:
+        structlog.get_logger("test").info("hello", prompt=payload("abcdef"), qvec=[0.5] * 64)
+        logging_setup.flush_logging()
+        line = [ln for ln in capsys.readouterr().out.splitlines() if '"hello"' in ln][-1]
+        data = json.loads(line)
+        assert data["event"] == "hello"
+        assert data["level"] == "info"
+        assert data["prompt"] == "abc…(+3 chars)"
+        assert data["qvec"] == "(embedding_filtered)"
+    finally:
+        logging_setup._stop_listener()
+        logging.getLogger().handlers.clear()
+        structlog.reset_defaults()
+
+
+def test_queued_payloads_are_resolved_on_the_calling_thread(monkeypatch, capsys):
+    import threading
+    monkeypatch.setattr(settings, "log_payloads", "full")
+    monkeypatch.setattr(settings, "log_async", True)
+    logging_setup.setup_logging("INFO")
+    try:
+        sources = [{"page": 1}]
+        threads = []
+
+        def build():
+            threads.append(threading.current_thread())
+            return [dict(s) for s in sources]
+
+        structlog.get_logger("test").info("snapshot", items=payload(build))
+        # The request moves on and mutates its state before the listener writes the line
+        sources.append({"page": 2})
+        logging_setup.flush_logging()
+        line = [ln for ln in capsys.readouterr().out.splitlines() if '"snapshot"' in ln][-1]
+        assert json.loads(line)["items"] == [{"page": 1}]
+        assert threads == [threading.current_thread()]
+    finally:
+        logging_setup._stop_listener()
+        logging.getLogger().handlers.clear()
+        structlog.reset_defaults()
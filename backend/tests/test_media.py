@@ -0,0 +1,41 @@
+from __future__ import annotations
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+
+from app.media import IMMUTABLE_CACHE_CONTROL, ImmutableStaticFiles
+
+
+@pytest.fixture
+def client(tmp_path):
+    (tmp_path / "abc123.jpg").write_bytes(bytes(range(256)) * 4)
+    app = Starlette(routes=[Mount("/media", ImmutableStaticFiles(directory=tmp_path))])
+    return TestClient(app)
+
+
+def test_media_is_immutable_with_strong_etag(client):
+    r = client.get("/media/abc123.jpg")
+    assert r.status_code == 200
+    assert r.headers["etag"] == '"abc123"'
+    assert r.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert len(r.content) == 1024
+
+    again = client.get("/media/abc123.jpg", headers={"If-None-Match": '"abc123"'})
+    assert again.status_code == 304
+    assert again.content == b""
+
+
+def test_media_range_requests(client):
+    r = client.get("/media/abc123.jpg", headers={"Range": "bytes=10-19"})
+    assert r.status_code == 206
+    assert r.headers["content-range"] == "bytes 10-19/1024"
+    assert r.content == bytes(range(10, 20))
+
+    tail = client.get("/media/abc123.jpg", headers={"Range": "bytes=-4"})
+    assert tail.status_code == 206
+    assert tail.content == bytes(range(252, 256))
+
+    assert client.get("/media/abc123.jpg", headers={"Range": "bytes=5000-"}).status_code == 416
+    # A stale If-Range validator gets the full file
+    assert client.get("/media/abc123.jpg", headers={"Range": "bytes=0-1", "If-Range": '"old"'}).status_code == 200
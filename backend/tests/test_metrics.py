@@ -0,0 +1,60 @@
+from __future__ import annotations
+from unittest.mock import AsyncMock, patch
+import pytest
+
+from app.metrics import (
+    BATCH_OUTCOMES, Counter, Histogram, Registry, STAGE_SECONDS, server_timing_header, stage, start_request_timings,
+)
+from app.services.orchestrator import orchestrate_chat
+
+
+def test_registry_renders_prometheus_text():
+    reg = Registry()
+    hits = reg.register(Counter("demo_hits_total", "Demo hits.", ["cache"]))
+    lat = reg.register(Histogram("demo_seconds", "Demo latency.", ["stage"], buckets=(0.1, 1.0)))
+    hits.inc(cache="web")
+    hits.inc(2, cache="web")
+    lat.observe(0.05, stage="a")
+    lat.observe(0.5, stage="a")
+    lat.observe(5.0, stage="a")
+
+    out = reg.render()
+    assert "# TYPE demo_hits_total counter" in out
+    assert 'demo_hits_total{cache="web"} 3' in out
+    assert 'demo_seconds_bucket{stage="a",le="0.1"} 1' in out
+    assert 'demo_seconds_bucket{stage="a",le="1"} 2' in out
+    assert 'demo_seconds_bucket{stage="a",le="+Inf"} 3' in out
+    assert 'demo_seconds_count{stage="a"} 3' in out
+    assert 'demo_seconds_sum{stage="a"} 5.55' in out
+
+
+def test_stage_timer_accumulates_request_timings():
+    timings = start_request_timings()
+    before = STAGE_SECONDS.count(stage="batch")
+    with stage("batch"):
+        pass
+    with stage("batch"):
+        pass
+    assert STAGE_SECONDS.count(stage="batch") == before + 2
+    assert list(timings) == ["batch"]
+    assert server_timing_header({"rewrite": 0.0123}) == "rewrite;dur=12.3"
+
+
+@pytest.mark.asyncio
+async def test_orchestrator_records_stage_metrics():
+    candidates = [
+        {"id": f"p{i}", "document_id": "d1", "page_number": i, "content": "x", "title": "Doc", "similarity": 0.9}
+        for i in range(1, 7)
+    ]
+    timings = start_request_timings()
+    accepted = BATCH_OUTCOMES.value(code=1)
+    with patch("app.services.orchestrator.ann_search_pages", new=AsyncMock(return_value=candidates)), \
+         patch("app.services.orchestrator.fetch_pages_basic", new=AsyncMock(return_value=[])), \
+         patch("app.services.orchestrator.llm_client") as mock_llm_client:
+        mock_llm_client.embed = AsyncMock(return_value=[[0.1] * 3072])
+        mock_llm_client.chat = AsyncMock(side_effect=['{"code":2}', '{"code":1,"text":"ok"}'])
+        tokens, _env = await orchestrate_chat(query="q", doc_ids=["d1"], force_web=False)
+
+    assert tokens == ["ok"]
+    assert {"query_embedding", "retrieval", "batch"} <= set(timings)
+    assert BATCH_OUTCOMES.value(code=1) == accepted + 1
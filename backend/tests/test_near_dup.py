@@ -0,0 +1,77 @@
+from __future__ import annotations
+import uuid
+import pytest
+
+from app.services.near_dup import band_hashes, drop_near_duplicates, find_embedded_duplicates, signature, similarity
+
+TERMS = " ".join(f"Cláusula {n}: o contratante declara estar ciente das condições gerais do serviço." for n in range(1, 25))
+
+
+def test_signature_similarity_tracks_overlap():
+    a = signature(TERMS + " Página 2 de 9.")
+    b = signature(TERMS + " Página 7 de 9.")
+    other = signature("Projeção de receita: R$ 15.000 no primeiro trimestre, margem de 30% e capital de giro.")
+    assert len(a) == 256 and signature(TERMS + " Página 2 de 9.") == a
+    assert similarity(a, b) >= 0.9
+    assert similarity(a, other) < 0.2
+    assert signature("   ") is None and similarity(a, None) == 0.0
+    # Near-duplicates share at least one LSH band; unrelated pages share none
+    assert set(band_hashes(a)) & set(band_hashes(b))
+    assert not set(band_hashes(a)) & set(band_hashes(other))
+
+
+def test_drop_near_duplicates_keeps_best_ranked_copy():
+    pool = [
+        {"page_number": 3, "similarity": 0.8, "minhash": signature(TERMS + " Página 3.")},
+        {"page_number": 1, "similarity": 0.7, "minhash": signature("Resumo executivo do plano de negócios da padaria.")},
+        {"page_number": 4, "similarity": 0.6, "minhash": signature(TERMS + " Página 4.")},
+        {"page_number": 5, "similarity": 0.5, "minhash": None},
+    ]
+    assert [c["page_number"] for c in drop_near_duplicates(pool, threshold=0.9)] == [3, 1, 5]
+
+
+class _Rows:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def mappings(self):
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class FakeSession:
+    def __init__(self, candidates, vectors):
+        self.candidates = candidates
+        self.vectors = vectors
+        self.calls = []
+
+    async def execute(self, stmt, params=None):
+        self.calls.append(params)
+        if "minhash_bands &&" in str(stmt):
+            return _Rows(self.candidates)
+        return _Rows([{"id": i, "vec": self.vectors[i]} for i in params["ids"]])
+
+
+@pytest.mark.asyncio
+async def test_find_embedded_duplicates_confirms_band_candidates():
+    stored = uuid.uuid4()
+    unrelated = uuid.uuid4()
+    doc = uuid.uuid4()
+    db = FakeSession(
+        candidates=[
+            {"id": stored, "document_id": doc, "minhash": signature(TERMS + " Página 1.")},
+            # A band collision that is not a near-duplicate is rejected on the full signature
+            {"id": unrelated, "document_id": doc, "minhash": signature("Capital social de R$ 50.000 integralizado.")},
+        ],
+        vectors={stored: "[0.5,0.25]"},
+    )
+    pages = []
+    for n, text in [(8, TERMS + " Página 8."), (9, "Cronograma de obras e licenças municipais.")]:
+        sig = signature(text)
+        pages.append({"page_number": n, "minhash": sig, "minhash_bands": band_hashes(sig)})
+
+    found = await find_embedded_duplicates(db, pages, "text-embedding-3-large", 1, threshold=0.9)
+    assert found == {8: [0.5, 0.25]}
+    assert db.calls[0]["model"] == "text-embedding-3-large" and db.calls[1]["ids"] == [stored]
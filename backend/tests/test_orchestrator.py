@@ -64,3 +64,238 @@ async def test_rewrite_query_with_history(history, mock_llm_response, expected_q
         else:
             mock_llm_client.chat.assert_not_called()
 
+
+@pytest.fixture(autouse=True)
+def _no_basic_fetch():
+    # ANN results are mocked per test; the stale-page top-up query must not reach a database
+    from unittest.mock import AsyncMock
+    with patch("app.services.orchestrator.fetch_pages_basic", new=AsyncMock(return_value=[])):
+        yield
+
+
+def _candidates(n):
+    return [
+        {"id": f"p{i}", "document_id": "d1", "page_number": i, "content": f"page {i} text", "title": "Doc", "similarity": 1.0 - i / 100}
+        for i in range(1, n + 1)
+    ]
+
+
+async def test_orchestrate_chat_skips_batches_when_budget_is_short():
+    from unittest.mock import AsyncMock
+    from app.services.deadline import Deadline
+    from app.services.orchestrator import orchestrate_chat
+
+    deadline = Deadline(budget_s=5.0)  # below synthesis reserve + one batch
+    with patch("app.services.orchestrator.llm_client") as mock_llm_client, \
+         patch("app.services.orchestrator.ann_search_pages", new=AsyncMock(return_value=_candidates(6))):
+        mock_llm_client.embed = AsyncMock(return_value=[[0.1] * 3072])
+        mock_llm_client.chat = AsyncMock(return_value="Resposta final")
+        tokens, env = await orchestrate_chat(query="q", doc_ids=["d1"], force_web=False, deadline=deadline)
+
+    # Only the final synthesis call ran; no structured batch rounds
+    assert mock_llm_client.chat.await_count == 1
+    assert tokens == ["Resposta", "final"]
+    assert env["degradations"] == ["batches_skipped"]
+    assert len(env["sources"]["items"]) == 6
+
+
+async def test_orchestrate_chat_returns_draft_when_budget_exhausted():
+    from unittest.mock import AsyncMock
+    from app.services.deadline import Deadline
+    from app.services.orchestrator import orchestrate_chat
+
+    deadline = Deadline(budget_s=0.001)
+    with patch("app.services.orchestrator.llm_client") as mock_llm_client, \
+         patch("app.services.orchestrator.ann_search_pages", new=AsyncMock(return_value=_candidates(3))):
+        mock_llm_client.embed = AsyncMock(return_value=[[0.1] * 3072])
+        mock_llm_client.chat = AsyncMock(return_value="unused")
+        tokens, env = await orchestrate_chat(query="q", doc_ids=["d1"], force_web=False, deadline=deadline)
+
+    mock_llm_client.chat.assert_not_called()
+    assert tokens[:2] == ["Answer", "(draft)"]
+    assert env["degradations"] == ["batches_skipped", "draft_answer"]
+
+
+async def test_orchestrate_chat_prefetches_web_when_batches_look_weak():
+    from unittest.mock import AsyncMock
+    from app.services.orchestrator import orchestrate_chat
+
+    weak = [{**c, "similarity": 0.1} for c in _candidates(6)]
+    provider = MagicMock()
+    provider.search = AsyncMock(return_value=[{"title": "Web", "url": "https://w.example", "snippet": "s"}])
+    with patch("app.services.orchestrator.llm_client") as mock_llm_client, \
+         patch("app.services.orchestrator.ann_search_pages", new=AsyncMock(return_value=weak)), \
+         patch("app.services.web_search.get_provider", new=AsyncMock(return_value=provider)):
+        mock_llm_client.embed = AsyncMock(return_value=[[0.1] * 3072])
+        mock_llm_client.chat = AsyncMock(side_effect=['{"code":2}', '{"code":2}', "Resposta"])
+        tokens, env = await orchestrate_chat(query="q", doc_ids=["d1"], force_web=False)
+
+    provider.search.assert_awaited_once_with("q")
+    assert tokens == ["Resposta"]
+    assert [c["kind"] for c in env["citations"]].count("web") == 1
+
+
+async def test_orchestrate_chat_reuses_session_retrieval_state():
+    from unittest.mock import AsyncMock
+    from app.services.orchestrator import orchestrate_chat
+
+    ann = AsyncMock(return_value=_candidates(6))
+    with patch("app.services.orchestrator.llm_client") as mock_llm_client, \
+         patch("app.services.orchestrator.ann_search_pages", new=ann):
+        mock_llm_client.embed = AsyncMock(return_value=[[0.1] * 3072])
+        mock_llm_client.chat = AsyncMock(side_effect=['{"code":1,"text":"primeira"}', '{"code":1,"text":"segunda"}'])
+        tokens1, env1 = await orchestrate_chat(query="q1", doc_ids=["d1"], force_web=False, session_id="s-warm")
+        tokens2, env2 = await orchestrate_chat(query="q2", doc_ids=["d1"], force_web=False, session_id="s-warm")
+
+    assert tokens1 == ["primeira"] and tokens2 == ["segunda"]
+    # Follow-up answered from the warm pool: no second embedding, ANN round or batch loop
+    assert ann.await_count == 1
+    assert mock_llm_client.embed.await_count == 1
+    assert mock_llm_client.chat.await_count == 2
+    assert env2["citations"] == env1["citations"]
+
+
+async def test_filters_reach_routing_and_page_search_and_scope_the_warm_pool():
+    from unittest.mock import AsyncMock
+    from app.services.orchestrator import orchestrate_chat
+
+    docs = [{"document_id": "d2", "title": "Doc 2", "pages": 40, "similarity": 0.62}]
+    routed = AsyncMock(return_value=docs)
+    ann = AsyncMock(return_value=_candidates(3))
+    filters = {"tags": ["2024"], "page_from": 40, "page_to": 80}
+    with patch("app.services.orchestrator.llm_client") as mock_llm_client, \
+         patch("app.services.orchestrator.ann_search_documents", new=routed), \
+         patch("app.services.orchestrator.ann_search_pages", new=ann):
+        mock_llm_client.embed = AsyncMock(return_value=[[0.1] * 3072])
+        mock_llm_client.chat = AsyncMock(return_value='{"code":1,"text":"Resposta"}')
+        await orchestrate_chat(query="q", doc_ids=None, force_web=False, session_id="s-filters", filters=filters)
+        # Same session, other filters: the previous turn's pages are not a valid warm pool
+        await orchestrate_chat(query="q", doc_ids=None, force_web=False, session_id="s-filters", filters={"has_images": True})
+
+    assert routed.await_args_list[0].kwargs["filters"] == filters
+    assert [c.kwargs["filters"] for c in ann.await_args_list] == [filters, {"has_images": True}]
+
+
+async def test_corpus_question_routes_to_top_documents_then_pages():
+    from unittest.mock import AsyncMock
+    from app.services.orchestrator import orchestrate_chat
+
+    docs = [{"document_id": "d2", "title": "Doc 2", "pages": 40, "similarity": 0.62},
+            {"document_id": "d7", "title": "Doc 7", "pages": 3, "similarity": 0.31}]
+    pages = AsyncMock(return_value=_candidates(3))
+    with patch("app.services.orchestrator.llm_client") as mock_llm_client, \
+         patch("app.services.orchestrator.ann_search_documents", new=AsyncMock(return_value=docs)), \
+         patch("app.services.orchestrator.ann_search_pages", new=pages):
+        mock_llm_client.embed = AsyncMock(return_value=[[0.1] * 3072])
+        mock_llm_client.chat = AsyncMock(return_value='{"code":1,"text":"Resposta"}')
+        tokens, env = await orchestrate_chat(query="q", doc_ids=None, force_web=False)
+
+    # One query embedding serves both levels; pages are searched only within the routed documents
+    assert mock_llm_client.embed.await_count == 1
+    assert pages.await_args.kwargs["doc_ids"] == ["d2", "d7"]
+    assert env["sources"]["type"] == "doc"
+
+
+async def test_corpus_question_below_threshold_goes_to_web():
+    from unittest.mock import AsyncMock
+    from app.services.orchestrator import route_decision
+
+    weak = [{"document_id": "d2", "title": "Doc 2", "pages": 40, "similarity": 0.05}]
+    with patch("app.services.orchestrator.ann_search_documents", new=AsyncMock(return_value=weak)):
+        routing = await route_decision("q", None, False, qvec=[0.1] * 3072)
+    assert (routing["use_docs"], routing["use_web"], routing["reason"]) == (False, True, "low_doc_similarity")
+
+    # Selected documents skip the routing query entirely
+    routing = await route_decision("q", ["d1"], False, qvec=None)
+    assert routing["use_docs"] and routing["doc_ids"] == ["d1"]
+
+
+async def test_select_strategy_uses_one_selection_call_then_synthesis(monkeypatch):
+    from unittest.mock import AsyncMock
+    from app.config import settings
+    from app.services.orchestrator import orchestrate_chat
+
+    monkeypatch.setattr(settings, "rag_selection_strategy", "select")
+    with patch("app.services.orchestrator.llm_client") as mock_llm_client, \
+         patch("app.services.orchestrator.ann_search_pages", new=AsyncMock(return_value=_candidates(12))):
+        mock_llm_client.embed = AsyncMock(return_value=[[0.1] * 3072])
+        mock_llm_client.chat = AsyncMock(side_effect=['{"pages":[9,4,99],"web":false}', "Resposta final [1]"])
+        tokens, env = await orchestrate_chat(query="q", doc_ids=["d1"], force_web=False)
+
+    # Selection saw all 12 excerpts; synthesis saw only the chosen pages, in the chosen order
+    assert mock_llm_client.chat.await_count == 2
+    assert "[12] Doc (p.12)" in mock_llm_client.chat.await_args_list[0].args[1][-1]["content"]
+    assert [c["page"] for c in env["citations"]] == [9, 4]
+    assert tokens == ["Resposta", "final", "[1]"]
+
+
+async def test_select_strategy_falls_back_to_batches_on_unusable_reply(monkeypatch):
+    from unittest.mock import AsyncMock
+    from app.config import settings
+    from app.services.orchestrator import orchestrate_chat
+
+    monkeypatch.setattr(settings, "rag_selection_strategy", "select")
+    monkeypatch.setattr(settings, "llm_json_repair", False)
+    with patch("app.services.orchestrator.llm_client") as mock_llm_client, \
+         patch("app.services.orchestrator.ann_search_pages", new=AsyncMock(return_value=_candidates(6))):
+        mock_llm_client.embed = AsyncMock(return_value=[[0.1] * 3072])
+        mock_llm_client.chat = AsyncMock(side_effect=["as páginas 2 e 3", '{"code":2,"text":null}', '{"code":1,"text":"Achei"}'])
+        tokens, env = await orchestrate_chat(query="q", doc_ids=["d1"], force_web=False)
+
+    assert mock_llm_client.chat.await_count == 3
+    assert tokens == ["Achei"]
+    assert [c["page"] for c in env["citations"]] == [4, 5, 6]
+
+
+async def test_precomputed_query_vector_skips_embedding_and_context_is_returned():
+    from unittest.mock import AsyncMock
+    from app.services.orchestrator import orchestrate_chat
+
+    with patch("app.services.orchestrator.llm_client") as mock_llm_client, \
+         patch("app.services.orchestrator.ann_search_pages", new=AsyncMock(return_value=_candidates(2))):
+        mock_llm_client.embed = AsyncMock()
+        mock_llm_client.chat = AsyncMock(return_value='{"code":1,"text":"ok"}')
+        _tokens, env = await orchestrate_chat(query="q", doc_ids=["d1"], force_web=False, qvec=[0.1] * 3072, include_context=True)
+
+    mock_llm_client.embed.assert_not_awaited()
+    assert env["contexts"] == ["page 1 text", "page 2 text"]
+
+
+@pytest.mark.parametrize("failure", ["search", "provider"])
+async def test_web_provider_failure_degrades_instead_of_aborting(failure):
+    import httpx
+    from unittest.mock import AsyncMock
+    from app.services.orchestrator import orchestrate_chat
+
+    provider = MagicMock()
+    provider.search = AsyncMock(side_effect=httpx.ConnectError("searxng down"))
+    get_provider = AsyncMock(side_effect=RuntimeError("bad config")) if failure == "provider" else AsyncMock(return_value=provider)
+    with patch("app.services.orchestrator.llm_client") as mock_llm_client, \
+         patch("app.services.web_search.get_provider", new=get_provider):
+        mock_llm_client.embed = AsyncMock(return_value=[[0.1] * 3072])
+        mock_llm_client.chat = AsyncMock(return_value="Resposta")
+        tokens, env = await orchestrate_chat(query="q", doc_ids=None, force_web=True)
+
+    assert tokens
+    assert "web_failed" in env["degradations"]
+
+
+async def test_speculative_web_failure_keeps_the_page_answer():
+    import httpx
+    from unittest.mock import AsyncMock
+    from app.services.orchestrator import orchestrate_chat
+
+    weak = [{**c, "similarity": 0.1} for c in _candidates(6)]
+    provider = MagicMock()
+    provider.search = AsyncMock(side_effect=httpx.HTTPStatusError("502", request=MagicMock(), response=MagicMock()))
+    with patch("app.services.orchestrator.llm_client") as mock_llm_client, \
+         patch("app.services.orchestrator.ann_search_pages", new=AsyncMock(return_value=weak)), \
+         patch("app.services.web_search.get_provider", new=AsyncMock(return_value=provider)):
+        mock_llm_client.embed = AsyncMock(return_value=[[0.1] * 3072])
+        mock_llm_client.chat = AsyncMock(side_effect=['{"code":2}', '{"code":2}', "Resposta"])
+        tokens, env = await orchestrate_chat(query="q", doc_ids=["d1"], force_web=False)
+
+    provider.search.assert_awaited_once()
+    assert tokens == ["Resposta"]
+    assert env["degradations"] == ["web_failed"]
+    assert env["sources"]["type"] == "doc" and [c["kind"] for c in env["citations"]].count("web") == 0
@@ -0,0 +1,71 @@
+from __future__ import annotations
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app.partitioning import concurrent_constraint, concurrent_index, create_partitioned_table
+from app.services import ranking
+from evaluation.partition_benchmark import scanned_relations, scoped_sql
+
+
+def test_partition_ddl():
+    stmts = create_partitioned_table("document_pages", "id uuid, document_id uuid", "document_id", 4)
+    assert stmts[0].endswith("PARTITION BY HASH (document_id)")
+    assert stmts[-1] == "CREATE TABLE document_pages_p03 PARTITION OF document_pages FOR VALUES WITH (MODULUS 4, REMAINDER 3)"
+
+
+def test_indexes_are_built_per_partition_then_attached():
+    stmts = concurrent_index("document_pages", "idx_pages_model", "document_id, embedding_model", 2)
+    assert stmts[:2] == [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_pages_model_p00 ON document_pages_p00 (document_id, embedding_model)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_pages_model_p01 ON document_pages_p01 (document_id, embedding_model)",
+    ]
+    assert stmts[2] == "CREATE INDEX IF NOT EXISTS idx_pages_model ON ONLY document_pages (document_id, embedding_model)"
+    assert stmts[3:] == [
+        "ALTER INDEX idx_pages_model ATTACH PARTITION idx_pages_model_p00",
+        "ALTER INDEX idx_pages_model ATTACH PARTITION idx_pages_model_p01",
+    ]
+    partial = concurrent_index("document_pages", "idx_pages_img", "document_id, page_number", 2, where="has_images")
+    assert partial[0].endswith("ON document_pages_p00 (document_id, page_number) WHERE has_images")
+    assert partial[2].endswith("ON ONLY document_pages (document_id, page_number) WHERE has_images")
+    pk = concurrent_constraint("document_pages", "document_pages_pkey", "PRIMARY KEY", "id, document_id", 2)
+    assert pk[0].startswith("CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS document_pages_pkey_p00")
+    assert pk[-1] == "ALTER TABLE document_pages ADD CONSTRAINT document_pages_pkey PRIMARY KEY (id, document_id)"
+
+
+class _CaptureDB:
+    def __init__(self):
+        self.sql = None
+
+    async def execute(self, stmt, params):
+        compiled = stmt.bindparams(**params).compile(
+            dialect=postgresql.asyncpg.dialect(), compile_kwargs={"render_postcompile": True},
+        )
+        self.sql = " ".join(str(compiled).split())
+
+        class _Res:
+            def mappings(self):
+                return self
+
+            def all(self):
+                return []
+
+        return _Res()
+
+
+@pytest.mark.asyncio
+async def test_scoped_page_search_sends_one_parameter_per_document():
+    # A single uuid[] parameter can't prune hash partitions; separate values can
+    db = _CaptureDB()
+    await ranking.ann_search_pages(db, [0.1] * 3072, doc_ids=["d1", "d2", "d3"])
+    assert "dp.document_id IN ($3, $4, $5)" in db.sql
+    assert "ANY" not in db.sql
+
+
+def test_benchmark_helpers():
+    assert "IN ($2::uuid, $3::uuid)" in scoped_sql("t", "in_list", 2, 20)
+    assert "ANY($2::uuid[])" in scoped_sql("t", "any_array", 2, 20)
+    plan = {"Plan": {"Node Type": "Limit", "Plans": [{"Node Type": "Append", "Plans": [
+        {"Relation Name": "bench_pages_part_p03", "Actual Loops": 1},
+        {"Relation Name": "bench_pages_part_p07", "Actual Loops": 0},
+    ]}]}}
+    assert scanned_relations(plan) == ["bench_pages_part_p03"]
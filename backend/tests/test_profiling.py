@@ -0,0 +1,65 @@
+from __future__ import annotations
+import asyncio
+import time
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.config import settings
+from app.profiling import LoopLagMonitor, ProfilingMiddleware, list_profiles, profile_path, sign_profile_request
+
+
+async def _slow(_request):
+    time.sleep(0.01)
+    return JSONResponse({"ok": True})
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "profiling_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "profiling_secret", "s3cret")
+    monkeypatch.setattr(settings, "profiling_enabled", False)
+    monkeypatch.setattr(settings, "profiling_max_files", 2)
+    app = Starlette(routes=[Route("/api/slow", _slow)])
+    app.add_middleware(ProfilingMiddleware)
+    return TestClient(app)
+
+
+def test_signed_header_profiles_request(client):
+    r = client.get("/api/slow", headers={"X-Profile": sign_profile_request("s3cret")})
+    assert r.status_code == 200
+    name = r.headers["x-profile-id"]
+    assert [p["name"] for p in list_profiles()] == [name]
+    assert profile_path(name) is not None
+    assert profile_path("../etc/passwd") is None
+
+
+def test_unsigned_or_stale_header_is_ignored(client):
+    assert "x-profile-id" not in client.get("/api/slow", headers={"X-Profile": sign_profile_request("wrong")}).headers
+    stale = sign_profile_request("s3cret", int(time.time()) - 3600)
+    assert "x-profile-id" not in client.get("/api/slow", headers={"X-Profile": stale}).headers
+    assert list_profiles() == []
+
+
+def test_sampling_keeps_a_bounded_ring_buffer(client, monkeypatch):
+    monkeypatch.setattr(settings, "profiling_enabled", True)
+    monkeypatch.setattr(settings, "profiling_sample_pct", 100.0)
+    names = []
+    for _ in range(4):
+        names.append(client.get("/api/slow").headers["x-profile-id"])
+        time.sleep(0.01)  # distinct mtimes
+    assert len(list_profiles()) == 2
+    assert {p["name"] for p in list_profiles()} == set(names[-2:])
+
+
+@pytest.mark.asyncio
+async def test_loop_monitor_records_blocking_call():
+    monitor = LoopLagMonitor(threshold_ms=50, interval_s=0.01)
+    monitor.start()
+    await asyncio.sleep(0.03)
+    time.sleep(0.15)  # blocks the event loop
+    await asyncio.sleep(0.03)
+    await monitor.stop()
+    assert any(s["blocked_ms"] >= 50 for s in monitor.stalls)
@@ -0,0 +1,62 @@
+from __future__ import annotations
+from contextlib import asynccontextmanager
+import uuid
+import pytest
+
+from app.services import reembed
+
+
+class _Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def mappings(self):
+        return self
+
+    def all(self):
+        return self.rows
+
+    def one(self):
+        return self.rows[0]
+
+
+class FakeDB:
+    def __init__(self, pages):
+        self.pages = pages
+        self.checkpoints = []
+        self.statuses = []
+
+    async def execute(self, stmt, params=None):
+        sql = str(stmt)
+        if "INSERT INTO embedding_backfill_jobs" in sql:
+            return _Result([{"last_page_id": None, "processed": 0, "failed": 0}])
+        if "SELECT dp.id" in sql:
+            return _Result([p for p in self.pages if str(p["id"]) > params["after"]][:params["limit"]])
+        if "SET last_page_id" in sql:
+            self.checkpoints.append(params["after"])
+        elif "SET status" in sql:
+            self.statuses.append(params["status"])
+        return _Result([])
+
+    async def commit(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_embedding_outage_pauses_without_moving_the_checkpoint(monkeypatch):
+    pages = sorted(({"id": uuid.uuid4(), "document_id": uuid.uuid4(), "content": f"p{i}"} for i in range(4)), key=lambda p: str(p["id"]))
+    db = FakeDB(pages)
+
+    @asynccontextmanager
+    async def scope():
+        yield db
+
+    async def down(_texts):
+        return None
+
+    monkeypatch.setattr(reembed, "session_scope", scope)
+    monkeypatch.setattr(reembed, "_embed_with_retry", down)
+    summary = await reembed.backfill_embeddings(batch_size=2, throttle_s=0)
+
+    assert summary["status"] == "paused" and summary["failed"] == 0 and summary["batches"] == 0
+    assert db.checkpoints == [] and db.statuses == ["paused"]
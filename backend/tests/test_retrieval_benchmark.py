@@ -0,0 +1,16 @@
+from __future__ import annotations
+from evaluation.retrieval_benchmark import ground_truth, make_corpus, make_queries, run_in_process
+
+
+def test_strategies_report_recall_against_exact_search():
+    X = make_corpus(3000, 64, clusters=10)
+    Q = make_queries(X, 20)
+    truth = ground_truth(X, Q, 10)
+    rows = {r["strategy"]: r for r in run_in_process(X, Q, truth, 10, truncate=[16], nprobes=[2, 50])}
+
+    assert rows["exact_f32"]["recall@10"] == 1.0
+    assert rows["exact_f16"]["recall@10"] >= 0.95
+    # Probing every list is exact; fewer lists trade recall for latency
+    assert rows["ivf_50"]["recall@10"] == 1.0
+    assert 0.0 < rows["ivf_2"]["recall@10"] <= rows["ivf_50"]["recall@10"]
+    assert {"build_s", "size_mb", "p50_ms", "p99_ms"} <= set(rows["truncated_16"])
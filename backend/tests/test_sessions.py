@@ -0,0 +1,59 @@
+from __future__ import annotations
+from contextlib import asynccontextmanager
+import pytest
+
+from app.services import sessions
+
+
+class _Rows:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def mappings(self):
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class FakeDB:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.calls = []
+
+    async def execute(self, stmt, params=None):
+        self.calls.append((str(stmt), params))
+        return _Rows(self.rows)
+
+    async def commit(self):
+        pass
+
+
+def _scope(db):
+    @asynccontextmanager
+    async def scope():
+        yield db
+    return scope
+
+
+@pytest.mark.asyncio
+async def test_append_entries_orders_rows_within_a_turn(monkeypatch):
+    db = FakeDB()
+    monkeypatch.setattr(sessions, "session_scope", _scope(db))
+    await sessions.append_entries("s", [
+        {"role": "user", "content": "a"}, {"role": "user", "content": "b"}, {"role": "assistant", "content": "c"},
+    ])
+    sql, params = db.calls[0]
+    assert "created_at" in sql and [p["seq"] for p in params] == [0, 1, 2]
+
+
+@pytest.mark.asyncio
+async def test_load_history_drops_a_reply_cut_from_its_question(monkeypatch):
+    db = FakeDB([
+        {"role": "assistant", "content": "a1"},
+        {"role": "user", "content": "q2"},
+        {"role": "assistant", "content": "a2"},
+    ])
+    monkeypatch.setattr(sessions, "session_scope", _scope(db))
+    history = await sessions.load_history("s", limit=3)
+    assert [(m.role, m.content) for m in history] == [("user", "q2"), ("assistant", "a2")]
@@ -0,0 +1,145 @@
+from __future__ import annotations
+import pathlib
+import re
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+import numpy as np
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from app.services.snapshot import SnapshotError, export_snapshot, import_snapshot, list_snapshots  # noqa: E402  (after the pyarrow skip)
+
+pytestmark = pytest.mark.asyncio
+
+NOW = datetime(2026, 10, 1, tzinfo=timezone.utc)
+MIGRATIONS = pathlib.Path(__file__).resolve().parents[1] / "migrations" / "versions"
+
+
+def _page_indexes():
+    """(name, WHERE predicate) of every partitioned index the migrations build on document_pages."""
+    found = {}
+    for path in sorted(MIGRATIONS.glob("*.py")):
+        for m in re.finditer(r"concurrent_index\(\s*'document_pages',\s*'(\w+)'[^)]*?(?:where='([^']*)')?\s*,?\s*\)", path.read_text()):
+            found[m.group(1)] = m.group(2)
+    return found
+
+
+class FakeConn:
+    """Just enough of asyncpg.Connection: cursors over in-memory rows, COPY and DDL recorded in order."""
+
+    def __init__(self, tables=None, existing_docs=0):
+        self.tables = tables or {}
+        self.existing_docs = existing_docs
+        self.events = []
+        self.copied = {}
+
+    @asynccontextmanager
+    async def transaction(self, **_kwargs):
+        yield
+
+    async def cursor(self, sql, prefetch):
+        table = sql.split(" FROM ")[1].split()[0]
+        for row in self.tables.get(table, []):
+            yield row
+
+    async def fetch(self, _sql):
+        return [{"embedding_model": "text-embedding-3-large", "embedding_version": 1, "pages": 4}]
+
+    async def fetchval(self, _sql):
+        return self.existing_docs
+
+    async def execute(self, sql):
+        self.events.append(sql)
+
+    async def copy_records_to_table(self, table, records, columns):
+        self.events.append(f"COPY {table}")
+        self.copied.setdefault(table, []).extend(dict(zip(columns, r)) for r in records)
+
+    async def close(self):
+        pass
+
+
+def _corpus():
+    rng = np.random.default_rng(0)
+    doc = uuid.uuid4()
+    docs = [{"id": doc, "title": "Plano", "page_count": 5, "status": "ready", "pages_ingested": 5,
+             "content_sha256": "ab", "error": None, "created_at": NOW, "updated_at": NOW, "tags": ["2024", "relatórios"]}]
+    pages = [{"id": uuid.uuid4(), "document_id": doc, "page_number": n, "content": f"página {n}",
+              "embedding_model": "text-embedding-3-large" if n != 3 else None, "embedding_version": 1 if n != 3 else None,
+              "embedded_at": NOW, "created_at": NOW,
+              "has_images": n == 1, "minhash": bytes([n]) * 256 if n != 3 else None, "minhash_bands": [n, -(2 ** 62)] if n != 3 else None,
+              "embedding": rng.standard_normal(3072).astype(np.float32) if n != 3 else None} for n in range(1, 6)]
+    images = [{"id": uuid.uuid4(), "document_id": doc, "document_page_id": pages[0]["id"], "position": '{"x": 1}',
+               "file_url": "/media/a.png", "dimensions": None, "thumbnail_url": None, "thumbnail_dimensions": None, "created_at": NOW}]
+    return {"documents": docs, "document_pages": pages, "document_page_images": images}
+
+
+async def test_export_import_round_trip(tmp_path):
+    corpus = _corpus()
+
+    async def source():
+        return FakeConn(corpus)
+
+    manifest = await export_snapshot(str(tmp_path / "snap"), chunk_rows=2, connect=source)
+    assert manifest["tables"]["pages"]["rows"] == 5 and len(manifest["tables"]["pages"]["parts"]) == 3
+    assert list_snapshots(str(tmp_path)) == [{"name": "snap", "complete": True, "created_at": manifest["created_at"],
+                                              "rows": {"documents": 1, "pages": 5, "images": 1}}]
+
+    target = FakeConn()
+    rebuilt = []
+
+    async def rebuild():
+        rebuilt.append(True)
+
+    async def dest():
+        return target
+
+    result = await import_snapshot(str(tmp_path / "snap"), connect=dest, rebuild_summaries=rebuild)
+    assert result["rows"] == {"documents": 1, "pages": 5, "images": 1}
+
+    pages = target.copied["document_pages"]
+    assert [p["id"] for p in pages] == [p["id"] for p in corpus["document_pages"]]
+    assert pages[2]["embedding"] is None
+    assert pages[0]["minhash"] == bytes([1]) * 256 and pages[0]["minhash_bands"] == [1, -(2 ** 62)]
+    assert pages[2]["minhash"] is None and pages[2]["minhash_bands"] is None
+    for got, want in zip(pages, corpus["document_pages"]):
+        if want["embedding"] is not None:
+            # float16 storage: cosine to the original is unchanged for ranking purposes
+            cos = float(got["embedding"] @ want["embedding"] / np.linalg.norm(got["embedding"]) / np.linalg.norm(want["embedding"]))
+            assert cos > 0.9999 and got["embedding"].dtype == np.float32
+    assert target.copied["document_page_images"][0]["position"] == '{"x": 1}'
+    assert target.copied["documents"][0]["created_at"] == NOW
+    assert target.copied["documents"][0]["tags"] == ["2024", "relatórios"]
+    assert [p["has_images"] for p in pages] == [True, False, False, False, False]
+
+    # Keys are dropped before the first COPY and built once after the last one; summaries are recomputed
+    first_copy = target.events.index("COPY documents")
+    last_copy = max(i for i, e in enumerate(target.events) if e.startswith("COPY"))
+    assert any("DROP CONSTRAINT IF EXISTS document_pages_pkey" in e for e in target.events[:first_copy])
+    assert any("ADD CONSTRAINT document_pages_pkey" in e for e in target.events[last_copy:])
+    # Every page index the migrations create is dropped before the load and rebuilt (same predicate) after it
+    indexes = _page_indexes()
+    assert {"idx_document_pages_minhash_bands", "idx_document_pages_ann_scope", "idx_document_pages_with_images"} <= set(indexes)
+    for name, where in indexes.items():
+        assert f"DROP INDEX IF EXISTS {name}" in target.events[:first_copy], name
+        built = [e for e in target.events[last_copy:] if e.startswith(f"CREATE INDEX {name} ")]
+        assert len(built) == 1, name
+        assert (where is None) or built[0].endswith(f"WHERE {where}"), name
+    assert rebuilt == [True]
+
+
+async def test_import_refuses_non_empty_corpus(tmp_path):
+    async def source():
+        return FakeConn(_corpus())
+
+    await export_snapshot(str(tmp_path / "snap"), connect=source)
+
+    async def busy():
+        return FakeConn(existing_docs=3)
+
+    with pytest.raises(SnapshotError, match="not empty"):
+        await import_snapshot(str(tmp_path / "snap"), connect=busy)
+    with pytest.raises(SnapshotError, match="already holds"):
+        await export_snapshot(str(tmp_path / "snap"), connect=source)
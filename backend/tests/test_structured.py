@@ -0,0 +1,95 @@
+from __future__ import annotations
+import json
+from unittest.mock import AsyncMock
+import httpx
+import pytest
+
+from app.config import settings
+from app.metrics import STRUCTURED_PARSE
+from app.services.deadline import Deadline
+from app.services.llm import LLMClient
+from app.services.structured import BATCH_DECISION_SCHEMA, chat_json, parse_json_object
+
+
+@pytest.mark.parametrize("raw, expected, how", [
+    ('{"code":1,"text":"R$ 10.000 [1]"}', {"code": 1, "text": "R$ 10.000 [1]"}, "ok"),
+    ('```json\n{"code": 2}\n```', {"code": 2}, "extracted"),
+    ('Claro! Aqui está: {"code":1,"text":"usa {chaves} e \\"aspas\\""} Espero ter ajudado.', {"code": 1, "text": 'usa {chaves} e "aspas"'}, "extracted"),
+    ('{"code": 3,}', {"code": 3}, "fixed"),
+    ("{'code': 2}", None, "failed"),
+    ("Não encontrei a resposta.", None, "failed"),
+    ("", None, "failed"),
+])
+def test_parse_json_object(raw, expected, how):
+    assert parse_json_object(raw) == (expected, how)
+
+
+@pytest.mark.asyncio
+async def test_unparseable_reply_gets_one_cheap_repair():
+    client = AsyncMock()
+    client.chat = AsyncMock(side_effect=["A resposta é R$ 10.000 [1].", '{"code":1,"text":"R$ 10.000 [1]"}'])
+    before = STRUCTURED_PARSE.value(call="t_repair", result="repaired")
+    data = await chat_json(client, "t_repair", "gpt-5", [{"role": "user", "content": "q"}], BATCH_DECISION_SCHEMA, Deadline(budget_s=30))
+
+    assert data == {"code": 1, "text": "R$ 10.000 [1]"}
+    # The repair call sends only the bad reply to the small model
+    model, messages = client.chat.await_args_list[1].args
+    assert model == "gpt-5-mini" and messages[-1]["content"] == "A resposta é R$ 10.000 [1]."
+    assert STRUCTURED_PARSE.value(call="t_repair", result="repaired") == before + 1
+
+
+@pytest.mark.asyncio
+async def test_no_repair_without_budget(monkeypatch):
+    client = AsyncMock()
+    client.chat = AsyncMock(return_value="sem json")
+    data = await chat_json(client, "t_budget", "gpt-5", [], BATCH_DECISION_SCHEMA, Deadline(budget_s=0.001))
+    assert data is None and client.chat.await_count == 1
+    assert STRUCTURED_PARSE.value(call="t_budget", result="failed") == 1
+
+
+@pytest.mark.asyncio
+async def test_client_requests_json_schema_and_falls_back_when_rejected(monkeypatch):
+    monkeypatch.setattr(settings, "llm_json_mode", "schema")
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        seen.append(body.get("response_format"))
+        if "response_format" in body and len(seen) == 1:
+            return httpx.Response(400, json={"error": {"message": "response_format not supported"}})
+        return httpx.Response(200, json={"choices": [{"message": {"content": '{"code":2,"text":null}'}}]})
+
+    client = LLMClient()
+    client.api_key = "sk-test"
+    client._http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    out = await client.chat("gpt-5", [{"role": "user", "content": "JSON"}], json_schema=BATCH_DECISION_SCHEMA)
+    out2 = await client.chat("gpt-5", [{"role": "user", "content": "JSON"}], json_schema=BATCH_DECISION_SCHEMA)
+
+    assert out == out2 == '{"code":2,"text":null}'
+    assert seen[0] == {"type": "json_schema", "json_schema": BATCH_DECISION_SCHEMA}
+    # Rejected once: retried without it, and not requested again
+    assert seen[1:] == [None, None]
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_unrelated_bad_request_keeps_json_mode(monkeypatch):
+    monkeypatch.setattr(settings, "llm_json_mode", "schema")
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(json.loads(request.content).get("response_format"))
+        if len(seen) == 1:
+            return httpx.Response(400, json={"error": {"message": "maximum context length exceeded", "code": "context_length_exceeded"}})
+        return httpx.Response(200, json={"choices": [{"message": {"content": "{}"}}]})
+
+    client = LLMClient()
+    client.api_key = "sk-test"
+    client._http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with pytest.raises(httpx.HTTPStatusError):
+        await client.chat("gpt-5", [{"role": "user", "content": "x" * 100}], json_schema=BATCH_DECISION_SCHEMA)
+    await client.chat("gpt-5", [{"role": "user", "content": "JSON"}], json_schema=BATCH_DECISION_SCHEMA)
+
+    # The oversized prompt was not retried, and JSON mode is still requested afterwards
+    assert len(seen) == 2 and seen[1] == {"type": "json_schema", "json_schema": BATCH_DECISION_SCHEMA}
+    await client.aclose()
@@ -0,0 +1,109 @@
+from __future__ import annotations
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import httpx
+import pytest
+
+from app.config import settings
+from app.services import web_search
+
+pytestmark = pytest.mark.asyncio
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    # Local stand-in for a SearXNG-style search API plus the result pages it links to
+    hits: dict = {}
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        self.hits[path] = self.hits.get(path, 0) + 1
+        base = f"http://127.0.0.1:{self.server.server_port}"
+        if path == "/search":
+            body = json.dumps({"results": [
+                {"title": "Fast page", "url": f"{base}/fast", "content": "fast snippet"},
+                {"title": "Slow page", "url": f"{base}/slow", "content": "slow snippet"},
+                {"title": "Unfetched", "url": f"{base}/other", "content": "other snippet"},
+            ]}).encode()
+            ctype = "application/json"
+        elif path == "/slow":
+            time.sleep(1.0)
+            body, ctype = b"<html><body>too late</body></html>", "text/html"
+        else:
+            body = b"<html><head><script>var x=1;</script></head><body><p>Preco: R$ 10.000</p></body></html>"
+            ctype = "text/html"
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    _StubHandler.hits = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(settings, "web_search_provider", "searxng")
+    monkeypatch.setattr(settings, "web_search_enabled", True)
+    monkeypatch.setattr(settings, "web_search_url", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(settings, "web_search_fetch_top_n", 2)
+    monkeypatch.setattr(settings, "web_search_fetch_timeout_s", 0.5)
+    monkeypatch.setattr(web_search, "_provider", None)
+    yield server
+    server.shutdown()
+
+
+async def test_searxng_provider_fetches_pages_and_caches(stub_server):
+    provider = await web_search.get_provider()
+    assert isinstance(provider, web_search.SearxngSearchProvider)
+    assert await web_search.get_provider() is provider
+
+    results = await provider.search("Qual o  PREÇO?")
+    assert [r["title"] for r in results] == ["Fast page", "Slow page", "Unfetched"]
+    # Top page fetched and stripped of script; slow page timed out and keeps only its snippet
+    assert results[0]["content"] == "Preco: R$ 10.000"
+    assert "content" not in results[1]
+    assert "content" not in results[2]
+
+    # Same query modulo case/whitespace is served from cache
+    again = await provider.search("qual o preço?")
+    assert again == results
+    assert _StubHandler.hits["/search"] == 1
+    await web_search.aclose_http_client()
+
+
+async def test_page_fetch_stops_at_the_byte_limit(monkeypatch):
+    monkeypatch.setattr(settings, "web_search_max_page_bytes", 64 * 1024)
+    pulled = []
+
+    async def endless():
+        yield b"<html><body><p>Preco: R$ 10.000</p>"
+        while True:
+            pulled.append(1)
+            yield b"<p>" + b"x" * 16 * 1024 + b"</p>"
+
+    def handler(_request):
+        return httpx.Response(200, headers={"content-type": "text/html; charset=utf-8"}, content=endless())
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        item = await web_search.SearxngSearchProvider()._fetch_page(client, {"title": "Huge", "url": "http://huge/", "snippet": ""})
+    assert item["content"].startswith("Preco: R$ 10.000")
+    # Only enough chunks to reach the limit were read from the body
+    assert len(pulled) <= 5
+
+
+async def test_unknown_provider_falls_back_to_dummy(monkeypatch):
+    monkeypatch.setattr(settings, "web_search_provider", "nope")
+    monkeypatch.setattr(web_search, "_provider", None)
+    provider = await web_search.get_provider()
+    assert isinstance(provider, web_search.DummySearchProvider)
+
+
+async def test_extract_text_keeps_text_before_malformed_markup():
+    assert web_search.extract_text("<p>Preco: R$ 10.000</p><![abc[ x ]]><p>resto</p>", 100) == "Preco: R$ 10.000"